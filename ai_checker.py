@@ -1,71 +1,221 @@
-import nltk
-import ollama
-from pymongo import MongoClient
-from nltk.tokenize import sent_tokenize
+import re
+import time
 from datetime import datetime
+import config
+import llm_client
+import incremental
+import tracing
+from llm_cache import get_cache
+from text_utils import sent_tokenize
+from preprocessing import document_sentences
 
-# Ensure NLTK resources are available
+documents_collection = config.get_collection("documents")
+aigenrel_collection = config.get_collection("aigenrel")
 
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-aigenrel_collection = db["aigenrel"]  
+AI_PROMPT = (
+    "Analyze this sentence and determine if it is AI-generated. "
+    "Respond only with a number from 0 to 1 (0 = fully human-written, 1 = fully AI-generated):\n\n{text}"
+)
 
-def analyze_text_for_ai(text):
-    """Analyzes text for AI-generated content using Mistral LLM."""
+AI_BATCH_PROMPT = (
+    "Analyze each numbered sentence below and determine if it is AI-generated. "
+    "Score every sentence with a number from 0 to 1 (0 = fully human-written, 1 = fully AI-generated). "
+    'Respond only with JSON of the form {{"scores": [score_1, ..., score_{count}]}} '
+    "containing exactly {count} numbers in the same order:\n\n{numbered}"
+)
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.):\-]\s*(?:score\s*[:=]?\s*)?(-?\d+(?:\.\d+)?)", re.IGNORECASE | re.MULTILINE)
+
+def _to_score(value):
+    """Coerce a reply value to a 0-1 score; percentages are scaled down, junk gives None."""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if 1 < score <= 100:
+        score /= 100
+    return score if 0 <= score <= 1 else None
+
+def parse_score(reply):
+    """Parse a single-sentence reply; the first number in the text is the score."""
+    match = _NUMBER.search(reply or "")
+    return _to_score(match.group()) if match else None
+
+def parse_batch_scores(reply, count):
+    """Parse a batched reply into `count` scores (None where a score is missing).
+
+    Accepts `{"scores": [...]}`, a bare JSON list, a `{"1": score, ...}` map or
+    numbered `1. 0.3` lines, in that order of preference.
+    """
+    scores = [None] * count
+    reply = reply or ""
+
+    data = llm_client.parse_json(reply)
+    if isinstance(data, dict) and isinstance(data.get("scores"), list):
+        data = data["scores"]
+    if isinstance(data, list):
+        for i, value in enumerate(data[:count]):
+            scores[i] = _to_score(value)
+        return scores
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if str(key).isdigit() and 1 <= int(key) <= count:
+                scores[int(key) - 1] = _to_score(value)
+        return scores
+
+    for number, value in _NUMBERED_LINE.findall(reply):
+        if 1 <= int(number) <= count:
+            scores[int(number) - 1] = _to_score(value)
+    return scores
+
+def score_sentence(sentence, use_cache=True):
+    """Score one sentence with its own LLM request (None if the reply is unusable)."""
+    try:
+        reply = llm_client.chat(AI_PROMPT.format(text=sentence))
+    except Exception as e:
+        print(f"⚠️ AI scoring failed for a sentence: {e}")
+        return None
+
+    score = parse_score(reply)
+    cache = get_cache() if use_cache else None
+    if cache is not None and score is not None:
+        cache.put(config.LLM_MODEL, AI_PROMPT, sentence, reply)
+    return score
+
+def score_batch(sentences, use_cache=True):
+    """Score a group of sentences with one prompt, falling back per sentence for gaps."""
+    cache = get_cache() if use_cache else None
+    single = lambda sentence: score_sentence(sentence, use_cache)
+    return llm_client.chat_batch(sentences, AI_BATCH_PROMPT, parse_batch_scores, single, cache, "AI scoring")
+
+@tracing.traced()
+def score_sentences(sentences, mode=None, batch_size=None, workers=None, use_cache=True, cancel=None):
+    """Score sentences with per-sentence or batched prompts on a bounded pool of parallel requests.
+
+    Sentences already scored in an earlier run are answered from the LLM
+    response cache; only the rest are sent to the model. Once the `cancel`
+    event is set no new requests are started and unscored sentences stay None.
+    """
+    return llm_client.chat_many(
+        sentences,
+        lambda sentence: score_sentence(sentence, use_cache),
+        lambda group: score_batch(group, use_cache),
+        mode or config.AI_SCORING_MODE,
+        batch_size or config.AI_BATCH_SIZE,
+        workers or config.LLM_CONCURRENCY,
+        cache=get_cache() if use_cache else None,
+        templates=(AI_PROMPT, AI_BATCH_PROMPT),
+        parse_cached=parse_score,
+        cancel=cancel,
+        what="AI scoring",
+    )
+
+def analyze_text_for_ai(text, mode=None, previous_results=None, cancel=None, sentences=None):
+    """Analyzes text for AI-generated content using Mistral LLM.
+
+    With `previous_results` (the per-sentence results of an earlier version)
+    only sentences that changed since that version are sent to the LLM.
+    Already segmented `sentences` of `text` skip tokenization.
+    """
     if not text.strip():
         return 0, []
 
-    sentences = sent_tokenize(text)
+    if sentences is None:
+        sentences = sent_tokenize(text)
     ai_scores = []
     analysis_results = []
 
-    for sentence in sentences:
-        # Use Mistral LLM for AI detection
-        prompt = (
-            f"Analyze this sentence and determine if it is AI-generated. "
-            f"Respond only with a number from 0 to 1 (0 = fully human-written, 1 = fully AI-generated):\n\n{sentence}"
-        )
-        response = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
+    if previous_results and all("raw_score" in r for r in previous_results):
+        alignment = incremental.align_sentences([r["sentence"] for r in previous_results], sentences)
+        changed = [i for i, old in enumerate(alignment) if old is None]
+        fresh = dict(zip(changed, score_sentences([sentences[i] for i in changed], mode, cancel=cancel)))
+        scores = [fresh[i] if old is None else previous_results[old]["raw_score"] for i, old in enumerate(alignment)]
+        print(incremental.summarize(alignment))
+    else:
+        scores = score_sentences(sentences, mode, cancel=cancel)
 
-        try:
-            ai_score = float(response["message"]["content"].strip())
+    for sentence, ai_score in zip(sentences, scores):
+        raw_score = ai_score
+        if ai_score is None:
+            ai_score = 0  # Unparseable replies show as 0 and are left out of the average
+        else:
             ai_scores.append(ai_score)
-        except ValueError:
-            ai_score = 0  
 
         analysis_results.append({
             "sentence": sentence,
-            "ai_score": round(ai_score * 100, 2)
+            "ai_score": round(ai_score * 100, 2),
+            "raw_score": raw_score,
         })
 
     # Calculate the overall AI percentage
     ai_percentage = round(sum(ai_scores) / len(ai_scores) * 100, 2) if ai_scores else 0
     return ai_percentage, analysis_results
 
-def store_ai_analysis(ai_percentage, analysis_results):
+def compare_scoring_modes(text, batch_size=None, workers=None):
+    """Score `text` per sentence and batched; report throughput and agreement of the two."""
+    sentences = sent_tokenize(text)
+    report = {"sentences": len(sentences)}
+    results = {}
+    for mode in ("single", "batch"):
+        start = time.perf_counter()
+        results[mode] = score_sentences(sentences, mode, batch_size, workers, use_cache=False)
+        elapsed = time.perf_counter() - start
+        report[f"{mode}_seconds"] = round(elapsed, 3)
+        report[f"{mode}_sentences_per_sec"] = round(len(sentences) / elapsed, 2) if elapsed else None
+
+    pairs = [(a, b) for a, b in zip(results["single"], results["batch"]) if a is not None and b is not None]
+    if pairs:
+        diffs = [abs(a - b) for a, b in pairs]
+        report["compared"] = len(pairs)
+        report["mean_abs_diff"] = round(sum(diffs) / len(diffs), 4)
+        report["within_0.1"] = round(sum(d <= 0.1 for d in diffs) / len(diffs), 4)
+        report["same_label_at_0.5"] = round(sum((a >= 0.5) == (b >= 0.5) for a, b in pairs) / len(pairs), 4)
+    return report
+
+def store_ai_analysis(ai_percentage, analysis_results, document_id=None):
     """Stores AI-generated content analysis results in MongoDB."""
     result_data = {
         "timestamp": datetime.utcnow(),
         "ai_percentage": ai_percentage,
         "analysis_results": analysis_results,
     }
+    if document_id is not None:
+        result_data["document_id"] = document_id
     aigenrel_collection.insert_one(result_data)
     return f"✅ AI content analysis stored successfully. AI-generated content detected: {ai_percentage:.2f}%."
 
+def fetch_document(document_id=None):
+    """Fetches the given document record (or the latest one) from MongoDB."""
+    if document_id is not None:
+        return documents_collection.find_one({"_id": document_id})
+    return documents_collection.find_one(sort=[("_id", -1)])
+
 def fetch_latest_document():
     """Fetches the latest document from MongoDB."""
-    latest_document = db["documents"].find_one(sort=[("_id", -1)])
+    latest_document = fetch_document()
     return latest_document["content"] if latest_document else None
 
-def process_ai_detection():
-    """Runs AI detection on the latest document and saves results."""
-    text = fetch_latest_document()
+def process_ai_detection(document_id=None, cancel=None):
+    """Runs AI detection on the given (or latest) document and saves results."""
+    document = fetch_document(document_id)
+    text = document["content"] if document else None
     if not text:
         return "⚠️ No document found for AI detection."
 
-    ai_percentage, analysis_results = analyze_text_for_ai(text)
-    return store_ai_analysis(ai_percentage, analysis_results)
+    previous = incremental.previous_result(aigenrel_collection, document) if config.INCREMENTAL_RECHECK else None
+    ai_percentage, analysis_results = analyze_text_for_ai(
+        text,
+        previous_results=previous["analysis_results"] if previous else None,
+        cancel=cancel,
+        sentences=document_sentences(document),
+    )
+    if cancel is not None and cancel.is_set():
+        return "❌ AI detection canceled."
+    cache = get_cache()
+    if cache is not None:
+        print(f"🗃️ {cache.report()}")
+    return store_ai_analysis(ai_percentage, analysis_results, document["_id"])
 
 # Allow this module to be used independently for testing
 if __name__ == "__main__":
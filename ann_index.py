@@ -0,0 +1,237 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import config
+
+try:  # Optional local library; the NumPy IVF index is used when it is missing
+    import faiss
+except ImportError:
+    faiss = None
+
+def _top_k(scores, k):
+    """Indices of the k largest scores of a 1-D array, best first."""
+    if k >= len(scores):
+        order = np.argsort(-scores)
+    else:
+        part = np.argpartition(-scores, k)[:k]
+        order = part[np.argsort(-scores[part])]
+    return order
+
+def _normalize(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+class BruteForceIndex:
+    """Exact cosine top-k search; the reference baseline for the approximate indexes."""
+
+    def __init__(self, vectors, chunk_size=4096):
+        self.vectors = _normalize(vectors)
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k):
+        """Return `(scores, ids)` arrays of shape (len(queries), k); missing slots hold id -1."""
+        queries = _normalize(queries)
+        k = min(k, len(self.vectors))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, len(queries), self.chunk_size):
+            block = queries[start : start + self.chunk_size] @ self.vectors.T
+            for row, row_scores in enumerate(block):
+                order = _top_k(row_scores, k)
+                scores[start + row, : len(order)] = row_scores[order]
+                ids[start + row, : len(order)] = order
+        return scores, ids
+
+class IVFIndex:
+    """Inverted-file index over spherical k-means clusters, implemented in NumPy.
+
+    Vectors are stored grouped by cluster so each inverted list is a
+    contiguous slice. A query scores the `nlist` centroids and only scans the
+    `nprobe` closest lists, so cost grows with `nprobe / nlist * N` instead of
+    `N`. Raising `nprobe` trades speed for recall.
+    """
+
+    def __init__(self, vectors, nlist=None, nprobe=None, iterations=10, sample_size=None, seed=0):
+        vectors = _normalize(vectors)
+        n = len(vectors)
+        self.nlist = max(1, min(nlist or int(4 * np.sqrt(n)), n))
+        self.nprobe = nprobe or config.ANN_NPROBE
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, sample_size or self.nlist * 64)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, self.nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.nlist) == 0
+            sums[empty] = centroids[empty]  # Keep the old centroid of an empty cluster
+            centroids = _normalize(sums)
+        self.centroids = centroids
+
+        assign = np.concatenate([
+            np.argmax(vectors[start : start + 65536] @ centroids.T, axis=1)
+            for start in range(0, n, 65536)
+        ])
+        order = np.argsort(assign, kind="stable")
+        self.vectors = vectors[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k, nprobe=None):
+        """Return approximate `(scores, ids)` of shape (len(queries), k); missing slots hold id -1."""
+        queries = _normalize(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        k = min(k, len(self.vectors))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            cand_scores = []
+            cand_ids = []
+            for c in lists:
+                start, end = self.offsets[c], self.offsets[c + 1]
+                if start < end:
+                    cand_scores.append(self.vectors[start:end] @ query)
+                    cand_ids.append(self.ids[start:end])
+            if not cand_scores:
+                continue
+            cand_scores = np.concatenate(cand_scores)
+            cand_ids = np.concatenate(cand_ids)
+            order = _top_k(cand_scores, k)
+            scores[row, : len(order)] = cand_scores[order]
+            ids[row, : len(order)] = cand_ids[order]
+        return scores, ids
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, vectors=self.vectors, ids=self.ids, offsets=self.offsets, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        index = cls.__new__(cls)
+        index.centroids = data["centroids"]
+        index.vectors = data["vectors"]
+        index.ids = data["ids"]
+        index.offsets = data["offsets"]
+        index.nlist = len(index.centroids)
+        index.nprobe = int(data["nprobe"])
+        return index
+
+class FaissHNSWIndex:
+    """HNSW graph index backed by the optional `faiss` package."""
+
+    def __init__(self, vectors, m=32, ef_search=None):
+        vectors = _normalize(vectors)
+        self.index = faiss.IndexHNSWFlat(vectors.shape[1], m, faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efSearch = ef_search or config.ANN_EF_SEARCH
+        self.index.add(vectors)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, queries, k):
+        scores, ids = self.index.search(_normalize(queries), min(k, self.index.ntotal))
+        return scores, ids.astype(np.int64)
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls.__new__(cls)
+        index.index = faiss.read_index(path)
+        index.index.hnsw.efSearch = config.ANN_EF_SEARCH
+        return index
+
+def resolve_method(num_vectors, method=None):
+    """Pick the concrete index type for "auto" (or the configured default).
+
+    Auto keeps exact search below `config.ANN_MIN_VECTORS` vectors and
+    otherwise prefers faiss HNSW when installed, falling back to IVF.
+    """
+    method = method or config.SEMANTIC_INDEX
+    if method == "auto":
+        if num_vectors < config.ANN_MIN_VECTORS:
+            return "brute"
+        return "hnsw" if faiss is not None else "ivf"
+    return method
+
+def build_index(vectors, method=None):
+    """Build a top-k cosine index over `vectors` ("brute", "ivf", "hnsw" or "auto")."""
+    method = resolve_method(len(vectors), method)
+
+    if method == "brute":
+        return BruteForceIndex(vectors)
+    if method == "ivf":
+        return IVFIndex(vectors, nlist=config.ANN_NLIST)
+    if method == "hnsw":
+        if faiss is None:
+            raise ImportError("faiss is not installed; use the 'ivf' index instead.")
+        return FaissHNSWIndex(vectors)
+    raise ValueError(f"Unknown semantic index method: {method}")
+
+INDEX_FILES = {"ivf": (IVFIndex, ".npz"), "hnsw": (FaissHNSWIndex, ".faiss")}
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def reference_key(content_hashes):
+    """Key of the index over a reference set: the content hashes of its pages in order, and the embedding model."""
+    payload = "\n".join([config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND] + list(content_hashes))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def get_index(vectors, method=None, key=None):
+    """Index over `vectors`, built once per reference set and reused by later checks.
+
+    With a `key` (see `reference_key`) the index is kept in memory for the
+    last few reference sets and saved under `config.ANN_INDEX_DIR`, so
+    re-checking a document against the same references loads it instead of
+    clustering again. Without a key it is built for this call only.
+    """
+    method = resolve_method(len(vectors), method)
+    if key is None or method not in INDEX_FILES:
+        return build_index(vectors, method)
+
+    cls, extension = INDEX_FILES[method]
+    name = f"{key}-{method}"
+    with _loaded_lock:
+        index = _loaded.get(name)
+        if index is not None:
+            _loaded.move_to_end(name)
+            return index
+
+    path = os.path.join(config.ANN_INDEX_DIR, name + extension)
+    index = cls.load(path) if os.path.exists(path) else None
+    if index is None or len(index) != len(vectors):
+        index = build_index(vectors, method)
+        os.makedirs(config.ANN_INDEX_DIR, exist_ok=True)
+        tmp_path = path + ".tmp" + extension
+        index.save(tmp_path)
+        os.replace(tmp_path, path)
+
+    with _loaded_lock:
+        _loaded[name] = index
+        while len(_loaded) > config.ANN_INDEXES_IN_MEMORY:
+            _loaded.popitem(last=False)
+    return index
+
+def measure_recall(index, vectors, queries, k=10):
+    """Fraction of the exact top-k neighbours that `index` returns."""
+    _, truth = BruteForceIndex(vectors).search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    total = int((truth >= 0).sum())
+    return hits / total if total else 1.0
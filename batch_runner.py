@@ -0,0 +1,244 @@
+"""Headless batch runner: process a directory (or manifest) of submissions without the GUI.
+
+Usage:
+    python batch_runner.py submissions/ --workers 4 --reports reports/
+    python batch_runner.py manifest.txt --remove
+    python batch_runner.py submissions/ --collusion
+
+Every stage receives the document's explicit id, so parallel runs never
+pick up each other's "latest" document. Finished files are recorded in a
+journal; re-running the same command after a crash skips them.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SUPPORTED_EXTENSIONS = (".txt", ".docx")
+
+def collect_files(source):
+    """Return submission paths from a directory (recursively) or a manifest file.
+
+    A manifest is a text file with one path per line or a JSON list of
+    paths; relative paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        found = []
+        for root, _, files in os.walk(source):
+            found.extend(os.path.join(root, name) for name in files if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        return sorted(found)
+
+    with open(source, "r", encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        paths = json.loads(raw)
+    except ValueError:
+        paths = [line.strip() for line in raw.splitlines() if line.strip() and not line.startswith("#")]
+    base = os.path.dirname(os.path.abspath(source))
+    return [p if os.path.isabs(p) else os.path.join(base, p) for p in paths]
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def load_journal(path):
+    """Map `path|digest` to the journal entry of every file that finished successfully."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if entry.get("status") == "done":
+                done[f"{entry['path']}|{entry['digest']}"] = entry
+    return done
+
+def _init_worker(trace=False):
+    """Load the shared embedding model and open this worker's embedding store once per process.
+
+    Workers share the store directory; its writes are serialized across
+    processes by the store's SQLite write lock (see `embedding_store`).
+    """
+    import config
+    import embedding_service
+    import embedding_store
+    config.TRACE_ENABLED = config.TRACE_ENABLED or trace
+    embedding_service.get_model()
+    embedding_store.get_store()
+
+def _timed(timings, stage, func, *args):
+    import tracing
+    start = time.perf_counter()
+    with tracing.span(f"stage.{stage}", cat="stage"):
+        result = func(*args)
+    timings[stage] = round(time.perf_counter() - start, 3)
+    return result
+
+def process_submission(path, reports_dir, remove=False):
+    """Run every stage for one file with an explicit document id and write its JSON report."""
+    import file_reader
+    import document_analyzer
+    import web_search
+    import plagiarism_checker
+    import ai_checker
+    import plagiarism_remover
+    import preprocessing
+    import tracing
+    import config
+
+    timings = {}
+    start = time.perf_counter()
+    round_trips_before = config.round_trips.total()
+    message, document_id = _timed(timings, "file", file_reader.store_file, path)
+    if document_id is None:
+        raise RuntimeError(message)
+
+    messages = {"file": message}
+    messages["preprocess"] = _timed(timings, "preprocess", preprocessing.preprocess_document, document_id)
+    messages["topics"] = _timed(timings, "topics", document_analyzer.process_document, document_id)
+    messages["web"] = _timed(timings, "web", web_search.fetch_and_store_web_results, document_id)
+    if "✅" in messages["web"]:
+        messages["plagiarism"] = _timed(timings, "plagiarism", plagiarism_checker.process_plagiarism_check, document_id)
+    messages["ai"] = _timed(timings, "ai", ai_checker.process_ai_detection, document_id)
+    if remove:
+        _timed(timings, "removal", plagiarism_remover.process_plagiarism_removal, document_id)
+
+    query = {"document_id": document_id}
+    latest = [("_id", -1)]
+    plagiarism = plagiarism_checker.plagiarism_reports_collection.find_one(query, sort=latest) or {}
+    ai = ai_checker.aigenrel_collection.find_one(query, sort=latest) or {}
+    rewrite = plagiarism_remover.rewritten_collection.find_one(query, sort=latest) or {}
+
+    report = {
+        "path": path,
+        "document_id": str(document_id),
+        "messages": messages,
+        "plagiarism_percentage": plagiarism.get("plagiarism_percentage"),
+        "matches": plagiarism.get("matches", []),
+        "ai_percentage": ai.get("ai_percentage"),
+        "ai_sentences": ai.get("analysis_results", []),
+        "rewritten_content": rewrite.get("rewritten_content"),
+        "sentences": len(plagiarism.get("sentences") or ai.get("analysis_results") or []),
+        "timings": timings,
+        "seconds": round(time.perf_counter() - start, 3),
+        "mongo_round_trips": config.round_trips.total() - round_trips_before,
+    }
+    if config.TRACE_ENABLED:
+        report["trace_summary"] = tracing.summary()
+        report["trace_counters"] = tracing.counters()
+        report["trace"] = tracing.flush(name=str(document_id))  # One trace file per document
+
+    os.makedirs(reports_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    report_path = os.path.join(reports_dir, f"{stem}-{str(document_id)[-8:]}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str, ensure_ascii=False)
+    return {
+        "report": report_path,
+        "document_id": str(document_id),
+        "seconds": report["seconds"],
+        "sentences": report["sentences"],
+        "timings": timings,
+    }
+
+def run_batch(files, reports_dir, journal_path, workers=1, remove=False, trace=False):
+    """Process files in a process pool, journaling each result; returns a summary dict.
+
+    With `trace` every worker records spans and counters and writes one
+    trace file per document (see `tracing`).
+    """
+    import config
+    config.ensure_indexes()
+
+    done = load_journal(journal_path)
+    pending = []
+    skipped = 0
+    for path in files:
+        digest = file_digest(path)
+        if f"{path}|{digest}" in done:
+            skipped += 1
+        else:
+            pending.append((path, digest))
+
+    print(f"📂 {len(files)} files: {skipped} already done, {len(pending)} to process with {workers} worker(s)")
+    start = time.perf_counter()
+    processed = failed = sentences = 0
+
+    # Spawned workers start clean: no inherited MongoDB sockets or torch state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(trace,)) as pool, \
+            open(journal_path, "a", encoding="utf-8") as journal:
+        futures = {pool.submit(process_submission, path, reports_dir, remove): (path, digest) for path, digest in pending}
+        for future in as_completed(futures):
+            path, digest = futures[future]
+            entry = {"path": path, "digest": digest}
+            try:
+                entry.update(future.result(), status="done")
+                processed += 1
+                sentences += entry["sentences"]
+                print(f"✅ {path} ({entry['seconds']:.1f}s) → {entry['report']}")
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+                failed += 1
+                print(f"❌ {path}: {e}")
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "processed": processed,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 2),
+        "documents_per_minute": round(processed / elapsed * 60, 2) if elapsed and processed else 0,
+        "sentences_per_second": round(sentences / elapsed, 2) if elapsed and sentences else 0,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch plagiarism / AI-content check for a directory of submissions.")
+    parser.add_argument("source", help="Directory of .txt/.docx files or a manifest listing them")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel worker processes (one model copy each)")
+    parser.add_argument("--reports", default="reports", help="Directory for per-document JSON reports")
+    parser.add_argument("--journal", default=None, help="Progress journal used to resume (default: <reports>/journal.jsonl)")
+    parser.add_argument("--remove", action="store_true", help="Also rewrite flagged sentences")
+    parser.add_argument("--collusion", action="store_true", help="Afterwards, check the submissions against each other")
+    parser.add_argument("--trace", action="store_true", help="Write a Chrome trace of every document (see config.TRACE_DIR)")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.source)
+    if not files:
+        print("⚠️ No .txt or .docx files found.")
+        return 1
+
+    os.makedirs(args.reports, exist_ok=True)
+    journal = args.journal or os.path.join(args.reports, "journal.jsonl")
+    summary = run_batch(files, args.reports, journal, args.workers, args.remove, args.trace)
+    print(
+        f"📊 {summary['processed']} processed, {summary['failed']} failed, {summary['skipped']} skipped "
+        f"in {summary['seconds']}s ({summary['documents_per_minute']} docs/min, "
+        f"{summary['sentences_per_second']} sentences/s)"
+    )
+
+    if args.collusion:
+        from bson import ObjectId
+        import collusion
+
+        # Submissions with identical text are reported as exact copies (see collusion.identical_submissions)
+        digests = {f"{path}|{file_digest(path)}" for path in files}
+        submissions = [
+            (entry["path"], ObjectId(entry["document_id"])) for key, entry in load_journal(journal).items()
+            if key in digests and entry.get("document_id")
+        ]
+        print(collusion.run_collusion(submissions=submissions, report_path=os.path.join(args.reports, "collusion.json")))
+    return 0 if not summary["failed"] else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,445 @@
+"""Reproducible benchmark of the checking stages on synthetic data.
+
+Usage:
+    python benchmark.py --sizes 10,50,200 --output reports/benchmark.json
+    python benchmark.py --stages plagiarism,removal --baseline reports/benchmark.json
+
+For every size (number of reference pages) a seeded generator writes
+reference pages and documents with planted exact copies, light paraphrases
+and heavier semantic rewrites of reference sentences, plus "AI-style"
+sentences. Nothing leaves the machine: LLM calls go to a fake Ollama server,
+pages are served by a stub HTTP server, and the stages are called on the
+generated texts directly, so MongoDB is not used; the LLM, page and
+embedding caches are disabled or pointed at a temporary directory.
+
+Each stage reports throughput, latency percentiles, process RSS and, where
+the generator knows the answer, precision and recall. Peak RSS is the
+process peak so far, so run one stage at a time to attribute it. The JSON
+output carries the commit and settings, and `--baseline` prints the change
+against an earlier run.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import config
+
+STAGES = ["fetch", "topics", "plagiarism", "removal", "ai"]
+
+NOUNS = [
+    "system", "network", "model", "student", "teacher", "policy", "market", "process", "signal", "protein",
+    "climate", "energy", "algorithm", "dataset", "theory", "experiment", "community", "language", "structure", "method",
+    "river", "city", "engine", "economy", "culture", "memory", "sensor", "vaccine", "reactor", "archive",
+    "forest", "museum", "satellite", "hospital", "parliament", "glacier", "compiler", "orchestra", "harbor", "enzyme",
+    "painting", "contract", "bridge", "microscope", "festival", "tribunal", "telescope", "pipeline", "village", "mineral",
+]
+ADJECTIVES = [
+    "efficient", "complex", "robust", "ancient", "modern", "global", "local", "digital", "rapid", "stable",
+    "hidden", "public", "social", "thermal", "neural", "urban", "rural", "formal", "novel", "critical",
+    "fragile", "coastal", "medieval", "acoustic", "volcanic", "fiscal", "genetic", "orbital", "musical", "legal",
+]
+VERBS = [
+    "improves", "reduces", "supports", "transforms", "measures", "predicts", "controls", "influences",
+    "explains", "connects", "protects", "generates", "limits", "reveals", "shapes", "funds", "documents",
+    "imitates", "cools", "inspects", "replaces", "translates", "illuminates",
+]
+PREPOSITIONS = ["during", "across", "within", "after", "before", "beyond", "through", "despite"]
+ADVERBS = ["slowly", "rarely", "often", "quietly", "steadily", "sharply"]
+SYNONYMS = {
+    "improves": "enhances", "reduces": "lowers", "supports": "sustains", "transforms": "reshapes",
+    "measures": "quantifies", "predicts": "forecasts", "controls": "regulates", "influences": "affects",
+    "explains": "clarifies", "connects": "links", "protects": "shields", "generates": "produces",
+    "limits": "restricts", "reveals": "exposes", "shapes": "forms", "efficient": "effective",
+    "complex": "intricate", "robust": "resilient", "ancient": "old", "modern": "contemporary",
+    "global": "worldwide", "rapid": "fast", "stable": "steady", "hidden": "concealed", "public": "communal",
+    "novel": "new", "critical": "crucial", "city": "town", "student": "learner", "teacher": "instructor",
+    "method": "technique", "memory": "recollection", "dataset": "data collection", "economy": "financial system",
+    "often": "frequently", "rarely": "seldom", "quietly": "silently", "sharply": "abruptly",
+}
+AI_OPENERS = ["Furthermore,", "Moreover,", "In conclusion,", "Additionally,"]
+
+# --- Synthetic corpus ---------------------------------------------------------------------------
+
+def make_parts(rng):
+    """Random sentence skeleton; rendered verbatim or rewritten by `render`."""
+    parts = {
+        "subject": (rng.choice(ADJECTIVES), rng.choice(NOUNS)),
+        "verb": rng.choice(VERBS),
+        "object": (rng.choice(ADJECTIVES), rng.choice(NOUNS)),
+        "place": (rng.choice(PREPOSITIONS), rng.choice(NOUNS)),
+        "clause": None,
+    }
+    if rng.random() < 0.5:
+        parts["clause"] = (rng.choice(ADJECTIVES), rng.choice(NOUNS), rng.choice(ADVERBS), rng.choice(VERBS), rng.choice(NOUNS))
+    return parts
+
+def render(parts, swap=(), front=False, opener=None):
+    """Sentence text of `parts`, replacing the words in `swap` by synonyms and optionally
+    moving the prepositional phrase to the front."""
+    word = lambda w: SYNONYMS.get(w, w) if w in swap else w
+    main = f"the {word(parts['subject'][0])} {word(parts['subject'][1])} {word(parts['verb'])} the {word(parts['object'][0])} {word(parts['object'][1])}"
+    place = f"{parts['place'][0]} the {word(parts['place'][1])}"
+    sentence = f"{place}, {main}" if front else f"{main} {place}"
+    if parts["clause"]:
+        adjective, noun, adverb, verb, other = parts["clause"]
+        sentence += f", while the {word(adjective)} {word(noun)} {word(adverb)} {word(verb)} the {word(other)}"
+    if opener:
+        sentence = f"{opener} {sentence}"
+    return sentence[0].upper() + sentence[1:] + "."
+
+def words_of(parts):
+    values = [parts["verb"], *parts["subject"], *parts["object"], parts["place"][1]]
+    if parts["clause"]:
+        values += list(parts["clause"])
+    return [w for w in values if w in SYNONYMS]
+
+def make_corpus(pages, documents, sentences, seed, page_sentences=20):
+    """Reference pages and documents with planted copies; every document sentence is labelled
+    "exact", "paraphrase", "semantic" (copied from a page), "ai" or None (original)."""
+    rng = random.Random(seed)
+    references = [[make_parts(rng) for _ in range(page_sentences)] for _ in range(pages)]
+    docs = []
+    for _ in range(documents):
+        doc = []
+        for _ in range(sentences):
+            roll = rng.random()
+            if roll < 0.3 and references:
+                source = rng.choice(rng.choice(references))
+                candidates = words_of(source)
+                if roll < 0.1:
+                    doc.append((render(source), "exact"))
+                elif roll < 0.2:
+                    doc.append((render(source, swap=set(rng.sample(candidates, min(2, len(candidates))))), "paraphrase"))
+                else:
+                    doc.append((render(source, swap=set(candidates), front=True), "semantic"))
+            elif roll < 0.45:
+                doc.append((render(make_parts(rng), opener=rng.choice(AI_OPENERS)), "ai"))
+            else:
+                doc.append((render(make_parts(rng)), None))
+        docs.append(doc)
+    page_paragraphs = [
+        [" ".join(render(parts) for parts in page[i : i + 4]) for i in range(0, len(page), 4)]
+        for page in references
+    ]
+    return page_paragraphs, docs
+
+# --- Local service stand-ins --------------------------------------------------------------------
+
+def fake_reply(prompt):
+    """Deterministic answer of the fake LLM for the prompts this repo sends."""
+    body = prompt.split("\n\n", 1)[1] if "\n\n" in prompt else prompt.split("\n", 1)[-1]
+    numbered = re.findall(r"^\d+\. (.*)$", body, re.MULTILINE)
+    ai_score = lambda sentence: 0.9 if sentence.strip().startswith(tuple(AI_OPENERS)) else 0.1
+    paraphrase = lambda sentence: " ".join(SYNONYMS.get(w, w) for w in sentence.split(" "))
+    if '"scores"' in prompt:
+        return json.dumps({"scores": [ai_score(s) for s in numbered]})
+    if '"rewrites"' in prompt:
+        return json.dumps({"rewrites": [paraphrase(s) for s in numbered]})
+    if "AI-generated" in prompt:
+        return str(ai_score(body))
+    if "key topics" in prompt.lower():
+        counts = {}
+        for w in re.findall(r"[a-z]{6,}", body.lower()):
+            counts[w] = counts.get(w, 0) + 1
+        return "Key topics:\n" + "\n".join(f"{i}. {w}" for i, w in enumerate(sorted(counts, key=lambda w: -counts[w])[:5], 1))
+    return paraphrase(body)
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        reply = fake_reply(request["messages"][-1]["content"])
+        data = json.dumps({
+            "model": request["model"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": reply},
+            "done": True,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StubPageHandler(BaseHTTPRequestHandler):
+    pages = []
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        match = re.fullmatch(r"/page/(\d+)", self.path)
+        if not match or int(match.group(1)) >= len(self.pages):
+            self.send_response(404)
+            self.end_headers()
+            return
+        paragraphs = "".join(f"<p>{paragraph}</p>" for paragraph in self.pages[int(match.group(1))])
+        data = f"<html><body><nav>Home | About</nav>{paragraphs}<footer>Contact</footer></body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def isolate(workdir, ollama_url):
+    """Point every external service and cache of this process at local stand-ins."""
+    import llm_client
+
+    config.OLLAMA_HOST = ollama_url
+    llm_client._client = None
+    config.LLM_CACHE_ENABLED = False
+    config.PAGE_CACHE_ENABLED = False
+    config.EMBEDDING_STORE_DIR = os.path.join(workdir, "embedding_store")
+    config.LOCAL_CORPUS_DIR = os.path.join(workdir, "local_corpus")
+
+# --- Measurement --------------------------------------------------------------------------------
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+def latency_stats(seconds):
+    if not seconds:
+        return {}
+    values = np.asarray(seconds, dtype=np.float64)
+    return {
+        "count": len(values),
+        "mean_s": round(float(values.mean()), 4),
+        "p50_s": round(float(np.percentile(values, 50)), 4),
+        "p90_s": round(float(np.percentile(values, 90)), 4),
+        "p99_s": round(float(np.percentile(values, 99)), 4),
+        "max_s": round(float(values.max()), 4),
+    }
+
+def detection_scores(predicted, labels, positive):
+    """Precision/recall of the predicted sentences against labelled document sentences."""
+    actual = {sentence for sentence, label in labels if label in positive}
+    predicted = set(predicted)
+    hits = len(predicted & actual)
+    scores = {
+        "precision": round(hits / len(predicted), 4) if predicted else None,
+        "recall": round(hits / len(actual), 4) if actual else None,
+    }
+    if len(positive) > 1:
+        for kind in sorted(positive):
+            planted = {sentence for sentence, label in labels if label == kind}
+            scores[f"recall_{kind}"] = round(len(predicted & planted) / len(planted), 4) if planted else None
+    return scores
+
+def timed_documents(docs, run):
+    """Run `run(text)` for every document; returns the latencies, results and wall time."""
+    latencies, results = [], []
+    start = time.perf_counter()
+    for doc in docs:
+        text = " ".join(sentence for sentence, _ in doc)
+        t = time.perf_counter()
+        results.append(run(text))
+        latencies.append(time.perf_counter() - t)
+    return latencies, results, time.perf_counter() - start
+
+def summarize(latencies, wall, units):
+    from embedding_service import process_rss_mb
+
+    stats = {"wall_s": round(wall, 3), "latency": latency_stats(latencies), "rss_mb": process_rss_mb(), "peak_rss_mb": peak_rss_mb()}
+    for name, count in units.items():
+        stats[f"{name}_per_s"] = round(count / wall, 2) if wall else None
+    return stats
+
+PLAGIARISM_KINDS = {"exact", "paraphrase", "semantic"}
+
+def bench_fetch(pages, base_url):
+    import web_search
+
+    urls = [f"{base_url}/page/{i}" for i in range(len(pages))]
+    expected = {url: "\n".join(paragraphs) for url, paragraphs in zip(urls, pages)}
+    start = time.perf_counter()
+    results = list(web_search.fetch_pages(urls))
+    wall = time.perf_counter() - start
+    latencies = [r["timing"].get("fetch_seconds", 0) + r["timing"].get("parse_seconds", 0) for r in results if r["content"]]
+    stats = summarize(latencies, wall, {"pages": len(urls)})
+    correct = sum(1 for r in results if r["content"] is not None and r["content"] == expected.get(r["url"]))
+    stats["recall"] = round(correct / len(urls), 4) if urls else None
+    return stats
+
+def bench_topics(docs, references):
+    import document_analyzer
+
+    latencies, results, wall = timed_documents(docs, document_analyzer.extract_key_topics)
+    stats = summarize(latencies, wall, {"documents": len(docs), "sentences": sum(len(doc) for doc in docs)})
+    stats["mode"] = config.TOPIC_EXTRACTION_MODE
+    stats["queries_per_document"] = round(float(np.mean([len(r or []) for r in results])), 2)
+    return stats
+
+def bench_plagiarism(docs, references):
+    import plagiarism_checker
+
+    latencies, results, wall = timed_documents(docs, lambda text: plagiarism_checker.check_plagiarism(text, references))
+    stats = summarize(latencies, wall, {"documents": len(docs), "sentences": sum(len(doc) for doc in docs)})
+    predicted = {match["original"] for _, matches in results for match in matches}
+    stats.update(detection_scores(predicted, [item for doc in docs for item in doc], PLAGIARISM_KINDS))
+    return stats
+
+def bench_removal(docs, references):
+    import plagiarism_remover
+
+    latencies, results, wall = timed_documents(docs, lambda text: plagiarism_remover.detect_plagiarism(text, references))
+    stats = summarize(latencies, wall, {"documents": len(docs), "sentences": sum(len(doc) for doc in docs)})
+    predicted = {sentence for flagged in results for sentence in flagged}
+    stats.update(detection_scores(predicted, [item for doc in docs for item in doc], PLAGIARISM_KINDS))
+    return stats
+
+def bench_ai(docs, references):
+    import ai_checker
+
+    latencies, results, wall = timed_documents(docs, ai_checker.analyze_text_for_ai)
+    stats = summarize(latencies, wall, {"documents": len(docs), "sentences": sum(len(doc) for doc in docs)})
+    predicted = {r["sentence"] for _, analysis in results for r in analysis if r["ai_score"] >= 50}
+    stats["mode"] = config.AI_SCORING_MODE
+    stats.update(detection_scores(predicted, [item for doc in docs for item in doc], {"ai"}))
+    return stats
+
+BENCHMARKS = {"topics": bench_topics, "plagiarism": bench_plagiarism, "removal": bench_removal, "ai": bench_ai}
+
+def commit_id():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(sizes, stages=None, documents=5, sentences=40, seed=0, llm_latency=0.0, http_latency=0.0):
+    """Run the selected stages at every size; returns the report dict."""
+    stages = stages or STAGES
+    FakeOllamaHandler.latency = llm_latency
+    StubPageHandler.latency = http_latency
+    ollama_server, ollama_url = start_server(FakeOllamaHandler)
+    page_server, page_url = start_server(StubPageHandler)
+    workdir = tempfile.mkdtemp(prefix="plagremover-bench-")
+    isolate(workdir, ollama_url)
+
+    import embedding_service
+    start = time.perf_counter()
+    embedding_service.encode(["warm-up sentence"])  # Model load is reported once, not per stage
+    report = {
+        "meta": {
+            "commit": commit_id(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": sys.version.split()[0],
+            "embedding_model": config.EMBEDDING_MODEL,
+            "embedding_backend": getattr(config, "EMBEDDING_BACKEND", "torch"),
+            "model_load_s": round(time.perf_counter() - start, 3),
+            "documents": documents,
+            "sentences_per_document": sentences,
+            "seed": seed,
+            "llm_latency_s": llm_latency,
+            "http_latency_s": http_latency,
+        },
+        "results": [],
+    }
+    try:
+        for size in sizes:
+            pages, docs = make_corpus(size, documents, sentences, seed)
+            references = ["\n".join(paragraphs) for paragraphs in pages]
+            StubPageHandler.pages = pages
+            entry = {"size": size, "reference_sentences": sum(len(page) * 4 for page in pages), "stages": {}}
+            for stage in stages:
+                print(f"⏱️ size {size}: {stage}...")
+                if stage == "fetch":
+                    entry["stages"][stage] = bench_fetch(pages, page_url)
+                else:
+                    entry["stages"][stage] = BENCHMARKS[stage](docs, references)
+            report["results"].append(entry)
+    finally:
+        ollama_server.shutdown()
+        page_server.shutdown()
+    return report
+
+def compare_reports(current, baseline):
+    """Lines describing how throughput, median latency and recall moved since `baseline`."""
+    previous = {(entry["size"], stage): stats for entry in baseline["results"] for stage, stats in entry["stages"].items()}
+    lines = [f"Compared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):"]
+    for entry in current["results"]:
+        for stage, stats in entry["stages"].items():
+            old = previous.get((entry["size"], stage))
+            if old is None:
+                continue
+            changes = []
+            for key in ("documents_per_s", "pages_per_s"):
+                if stats.get(key) and old.get(key):
+                    changes.append(f"throughput {100 * (stats[key] / old[key] - 1):+.1f}%")
+            new_p50, old_p50 = stats["latency"].get("p50_s"), old["latency"].get("p50_s")
+            if new_p50 and old_p50:
+                changes.append(f"p50 {100 * (new_p50 / old_p50 - 1):+.1f}%")
+            for key in ("precision", "recall"):
+                if stats.get(key) is not None and old.get(key) is not None:
+                    changes.append(f"{key} {stats[key] - old[key]:+.4f}")
+            lines.append(f"  size {entry['size']:>5} {stage:<11} " + ", ".join(changes))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the checking stages on synthetic data with local service stand-ins.")
+    parser.add_argument("--sizes", default="10,50,200", help="Comma-separated numbers of reference pages")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--documents", type=int, default=5, help="Documents checked per size")
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences per document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the fake LLM waits per request")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="Seconds the stub web server waits per page")
+    parser.add_argument("--output", default=os.path.join("reports", "benchmark.json"))
+    parser.add_argument("--baseline", help="Earlier benchmark JSON to compare with")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    report = run_benchmark(
+        [int(size) for size in args.sizes.split(",")], stages, args.documents, args.sentences,
+        args.seed, args.llm_latency, args.http_latency,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for entry in report["results"]:
+        for stage, stats in entry["stages"].items():
+            quality = "".join(f" {key} {stats[key]}" for key in ("precision", "recall") if stats.get(key) is not None)
+            print(f"📊 size {entry['size']:>5} {stage:<11} p50 {stats['latency'].get('p50_s')}s  wall {stats['wall_s']}s{quality}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print("\n".join(compare_reports(report, json.load(f))))
+    print(f"✅ Benchmark written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
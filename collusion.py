@@ -0,0 +1,325 @@
+"""Cross-submission collusion detection over a cohort of stored documents.
+
+Usage:
+    python collusion.py --report reports/collusion.json
+    python collusion.py --ids cohort.txt --since 2024-09-01
+
+Candidate pairs come from two cheap sources instead of comparing every pair:
+shared winnowing fingerprints (copied passages) and nearest neighbours of
+document embeddings (paraphrased copies). Only candidates are verified
+sentence by sentence, with fingerprint hits and the embedding similarity
+matrix of the two documents, and reported with matched character spans.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+import ann_index
+import config
+from embedding_service import encode
+from embedding_store import get_store
+from preprocessing import ensure_preprocessed
+from text_utils import content_hash
+
+collusion_reports_collection = config.get_collection("collusion_reports")
+
+def select_cohort(document_ids=None, since=None, submissions=None):
+    """Documents to compare: those of `submissions`, of `document_ids`, or every latest version.
+
+    `submissions` are `(path, document_id)` pairs of one batch; every
+    document is kept with the `paths` it was submitted under (a re-uploaded
+    file maps to the document stored for it before). Explicit ids are
+    kept as given. Only without either, documents superseded by a newer
+    version of themselves are left out.
+    """
+    documents = config.get_collection("documents")
+    paths = defaultdict(list)
+    if submissions is not None:
+        for path, document_id in submissions:
+            paths[document_id].append(path)
+        document_ids = list(paths)
+    query = {}
+    if document_ids is not None:
+        query["_id"] = {"$in": list(document_ids)}
+    if since is not None:
+        query["uploaded_at"] = {"$gte": since}
+    cohort = [doc for doc in documents.find(query, {"content": 1, "filename": 1, "preprocessed": 1}) if doc.get("content")]
+    if document_ids is None:
+        ids = [doc["_id"] for doc in cohort]
+        superseded = {doc["previous_id"] for doc in documents.find({"previous_id": {"$in": ids}}, {"previous_id": 1})}
+        cohort = [doc for doc in cohort if doc["_id"] not in superseded]
+    for doc in cohort:
+        doc["paths"] = paths.get(doc["_id"], [])
+    return cohort
+
+def identical_submissions(cohort):
+    """Report entries for submissions with identical text: separate documents or paths of one document."""
+    groups = defaultdict(list)
+    for doc in cohort:
+        for label in doc["paths"] or [doc.get("filename")]:
+            groups[content_hash(doc["content"])].append((doc["_id"], label))
+
+    pairs = []
+    for submissions in groups.values():
+        for i, (a_id, a_label) in enumerate(submissions):
+            for b_id, b_label in submissions[i + 1 :]:
+                pairs.append({
+                    "a": a_id,
+                    "b": b_id,
+                    "a_filename": a_label,
+                    "b_filename": b_label,
+                    "score": 1.0,
+                    "a_coverage": 1.0,
+                    "b_coverage": 1.0,
+                    "identical": True,
+                    "matches": [],
+                })
+    return pairs
+
+def winnow(sentences, k=None, window=None):
+    """Winnowing fingerprints of a document as `{hash: sentence index}`.
+
+    Words are hashed in overlapping k-grams and the minimum hash of every
+    window of `window` k-grams is kept, so any copied run of at least
+    `k + window - 1` words shares a fingerprint with its source.
+    """
+    k = k or config.COLLUSION_KGRAM
+    window = window or config.COLLUSION_WINDOW
+    words = []
+    owners = []
+    for index, sentence in enumerate(sentences):
+        tokens = re.findall(r"\w+", sentence.lower())
+        words.extend(tokens)
+        owners.extend([index] * len(tokens))
+    if len(words) < k:
+        return {}
+
+    hashes = np.array([zlib.crc32(" ".join(words[i : i + k]).encode("utf-8")) for i in range(len(words) - k + 1)], dtype=np.uint32)
+    if len(hashes) <= window:
+        positions = [int(np.argmin(hashes))]
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(hashes, window)
+        positions = np.unique(np.arange(len(windows)) + np.argmin(windows, axis=1))
+    return {int(hashes[p]): owners[p] for p in positions}
+
+def candidate_pairs(fingerprints, doc_vectors, min_shared=None, max_df=None, neighbours=None, doc_similarity=None):
+    """Document pairs worth verifying, with the evidence that nominated them.
+
+    Fingerprints shared by more than `max_df` documents (assignment prompts,
+    quotations everyone uses) are ignored; the rest vote for every pair of
+    documents that contains them. Document embeddings add the `neighbours`
+    nearest documents above `doc_similarity`. Returns `(pairs, common)` where
+    `common` holds the ignored fingerprints.
+    """
+    n = len(fingerprints)
+    min_shared = min_shared or config.COLLUSION_MIN_SHARED
+    max_df = max_df or max(config.COLLUSION_MAX_DF * n, 10)
+    neighbours = neighbours or config.COLLUSION_NEIGHBOURS
+    doc_similarity = config.COLLUSION_DOC_SIMILARITY if doc_similarity is None else doc_similarity
+
+    postings = defaultdict(list)
+    for doc, prints in enumerate(fingerprints):
+        for h in prints:
+            postings[h].append(doc)
+
+    shared = Counter()
+    common = set()
+    for h, docs in postings.items():
+        if len(docs) > max_df:
+            common.add(h)
+        elif len(docs) > 1:
+            for i, a in enumerate(docs):
+                for b in docs[i + 1 :]:
+                    shared[(a, b)] += 1
+
+    pairs = {pair: {"shared_fingerprints": count} for pair, count in shared.items() if count >= min_shared}
+
+    if n > 1:
+        index = ann_index.build_index(doc_vectors)
+        scores, ids = index.search(doc_vectors, min(neighbours + 1, n))
+        for a, (row_scores, row_ids) in enumerate(zip(scores, ids)):
+            for score, b in zip(row_scores, row_ids):
+                if b < 0 or b == a or score < doc_similarity:
+                    continue
+                pair = (min(a, int(b)), max(a, int(b)))
+                pairs.setdefault(pair, {"shared_fingerprints": shared.get(pair, 0)})["document_similarity"] = round(float(score), 4)
+    return pairs, common
+
+def compare_pair(a, b, sentence_similarity=None):
+    """Sentence-level matches between two prepared documents, with character spans.
+
+    Template sentences (shared by much of the cohort) are neither matched nor
+    counted in the coverage of either document.
+    """
+    sentence_similarity = config.COLLUSION_SENTENCE_SIMILARITY if sentence_similarity is None else sentence_similarity
+    matches = {}
+
+    # Copied passages: sentences holding the same fingerprint
+    for h, sa in a["fingerprints"].items():
+        sb = b["fingerprints"].get(h)
+        if sb is not None and sa not in a["template"] and sb not in b["template"]:
+            matches[(sa, sb)] = {"method": "Fingerprint", "similarity": None}
+
+    # Paraphrases: best embedding match of each sentence of `a`
+    if len(a["vectors"]) and len(b["vectors"]):
+        similarity = np.asarray(a["vectors"]) @ np.asarray(b["vectors"]).T
+        best = similarity.argmax(axis=1)
+        for sa, sb in enumerate(best):
+            score = float(similarity[sa, sb])
+            if score >= sentence_similarity and sa not in a["template"] and sb not in b["template"]:
+                match = matches.setdefault((sa, int(sb)), {"method": "Deep Semantic Similarity"})
+                match["similarity"] = round(score, 4)
+
+    spans = []
+    for (sa, sb), match in sorted(matches.items()):
+        spans.append({
+            "a_sentence": a["sentences"][sa],
+            "b_sentence": b["sentences"][sb],
+            "a_span": list(a["spans"][sa]),
+            "b_span": list(b["spans"][sb]),
+            **match,
+        })
+    own_a = len(a["sentences"]) - len(a["template"])
+    own_b = len(b["sentences"]) - len(b["template"])
+    covered_a = len({sa for sa, _ in matches}) / own_a if own_a else 0.0
+    covered_b = len({sb for _, sb in matches}) / own_b if own_b else 0.0
+    return covered_a, covered_b, spans
+
+def prepare(cohort, store=None):
+    """Sentences, spans, fingerprints and sentence vectors of every document (vectors via the embedding store).
+
+    Sentences come from the documents' cached preprocessing; documents
+    without it are segmented on a process pool and the result is stored.
+    """
+    store = store if store is not None else get_store()
+    ensure_preprocessed(cohort)
+    references = [(f"documents/{doc['_id']}", doc["content"]) for doc in cohort]
+    cached = {doc["content"]: doc["preprocessed"] for doc in cohort}
+    store.load_or_embed(
+        references,
+        split=lambda text: cached[text]["sentences"],
+        encode=lambda sentences: np.asarray(encode(sentences, convert_to_tensor=False), dtype=np.float32),
+    )
+
+    prepared = []
+    for doc, (key, text) in zip(cohort, references):
+        hit = store.get(key, text)
+        if hit is None or not hit[0]:
+            continue  # No sentences, nothing to copy
+        sentences, vectors = hit[0], np.asarray(hit[1], dtype=np.float32)
+        prepared.append({
+            "id": doc["_id"],
+            "filename": ", ".join(doc.get("paths") or []) or doc.get("filename"),
+            "sentences": sentences,
+            "spans": cached[text]["spans"],
+            "fingerprints": winnow(sentences),
+            "vectors": vectors,
+            "doc_vector": vectors.mean(axis=0),
+        })
+    return prepared
+
+def detect_collusion(cohort, threshold=None):
+    """Pairwise similarity report for a cohort of documents; only candidate pairs are compared."""
+    threshold = config.COLLUSION_REPORT_THRESHOLD if threshold is None else threshold
+    timings = {}
+
+    start = time.perf_counter()
+    prepared = prepare(cohort)
+    timings["prepare"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    doc_vectors = np.stack([doc["doc_vector"] for doc in prepared]) if prepared else np.empty((0, 1), dtype=np.float32)
+    candidates, common = candidate_pairs([doc["fingerprints"] for doc in prepared], doc_vectors)
+    for doc in prepared:
+        # A sentence is template text when most of its fingerprints are common ones
+        votes = Counter()
+        for h, sentence in doc["fingerprints"].items():
+            votes[sentence] += 1 if h in common else -1
+        doc["template"] = {sentence for sentence, vote in votes.items() if vote > 0}
+    timings["candidates"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    pairs = identical_submissions(cohort)
+    identical = {frozenset((pair["a"], pair["b"])) for pair in pairs}
+    for (i, j), evidence in candidates.items():
+        a, b = prepared[i], prepared[j]
+        if frozenset((a["id"], b["id"])) in identical:
+            continue
+        covered_a, covered_b, spans = compare_pair(a, b)
+        score = max(covered_a, covered_b)
+        if score < threshold:
+            continue
+        pairs.append({
+            "a": a["id"],
+            "b": b["id"],
+            "a_filename": a["filename"],
+            "b_filename": b["filename"],
+            "score": round(score, 4),
+            "a_coverage": round(covered_a, 4),
+            "b_coverage": round(covered_b, 4),
+            **evidence,
+            "matches": spans,
+        })
+    pairs.sort(key=lambda pair: -pair["score"])
+    timings["verify"] = round(time.perf_counter() - start, 3)
+
+    n = len(prepared)
+    return {
+        "documents": n,
+        "submissions": sum(max(1, len(doc.get("paths") or [])) for doc in cohort),
+        "all_pairs": n * (n - 1) // 2,
+        "candidate_pairs": len(candidates),
+        "reported_pairs": len(pairs),
+        "timings": timings,
+        "pairs": pairs,
+    }
+
+def store_collusion_report(report):
+    collusion_reports_collection.insert_one({"timestamp": datetime.utcnow(), **report})
+    return f"✅ Collusion report stored: {report['reported_pairs']} suspicious pairs among {report['documents']} documents."
+
+def run_collusion(document_ids=None, since=None, report_path=None, submissions=None):
+    """Detect collusion in a cohort, store the report and optionally write it as JSON.
+
+    `submissions` (a batch's `(path, document_id)` pairs) takes precedence
+    over `document_ids`; see `select_cohort`.
+    """
+    cohort = select_cohort(document_ids, since, submissions)
+    count = sum(max(1, len(doc["paths"])) for doc in cohort)
+    if count < 2:
+        return "⚠️ Need at least two documents for a collusion check."
+
+    print(f"👥 Checking {count} documents for collusion...")
+    report = detect_collusion(cohort)
+    print(
+        f"⏱️ {report['candidate_pairs']} of {report['all_pairs']} pairs verified | "
+        + " | ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report["timings"].items())
+    )
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str, ensure_ascii=False)
+    return store_collusion_report(report)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find submissions in a cohort that copy from each other.")
+    parser.add_argument("--ids", help="File with one document id per line (default: every stored document)")
+    parser.add_argument("--since", help="Only documents uploaded on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--report", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    document_ids = None
+    if args.ids:
+        with open(args.ids, "r", encoding="utf-8") as f:
+            document_ids = [ObjectId(line.strip()) for line in f if line.strip()]
+    since = datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+    print(run_collusion(document_ids, since, args.report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
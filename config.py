@@ -1,28 +1,321 @@
+import threading
 import pymongo
+from pymongo import monitoring
+from pymongo.errors import OperationFailure
 
 # MongoDB Connection
-MONGO_URI = "mongodb://localhost:27017/"  # Change if needed
+MONGO_URI = "mongodb://localhost:27017/"  # Change if needed; "mongomock://" uses an in-memory stand-in (needs mongomock)
 DB_NAME = "plagir"
+MONGO_MAX_POOL_SIZE = 50  # Connections per process; stage threads and fetch workers share them
+MONGO_MIN_POOL_SIZE = 0
+MONGO_MAX_IDLE_MS = 60000
+MONGO_SERVER_TIMEOUT_MS = 5000  # Fail fast when mongod is not running
+MONGO_COMPRESSORS = "zlib"  # Wire compression, negotiated with the server
 
-# Connect to MongoDB
-client = pymongo.MongoClient(MONGO_URI)
-db = client[DB_NAME]
-
-# Collections
-COLLECTIONS = {
-    "documents": db["documents"],
-    "analyzed_topics": db["analyzed_topics"],
-    "web_references": db["web_references"],
-    "plagiarism_results": db["plagiarism_results"],
-    "rewritten_texts": db["rewritten_texts"]
-}
+# Buffered writes and stored text compression (see storage.py)
+BULK_WRITE_SIZE = 500  # Operations per unordered bulk write
+COMPRESS_MIN_BYTES = 2048  # Page text at least this long is stored zlib-compressed
+COMPRESS_LEVEL = 6
 
 # Plagiarism Threshold (Adjustable)
 PLAGIARISM_THRESHOLD = 20  # Percentage to trigger rewriting
 
+# Shared sentence embedding model (loaded lazily on first use)
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = None  # None = CUDA if available, else CPU
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_THREADS = None  # CPU threads (torch or ONNX Runtime); None keeps the library default
+EMBEDDING_WARMUP = False  # Encode a dummy batch right after loading
+
+# Embedding backend: "torch" (SentenceTransformer), "onnx" (ONNX Runtime, fp32) or
+# "onnx-int8" (dynamically quantized, CPU only). ONNX models are exported on first use.
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = "onnx_models"
+EMBEDDING_LENGTH_BUCKETING = True  # ONNX: batch sentences of similar token length to cut padding
+EMBEDDING_ACCURACY_TOLERANCE = 0.02  # Max. similarity difference from torch accepted by `embedding_service.py compare`
+
+# MinHash/LSH banding for the exact-match stage (bands * rows permutations).
+# Pairs at the exact-match threshold (0.85) are found with ~99% probability.
+LSH_BANDS = 16
+LSH_ROWS = 8
+
+# Directory of the persistent reference-sentence embedding stores (one subdirectory per model and backend)
+EMBEDDING_STORE_DIR = "embedding_store"
+
+# Semantic nearest-neighbour search: "auto", "brute", "ivf" or "hnsw" (needs faiss).
+# Auto switches from exact search to an index at ANN_MIN_VECTORS reference sentences.
+SEMANTIC_INDEX = "auto"
+ANN_MIN_VECTORS = 50000
+ANN_NLIST = None  # IVF clusters; defaults to 4 * sqrt(N)
+ANN_NPROBE = 16  # IVF lists scanned per query (higher = better recall)
+ANN_EF_SEARCH = 64  # HNSW search breadth (higher = better recall)
+ANN_TOP_K = 10  # Neighbours retrieved per sentence at first; widened while they all pass the threshold
+ANN_INDEX_DIR = "ann_indexes"  # Indexes saved per reference set and reused by later checks
+ANN_INDEXES_IN_MEMORY = 4  # Reference-set indexes kept loaded per process
+
+# Concurrent web fetching
+SEARCH_WORKERS = 2  # Parallel search queries (kept low to avoid rate limits)
+FETCH_WORKERS = 16  # Parallel page downloads
+FETCH_PER_HOST_LIMIT = 4  # Max simultaneous connections to one host
+FETCH_POOL_HOSTS = 32  # Hosts kept in the connection pool
+FETCH_PARSE_WORKERS = 0  # HTML parsing processes (0 = one background thread; >0 needs a __main__ guard on spawn platforms)
+FETCH_TIMEOUT = 10  # Per-request timeout in seconds
+FETCH_RETRIES = 3
+FETCH_BACKOFF_BASE = 0.5  # Seconds; doubled per retry with full jitter
+FETCH_BACKOFF_CAP = 8
+FETCH_DEADLINE = 120  # Overall seconds for one fetch run
+
+# On-disk cache of scraped page text and search results
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_PATH = "web_cache.sqlite3"
+PAGE_CACHE_TTL = 7 * 24 * 3600  # Seconds before a page is revalidated with a conditional GET
+SEARCH_CACHE_TTL = 24 * 3600  # Seconds a query's result list is reused
+PAGE_CACHE_MAX_MB = 512  # LRU eviction beyond this much stored text
+PAGE_CACHE_OFFLINE = False  # Serve only cached data, never touch the network (benchmarks)
+
+# Where reference texts come from: "web" (live search), "local" (the offline corpus
+# built with local_corpus.py, no network) or "both"
+REFERENCE_SOURCE = "web"
+LOCAL_CORPUS_DIR = "local_corpus"
+LOCAL_CORPUS_SHARDS = 8  # SQLite shards; one ingestion worker writes each
+LOCAL_CORPUS_WORKERS = None  # Ingestion processes; None = one per CPU (at most one per shard)
+LOCAL_PASSAGE_SENTENCES = 5  # Sentences per indexed passage
+LOCAL_TOP_K = 3  # Best passages retrieved per document sentence
+LOCAL_MAX_CANDIDATES = 200  # Passages handed to the plagiarism check
+LOCAL_MAX_DF = 0.2  # Terms found in more than this fraction of passages are not searched
+
+# Reference cleanup before pages are stored and compared (see reference_dedup.py)
+REFERENCE_DEDUP = True
+SIMHASH_MAX_DISTANCE = 3  # Pages whose 64-bit SimHashes differ in at most this many bits are near-duplicates
+MIN_REFERENCE_CHARS = 100  # Pages shorter than this after cleanup are skipped
+BOILERPLATE_MAX_CHARS = 300  # Only paragraphs shorter than this can be boilerplate
+# Whole paragraphs (lowercased, whitespace collapsed) that are navigation, consent or footer
+# strings; a pattern must match the entire paragraph, so prose that mentions e.g. cookies or
+# signing up is kept. Paragraphs repeated across the fetched pages are dropped as well.
+BOILERPLATE_PATTERNS = [
+    r"(accept|reject|allow|manage)( all)?( cookies)?",
+    r"(this (web)?site|we) uses? cookies\b.*",
+    r"(©|copyright|\(c\)) ?\d{4}\b.*",
+    r"all rights reserved\.?",
+    r"(sign (in|up)|log ?(in|out)|register|subscribe)( now| here| today| for free)?\.?",
+    r"subscribe to (our|the) newsletter\.?",
+    r"skip to (main )?content",
+    r"share (this( article| post| page| story)?|on \w+)",
+    r"follow us( on \w+)?",
+    r"advertisement",
+    r"(please )?enable javascript\b.*",
+    r"((privacy|cookie) policy|terms of (use|service)|contact( us)?|about( us)?|sitemap)( ?[|·•/-]? ?((privacy|cookie) policy|terms of (use|service)|contact( us)?|about( us)?|sitemap))*",
+]
+BOILERPLATE_LOG_LIMIT = 20  # Dropped paragraphs listed in the dedup log (per run)
+
+# Cross-submission collusion checks (see collusion.py)
+COLLUSION_KGRAM = 5  # Words per fingerprinted k-gram
+COLLUSION_WINDOW = 4  # Winnowing window; copies of k + window - 1 words are always caught
+COLLUSION_MIN_SHARED = 3  # Shared fingerprints that make two documents a candidate pair
+COLLUSION_MAX_DF = 0.05  # Fingerprints in more than this fraction of documents (min. 10) are ignored
+COLLUSION_NEIGHBOURS = 5  # Nearest documents by embedding that become candidates
+COLLUSION_DOC_SIMILARITY = 0.9  # ... when their document embeddings are at least this similar
+COLLUSION_SENTENCE_SIMILARITY = 0.85  # Sentence pairs at least this similar count as matched
+COLLUSION_REPORT_THRESHOLD = 0.2  # Report pairs where this share of one document's sentences is matched
+
+# Sentence segmentation, done once per document and cached on its record
+PREPROCESS_VERSION = 1  # Bump when tokenization or normalization changes to invalidate the cache
+PREPROCESS_WORKERS = None  # Processes for large batches; None = one per CPU
+PREPROCESS_POOL_MIN = 64  # Fewer texts than this are segmented in-process
+
+# Key topics (web search queries): "local" ranks keyphrases with TF-IDF and embeddings,
+# "llm" asks the model, one chunk at a time for long documents. Local mode falls back to
+# the model when it finds no keyphrases.
+TOPIC_EXTRACTION_MODE = "local"
+MAX_TOPICS = 8  # Queries kept per document; each one costs a web search
+TOPIC_MAX_WORDS = 3  # Longest keyphrase, in words
+TOPIC_CANDIDATES = 40  # Best TF-IDF keyphrases re-ranked with embeddings
+TOPIC_DIVERSITY = 0.6  # MMR trade-off: 1 = relevance only, 0 = novelty only
+TOPIC_CHUNK_CHARS = 6000  # LLM mode: longer documents are split into chunks of about this size
+
+# Re-check only the changed sentences when a new version of a stored document is uploaded.
+# An upload is a new version when it names its parent, or comes from the same path (and
+# owner) as a stored document and keeps at least VERSION_MIN_OVERLAP of its sentences.
+INCREMENTAL_RECHECK = True
+VERSION_MIN_OVERLAP = 0.5
+
+# Tracing: spans and counters of every stage, written as Chrome trace-event JSON
+# (open in chrome://tracing or ui.perfetto.dev)
+TRACE_ENABLED = False
+TRACE_DIR = "reports/traces"
+TRACE_PROFILE = False  # Also sample the similarity loop's stack into a folded-stack file (flame graphs)
+TRACE_PROFILE_INTERVAL = 0.005  # Seconds between profiler samples
+
+# Streaming plagiarism check: references are consumed in batches as they arrive
+PLAGIARISM_STREAMING = False  # Also stream from the database when no page stream is given
+STREAM_BATCH_SIZE = 8  # References per batch (one provisional percentage each)
+STREAM_MAX_MATCHES = 20  # Matches kept per document sentence; the percentage still counts all
+
 # LLM Model for Analysis & Rewriting
 LLM_MODEL = "mistral"  # Ollama model to use
+OLLAMA_HOST = None  # e.g. "http://127.0.0.1:11434"; None uses the ollama default / OLLAMA_HOST env
+LLM_CONCURRENCY = 4  # Parallel LLM requests
+
+# Persistent LLM response cache (topics, AI scores, rewrites)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = "llm_cache.sqlite3"
+LLM_CACHE_TTL = 30 * 24 * 3600  # Seconds
+LLM_CACHE_MAX_ENTRIES = 200000
+LLM_CACHE_REWRITES = True  # Set False to always sample fresh paraphrases
+
+# AI detection: "batch" scores AI_BATCH_SIZE sentences per prompt, "single" one per prompt
+AI_SCORING_MODE = "batch"
+AI_BATCH_SIZE = 20
+
+# Plagiarism removal: "batch" rewrites REWRITE_BATCH_SIZE sentences per prompt, "single" one per prompt
+REWRITE_MODE = "single"
+REWRITE_BATCH_SIZE = 8
+REWRITE_MIN_SIMILARITY = 0.65  # Rewrites less similar to the original fail validation
+REWRITE_RETRIES = 1  # Fresh rewrites requested for the sentences that failed validation
+
+# Retention of per-document results: collection -> (date field, days before MongoDB's TTL
+# monitor deletes a record). None keeps the collection forever; documents are never expired.
+RETENTION = {
+    "web_results": ("created_at", 30),
+    "websave": ("created_at", 30),
+    "plagiarism_reports": ("timestamp", 180),
+    "aigenrel": ("timestamp", 180),
+    "plagrem": ("timestamp", 180),
+}
+
+# Every reader looks records up by document, newest first
+INDEXES = {
+    "documents": [[("path", 1), ("_id", -1)]],
+    "web_results": [[("document_id", 1), ("_id", -1)]],
+    "websave": [[("document_id", 1), ("url", 1)]],
+    "plagiarism_reports": [[("document_id", 1), ("_id", -1)]],
+    "aigenrel": [[("document_id", 1), ("_id", -1)]],
+    "plagrem": [[("document_id", 1), ("_id", -1)]],
+}
+
+_indexes_ready = False
+_client = None
+_client_lock = threading.Lock()
+
+class RoundTripCounter(monitoring.CommandListener):
+    """Counts commands sent to MongoDB (one per round trip), by command name and per thread.
+
+    pymongo notifies listeners on the thread that sends the command, so
+    `thread_total()` counts only the calling thread's commands.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def started(self, event):
+        self._local.total = getattr(self._local, "total", 0) + 1
+        with self._lock:
+            self.counts[event.command_name] = self.counts.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        with self._lock:
+            self.errors += 1
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def thread_total(self):
+        return getattr(self._local, "total", 0)
+
+    def report(self):
+        busiest = ", ".join(f"{name} {count}" for name, count in sorted(self.counts.items(), key=lambda item: -item[1])[:5])
+        return f"MongoDB round trips: {self.total()} ({busiest or 'none'})"
+
+round_trips = RoundTripCounter()
+
+def get_client():
+    """Process-wide MongoClient, created on first use (after fork/spawn in worker processes)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if MONGO_URI.startswith("mongomock://"):
+                import mongomock  # In-memory stand-in; does not report round trips
+                _client = mongomock.MongoClient()
+            else:
+                _client = pymongo.MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_TIMEOUT_MS,
+                    compressors=MONGO_COMPRESSORS,
+                    event_listeners=[round_trips],
+                )
+        return _client
+
+def get_db():
+    return get_client()[DB_NAME]
+
+class LazyCollection:
+    """Stands in for a collection at import time; the client is only created on first use."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
 
 # Function to get a collection
 def get_collection(name):
-    return COLLECTIONS.get(name, None)
\ No newline at end of file
+    return LazyCollection(name)
+
+def resolve_document_id(document_id=None):
+    """The given document id, or that of the most recently uploaded document (None if there is none)."""
+    if document_id is not None:
+        return document_id
+    latest = get_db()["documents"].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return latest["_id"] if latest else None
+
+def ensure_indexes(database=None):
+    """Create the per-document, content-hash and retention (TTL) indexes; cheap after the first call."""
+    global _indexes_ready
+    if _indexes_ready and database is None:
+        return
+    from text_utils import content_hash
+    from storage import BulkWriter
+    default = database is None
+    database = get_db() if default else database
+
+    # Documents stored before content hashes existed get one, so hash lookups find them. The
+    # hash is not unique: identical files uploaded by different students are separate documents.
+    documents = database["documents"]
+    with BulkWriter(documents) as writer:
+        for doc in documents.find({"content_hash": {"$exists": False}}, {"content": 1}):
+            writer.update({"_id": doc["_id"]}, {"$set": {"content_hash": content_hash(doc.get("content") or "")}})
+    if "content_hash_unique" in documents.index_information():
+        documents.drop_index("content_hash_unique")
+    documents.create_index([("content_hash", 1), ("path", 1)], name="content_hash_path")
+
+    for name, indexes in INDEXES.items():
+        for keys in indexes:
+            database[name].create_index(keys)
+
+    for name, (field, days) in RETENTION.items():
+        index_name = f"{field}_ttl"
+        if days is None:
+            if index_name in database[name].index_information():
+                database[name].drop_index(index_name)
+            continue
+        seconds = int(days * 24 * 3600)
+        try:
+            database[name].create_index(field, expireAfterSeconds=seconds, name=index_name)
+        except OperationFailure:
+            # Retention changed since the index was created: update it in place
+            database.command("collMod", name, index={"name": index_name, "expireAfterSeconds": seconds})
+
+    if default:
+        _indexes_ready = True
\ No newline at end of file
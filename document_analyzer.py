@@ -1,46 +1,182 @@
-from pymongo import MongoClient
-import ollama
-
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-documents_collection = db["documents"]
-web_results_collection = db["web_results"]
-
-def fetch_latest_document():
-    """Fetch the latest document from MongoDB."""
-    latest_doc = documents_collection.find_one(sort=[("_id", -1)])
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import config
+import llm_client
+import tracing
+from preprocessing import document_sentences
+from text_utils import sent_tokenize
+
+documents_collection = config.get_collection("documents")
+web_results_collection = config.get_collection("web_results")
+
+def fetch_latest_document(document_id=None):
+    """Fetch the given document (or the latest one) from MongoDB."""
+    if document_id is not None:
+        latest_doc = documents_collection.find_one({"_id": document_id})
+    else:
+        latest_doc = documents_collection.find_one(sort=[("_id", -1)])
     return latest_doc["content"] if latest_doc else None
 
-def extract_key_topics(text):
-    """Use LLM (Mistral) to extract key topics from the text."""
-    prompt = f"Analyze the following text and extract the key topics:\n{text}"
-    
+TOPICS_PROMPT = "Analyze the following text and extract the key topics:\n{text}"
+
+TOPICS_REDUCE_PROMPT = (
+    "The following key topics were extracted from consecutive parts of one document. "
+    "Merge them into at most {count} distinct topics that best describe the whole document, one per line:\n{{text}}"
+)
+
+_BULLET = re.compile(r"^\s*(?:[-*•·]+|\d+[.)]|#+)\s*")
+_PHRASE_BREAK = re.compile(r"[^\w\s'-]|\d|_")
+
+def clean_topics(lines, max_topics=None):
+    """Topics from LLM reply lines: bullets, numbering and markup stripped, headers and
+    blanks dropped, case-insensitive duplicates removed, capped at `max_topics`."""
+    max_topics = max_topics or config.MAX_TOPICS
+    topics = []
+    seen = set()
+    for line in lines:
+        topic = _BULLET.sub("", line).replace("**", "").strip().strip("\"'")
+        if ":" in topic:
+            head, _, tail = topic.partition(":")
+            topic = head if len(head.split()) <= 6 and tail.strip() else tail  # "Topic: explanation" keeps the topic
+        topic = topic.strip().rstrip(".")
+        key = topic.lower()
+        if not topic or key in seen or len(topic.split()) > 12 or key.startswith(("key topics", "here are", "topics")):
+            continue
+        seen.add(key)
+        topics.append(topic)
+        if len(topics) >= max_topics:
+            break
+    return topics
+
+def candidate_phrases(sentence, max_words=None):
+    """Word n-grams of a sentence that do not cross punctuation or numbers and
+    neither start nor end with a stop word."""
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+    max_words = max_words or config.TOPIC_MAX_WORDS
+    phrases = []
+    for run in _PHRASE_BREAK.split(sentence.lower()):
+        words = [word.strip("'-") for word in run.split()]
+        for n in range(1, max_words + 1):
+            for i in range(len(words) - n + 1):
+                first, last = words[i], words[i + n - 1]
+                if first in ENGLISH_STOP_WORDS or last in ENGLISH_STOP_WORDS or len(first) < 3 or len(last) < 3:
+                    continue
+                phrases.append(" ".join(words[i : i + n]))
+    return phrases
+
+def extract_keyphrases(sentences, max_topics=None, candidates=None, diversity=None):
+    """Rank keyphrases locally: TF-IDF over the document's sentences picks candidates,
+    then maximal marginal relevance over sentence embeddings picks topics that are
+    close to the document and far from each other."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from embedding_service import encode
+
+    max_topics = max_topics or config.MAX_TOPICS
+    candidates = candidates or config.TOPIC_CANDIDATES
+    diversity = config.TOPIC_DIVERSITY if diversity is None else diversity
+    sentences = [sentence for sentence in sentences if sentence.strip()]
+    if not sentences:
+        return []
+
+    vectorizer = TfidfVectorizer(analyzer=candidate_phrases, sublinear_tf=True)
     try:
-        response = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
-        key_topics = response.get("message", {}).get("content", "").split("\n")
+        weights = np.asarray(vectorizer.fit_transform(sentences).sum(axis=0)).ravel()
+    except ValueError:
+        return []  # No usable phrases
+    phrases = vectorizer.get_feature_names_out()
+    # Single words make vague search queries; favour phrases
+    weights = weights * np.sqrt([len(phrase.split()) for phrase in phrases])
+    top = np.argsort(-weights)[:candidates]
+    phrases = [str(phrases[i]) for i in top]
+    tfidf = weights[top] / weights[top[0]]
+
+    vectors = np.asarray(encode(phrases + sentences, convert_to_tensor=False), dtype=np.float32)
+    phrase_vectors, sentence_vectors = vectors[: len(phrases)], vectors[len(phrases) :]
+    document_vector = sentence_vectors.mean(axis=0)
+    document_vector /= np.linalg.norm(document_vector) or 1.0
+    relevance = (phrase_vectors @ document_vector + tfidf) / 2
+
+    selected = []
+    remaining = list(range(len(phrases)))
+    while remaining and len(selected) < max_topics:
+        if selected:
+            redundancy = (phrase_vectors[remaining] @ phrase_vectors[selected].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = diversity * relevance[remaining] - (1 - diversity) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+        words = set(phrases[best].split())
+        # "neural network" and "network" would search for the same pages
+        if any(words <= set(phrases[other].split()) or words >= set(phrases[other].split()) for other in selected):
+            continue
+        selected.append(best)
+    return [phrases[i] for i in selected]
 
-        if not key_topics or key_topics == [""]:
-            return None  # No valid topics extracted
+def chunk_text(sentences, chunk_chars=None):
+    """Group consecutive sentences into chunks of about `chunk_chars` characters."""
+    chunk_chars = chunk_chars or config.TOPIC_CHUNK_CHARS
+    chunks, current, size = [], [], 0
+    for sentence in sentences:
+        if current and size + len(sentence) > chunk_chars:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
 
-        return key_topics
+def extract_topics_llm(text, sentences=None, max_topics=None):
+    """Use LLM (Mistral) to extract key topics; long documents are map-reduced chunk by chunk."""
+    max_topics = max_topics or config.MAX_TOPICS
+    if len(text) <= config.TOPIC_CHUNK_CHARS:
+        return clean_topics(llm_client.cached_chat(TOPICS_PROMPT, text).split("\n"), max_topics)
+
+    chunks = chunk_text(sentences if sentences is not None else sent_tokenize(text))
+    with ThreadPoolExecutor(config.LLM_CONCURRENCY) as pool:
+        replies = list(pool.map(lambda chunk: llm_client.cached_chat(TOPICS_PROMPT, chunk), chunks))
+    partial = clean_topics((line for reply in replies for line in reply.split("\n")), max_topics * len(chunks))
+    if len(partial) <= max_topics:
+        return partial
+    reply = llm_client.cached_chat(TOPICS_REDUCE_PROMPT.format(count=max_topics), "\n".join(partial))
+    return clean_topics(reply.split("\n"), max_topics) or partial[:max_topics]
+
+@tracing.traced()
+def extract_key_topics(text, sentences=None, mode=None):
+    """Extract a ranked, deduplicated and capped list of key topics (used as search queries)."""
+    mode = mode or config.TOPIC_EXTRACTION_MODE
+    if mode not in ("local", "llm"):
+        raise ValueError(f"Unknown topic extraction mode: {mode}")
+    try:
+        if mode == "local":
+            key_topics = extract_keyphrases(sentences if sentences is not None else sent_tokenize(text))
+            if key_topics:
+                return key_topics
+            print("⚠️ No keyphrases found locally, asking the LLM...")
+        key_topics = extract_topics_llm(text, sentences)
+        return key_topics or None  # No valid topics extracted
     except Exception as e:
-        print(f"❌ Error during LLM processing: {e}")
+        print(f"❌ Error during topic extraction: {e}")
         return None
 
-def process_document():
-    """Process the latest document and store key topics in MongoDB."""
-    text = fetch_latest_document()
-    
+def process_document(document_id=None):
+    """Process the given (or latest) document and store key topics in MongoDB."""
+    document_id = config.resolve_document_id(document_id)
+    document = documents_collection.find_one({"_id": document_id}) if document_id is not None else None
+    text = document.get("content") if document else None
+
     if not text:
         return "⚠️ No document found in database!"
 
     print("🔍 Extracting key topics...")
-    key_topics = extract_key_topics(text)
+    key_topics = extract_key_topics(text, document_sentences(document))
 
     if not key_topics:
         return "⚠️ No topics extracted."
 
     # Store in MongoDB
-    web_results_collection.insert_one({"topics": key_topics})
-    return f"✅ Key topics stored in MongoDB: {key_topics}"
\ No newline at end of file
+    web_results_collection.insert_one({"topics": key_topics, "document_id": document_id, "created_at": datetime.utcnow()})
+    return f"✅ Key topics stored in MongoDB: {key_topics}"
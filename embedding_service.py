@@ -0,0 +1,211 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+import config
+import tracing
+from embedding_store import get_store
+from text_utils import sent_tokenize
+
+# Shared, lazily loaded Sentence Transformer used by every module
+_model = None
+_model_lock = threading.Lock()
+stats = {"backend": None, "device": None, "load_seconds": None, "warmup_seconds": None, "rss_mb_before_load": None, "rss_mb_after_load": None}
+
+def process_rss_mb():
+    """Current resident memory of this process in MB (None if it cannot be read)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and KB elsewhere (peak, not current)
+        return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        return None
+
+def _resolve_device(torch):
+    if config.EMBEDDING_DEVICE:
+        return config.EMBEDDING_DEVICE
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_model(backend=None):
+    """Load a new embedding model for `backend`; returns `(model, device)`.
+
+    Every backend offers SentenceTransformer's `encode`, so callers do not
+    depend on which one is configured.
+    """
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if config.EMBEDDING_THREADS:
+            torch.set_num_threads(config.EMBEDDING_THREADS)
+        device = _resolve_device(torch)
+        return SentenceTransformer(config.EMBEDDING_MODEL, device=device), device
+    if backend in ("onnx", "onnx-int8"):
+        from onnx_encoder import OnnxEncoder
+
+        return OnnxEncoder(config.EMBEDDING_MODEL, quantized=backend == "onnx-int8", threads=config.EMBEDDING_THREADS), "cpu"
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+def get_model():
+    """Return the shared embedding model, loading it on first use."""
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            stats["rss_mb_before_load"] = process_rss_mb()
+            start = time.perf_counter()
+
+            model, device = load_model()
+
+            stats["backend"] = config.EMBEDDING_BACKEND
+            stats["device"] = device
+            stats["load_seconds"] = round(time.perf_counter() - start, 3)
+            stats["rss_mb_after_load"] = process_rss_mb()
+            _model = model
+            if config.EMBEDDING_WARMUP:
+                warm_up()
+    return _model
+
+def is_loaded():
+    return _model is not None
+
+def warm_up():
+    """Run one tiny batch so the first real request does not pay for lazy kernel setup."""
+    start = time.perf_counter()
+    get_model().encode(["warm-up sentence"], batch_size=1)
+    stats["warmup_seconds"] = round(time.perf_counter() - start, 3)
+
+def encode(sentences, batch_size=None, convert_to_tensor=True):
+    """Encode a list of sentences in one batched, L2-normalized pass."""
+    tracing.count("sentences_encoded", len(sentences))
+    with tracing.span("embedding.encode", cat="embedding", sentences=len(sentences)):
+        return get_model().encode(
+            sentences,
+            batch_size=batch_size or config.EMBEDDING_BATCH_SIZE,
+            convert_to_tensor=convert_to_tensor,
+            normalize_embeddings=True,
+        )
+
+def embed_references(references, split=sent_tokenize, store=None):
+    """Return reference sentences and their embeddings, reusing the persistent store."""
+    store = store if store is not None else get_store()
+    return store.load_or_embed(
+        references,
+        split=split,
+        encode=lambda sentences: np.asarray(encode(sentences, convert_to_tensor=False), dtype=np.float32),
+    )
+
+def report():
+    """One-line summary of model load cost for logs."""
+    if not is_loaded():
+        return f"Embedding model not loaded yet | RSS: {process_rss_mb()} MB"
+    return (
+        f"Embedding model ({stats['backend']}) on {stats['device']}: loaded in {stats['load_seconds']}s | "
+        f"RSS {stats['rss_mb_before_load']} → {stats['rss_mb_after_load']} MB"
+    )
+
+def _measure_backend(backend, model_name, sentences, batch_size):
+    """Load `backend` in this (fresh) process and time encoding `sentences`; run by `compare_backends`."""
+    config.EMBEDDING_MODEL = model_name
+    before = process_rss_mb()
+    start = time.perf_counter()
+    model, _ = load_model(backend)
+    load_seconds = round(time.perf_counter() - start, 3)
+    model.encode(sentences[:batch_size], batch_size=batch_size)  # Warm-up
+
+    start = time.perf_counter()
+    vectors = model.encode(sentences, batch_size=batch_size, normalize_embeddings=True)
+    elapsed = time.perf_counter() - start
+    return {
+        "vectors": np.asarray(vectors, dtype=np.float32),
+        "load_seconds": load_seconds,
+        "sentences_per_sec": round(len(sentences) / elapsed, 2) if elapsed else None,
+        "rss_mb_added": round(process_rss_mb() - before, 1) if before is not None else None,
+    }
+
+def compare_backends(sentences, backend="onnx-int8", thresholds=(0.75, 0.8), batch_size=None):
+    """Encode `sentences` with PyTorch and with `backend` and compare throughput and accuracy.
+
+    Each backend runs in its own spawned process, so its load time and added
+    memory are not skewed by the other backend's libraries or model.
+    Accuracy is measured on the sentence-to-sentence cosine similarities the
+    checkers threshold: their largest and mean difference, and for every
+    threshold the share of sentence pairs on the same side of it in both.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+    if backend in ("onnx", "onnx-int8"):
+        import onnx_encoder
+
+        # Export here, not in the measured process
+        if not os.path.exists(os.path.join(onnx_encoder.model_dir(), onnx_encoder.SETTINGS_FILE)):
+            onnx_encoder.export_model()
+
+    report = {"sentences": len(sentences), "backend": backend}
+    embeddings = {}
+    context = multiprocessing.get_context("spawn")
+    for name in ("torch", backend):
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(_measure_backend, name, config.EMBEDDING_MODEL, sentences, batch_size).result()
+        embeddings[name] = result.pop("vectors")
+        for key, value in result.items():
+            report[f"{name}_{key}"] = value
+
+    reference, candidate = embeddings["torch"], embeddings[backend]
+    if report["torch_sentences_per_sec"] and report[f"{backend}_sentences_per_sec"]:
+        report["speedup"] = round(report[f"{backend}_sentences_per_sec"] / report["torch_sentences_per_sec"], 2)
+    report["min_self_similarity"] = round(float((reference * candidate).sum(axis=1).min()), 4)
+
+    pairs = np.triu_indices(len(sentences), k=1)
+    expected = (reference @ reference.T)[pairs]
+    actual = (candidate @ candidate.T)[pairs]
+    if len(expected):
+        diff = np.abs(expected - actual)
+        report["max_similarity_diff"] = round(float(diff.max()), 4)
+        report["mean_similarity_diff"] = round(float(diff.mean()), 4)
+        for threshold in thresholds:
+            report[f"same_decision_at_{threshold}"] = round(float(((expected > threshold) == (actual > threshold)).mean()), 4)
+        report["within_tolerance"] = report["max_similarity_diff"] <= config.EMBEDDING_ACCURACY_TOLERANCE
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the ONNX embedding model or compare a backend with PyTorch.")
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"], help="Backend to compare with PyTorch")
+    parser.add_argument("--file", help="Text file whose sentences are encoded (compare)")
+    parser.add_argument("--limit", type=int, default=2000, help="Compare at most this many sentences")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        from onnx_encoder import export_model
+
+        print(f"✅ ONNX model exported to {export_model()}")
+        return 0
+
+    if not args.file:
+        parser.error("compare needs --file")
+    with open(args.file, "r", encoding="utf-8") as f:
+        sentences = sent_tokenize(f.read())[: args.limit]
+    report = compare_backends(sentences, args.backend)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if report.get("within_tolerance") is False:
+        print(f"⚠️ Similarities differ from PyTorch by more than {config.EMBEDDING_ACCURACY_TOLERANCE}.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
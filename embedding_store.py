@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+import config
+from text_utils import content_hash
+
+INDEX_FILE = "index.sqlite3"
+VECTORS_FILE = "vectors.f32"
+
+def default_path():
+    """Store directory of the configured model and backend, so their vectors are never mixed."""
+    name = re.sub(r"[^\w.-]+", "_", f"{config.EMBEDDING_MODEL}-{config.EMBEDDING_BACKEND}")
+    return os.path.join(config.EMBEDDING_STORE_DIR, name)
+
+class EmbeddingStore:
+    """Persistent sentence-level embedding store for reference pages.
+
+    Vectors of all pages live in one append-only float32 file that is read
+    through a memory map; a SQLite index maps `(url, content_hash)` to the
+    page's sentences and its row range in that file. Lookups read only the
+    pages they ask for and new pages insert rows, so the cost of a check
+    follows the new data rather than everything stored so far.
+
+    Several threads and processes (e.g. batch workers) can share one
+    directory: writers take SQLite's write lock, derive the row offset from
+    the vector file's size, append and fsync their vectors and only then
+    commit the index rows. A crash before the commit loses that write (its
+    pages are embedded again later) and leaves unreferenced bytes at the end
+    of the file. Readers never map past the rows the index refers to, so
+    they ignore those bytes; they stay in the file until the next writer
+    truncates them.
+    """
+
+    def __init__(self, path=None, dim=None):
+        self.path = path or default_path()
+        os.makedirs(self.path, exist_ok=True)
+        self._index_path = os.path.join(self.path, INDEX_FILE)
+        self._vectors_path = os.path.join(self.path, VECTORS_FILE)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._vectors = None
+
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "url TEXT, content_hash TEXT, start INTEGER, count INTEGER, sentences TEXT, "
+                "PRIMARY KEY (url, content_hash))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.dim = self._stored_dim() or dim
+
+    def _conn(self):
+        # SQLite connections cannot be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._index_path, timeout=60, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _stored_dim(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _dimension(self):
+        # A store opened while empty learns its dimension once another writer has set it
+        if self.dim is None:
+            self.dim = self._stored_dim()
+        return self.dim
+
+    def _lookup(self, url, text):
+        return self._conn().execute(
+            "SELECT start, count, sentences FROM entries WHERE url = ? AND content_hash = ?", (url, content_hash(text))
+        ).fetchone()
+
+    def __contains__(self, reference):
+        return self._lookup(*reference) is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _rows(self, end):
+        """Memory map covering at least the first `end` rows (only committed rows are ever mapped)."""
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[0] < end:
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(end, self._dimension()))
+            return self._vectors
+
+    def _empty(self):
+        return np.empty((0, self._dimension() or 0), dtype=np.float32)
+
+    def get(self, url, text):
+        """Return `(sentences, vectors)` for a stored page, or None if it was never embedded.
+
+        The vectors are a read-only view into the memory-mapped file.
+        """
+        row = self._lookup(url, text)
+        if row is None:
+            return None
+        start, count, sentences = row[0], row[1], json.loads(row[2])
+        if not count:
+            return sentences, self._empty()
+        return sentences, self._rows(start + count)[start : start + count]
+
+    def add_many(self, pages):
+        """Append `(url, text, sentences, vectors)` pages in one transaction; pages stored meanwhile by another writer are skipped."""
+        pages = [(url, text, list(sentences), np.ascontiguousarray(vectors, dtype=np.float32)) for url, text, sentences, vectors in pages]
+        if not pages:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # Serializes writers across threads and processes
+        try:
+            dim = self._stored_dim()
+            if dim is None:
+                dim = next((int(vectors.shape[1]) for *_, vectors in pages if len(vectors)), self.dim)
+                if dim is None:
+                    raise ValueError("Cannot size the store before the first vectors arrive")
+                conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(dim),))
+            self.dim = dim
+
+            new = {}
+            for url, text, sentences, vectors in pages:
+                if len(vectors) and vectors.shape[1] != dim:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {dim}")
+                if self._lookup(url, text) is None:
+                    new[(url, content_hash(text))] = (sentences, vectors)
+
+            row_bytes = dim * 4
+            mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+            with open(self._vectors_path, mode) as f:
+                start = os.fstat(f.fileno()).st_size // row_bytes
+                f.truncate(start * row_bytes)  # Drop a partial write left by a crash
+                f.seek(start * row_bytes)
+                rows = []
+                for (url, digest), (sentences, vectors) in new.items():
+                    f.write(vectors.tobytes())
+                    rows.append((url, digest, start, len(vectors), json.dumps(sentences)))
+                    start += len(vectors)
+                f.flush()
+                os.fsync(f.fileno())
+            conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add(self, url, text, sentences, vectors):
+        """Append one page's sentence vectors to the store."""
+        self.add_many([(url, text, sentences, vectors)])
+
+    def load_or_embed(self, references, split, encode):
+        """Return sentences and vectors for `(url, text)` references, embedding only unseen pages.
+
+        `split` turns a text into sentences and `encode` turns a list of
+        sentences into an `(n, dim)` array. All new pages are encoded in one
+        batch and persisted before returning. A single stored page comes back
+        as a view of the memory map; otherwise the pages are copied once into
+        the returned matrix.
+        """
+        references = list(references)
+        found = {}
+        pending = []
+        for url, text in references:
+            if (url, text) in found:
+                continue
+            hit = self.get(url, text)
+            if hit is not None:
+                found[(url, text)] = hit
+            else:
+                found[(url, text)] = None
+                pending.append((url, text, split(text)))
+
+        if pending:
+            new_sentences = [s for _, _, sentences in pending for s in sentences]
+            new_vectors = np.asarray(encode(new_sentences), dtype=np.float32) if new_sentences else None
+            pages = []
+            offset = 0
+            for url, text, sentences in pending:
+                vectors = new_vectors[offset : offset + len(sentences)] if sentences else self._empty()
+                offset += len(sentences)
+                found[(url, text)] = (sentences, vectors)
+                pages.append((url, text, sentences, vectors))
+            if self._dimension() is not None or new_vectors is not None:
+                self.add_many(pages)
+
+        all_sentences = []
+        blocks = []
+        for url, text in references:
+            sentences, vectors = found[(url, text)]
+            all_sentences.extend(sentences)
+            if len(sentences):
+                blocks.append(vectors)
+
+        if len(blocks) == 1:
+            return all_sentences, blocks[0]
+        matrix = np.empty((len(all_sentences), self._dimension() or 0), dtype=np.float32)
+        offset = 0
+        for vectors in blocks:
+            matrix[offset : offset + len(vectors)] = vectors
+            offset += len(vectors)
+        return all_sentences, matrix
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path=None):
+    """The store of this process for `path` (default: see `default_path`), opened on first use."""
+    path = path or default_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path)
+        return _stores[path]
@@ -1,11 +1,12 @@
-from pymongo import MongoClient
 import os
+from datetime import datetime
 from docx import Document
+import config
+import incremental
+import tracing
+from text_utils import content_hash, sent_tokenize
 
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-documents_collection = db["documents"]
+documents_collection = config.get_collection("documents")
 
 def read_text_file(file_path):
     """Read text from a .txt file."""
@@ -25,29 +26,99 @@ def read_docx_file(file_path):
         print(f"❌ Error reading DOCX file: {e}")
         return None
 
+def read_html_file(file_path):
+    """Read paragraph text from a saved .html page."""
+    try:
+        from bs4 import BeautifulSoup
+
+        with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+            soup = BeautifulSoup(file.read(), "html.parser")
+        paragraphs = [p.get_text() for p in soup.find_all("p") if p.get_text().strip()]
+        return "\n".join(paragraphs) if paragraphs else soup.get_text("\n")
+    except Exception as e:
+        print(f"❌ Error reading HTML file: {e}")
+        return None
+
+@tracing.traced()
 def process_file(file_path):
     """Determine file type, extract text, and store it in MongoDB."""
+    return store_file(file_path)[0]
+
+def find_previous_version(text, path, owner=None, parent_id=None):
+    """The stored document `text` is a new version of, or None.
+
+    An explicit `parent_id` always wins. Otherwise the latest document
+    uploaded from the same full path (and by the same owner, when known)
+    is a candidate, and only becomes the previous version if at least
+    `VERSION_MIN_OVERLAP` of the new sentences are unchanged from it.
+    Files that merely share a name are never chained.
+    """
+    fields = {"_id": 1, "version": 1}
+    if parent_id is not None:
+        return documents_collection.find_one({"_id": parent_id}, fields)
+
+    query = {"path": path}
+    if owner is not None:
+        query["owner"] = owner
+    candidate = documents_collection.find_one(query, {**fields, "content": 1}, sort=[("_id", -1)])
+    if not candidate or not candidate.get("content"):
+        return None
+    new_sentences = sent_tokenize(text)
+    alignment = incremental.align_sentences(sent_tokenize(candidate["content"]), new_sentences)
+    unchanged = sum(1 for old in alignment if old is not None)
+    if not new_sentences or unchanged / len(new_sentences) < config.VERSION_MIN_OVERLAP:
+        return None
+    return candidate
+
+def store_file(file_path, owner=None, parent_id=None):
+    """Like process_file, but returns `(message, document_id)`.
+
+    The id is that of the newly stored document, or of the identical
+    document uploaded before from the same path by the same owner; it is
+    None when nothing was read. Identical files from other paths or owners
+    are stored as documents of their own.
+    The document is stored as a new version of `parent_id`, or of an
+    earlier upload from the same path (see `find_previous_version`).
+    """
     if not os.path.exists(file_path):
-        return "❌ Error: File not found!"
+        return "❌ Error: File not found!", None
 
     # Check file type and extract content
     file_extension = os.path.splitext(file_path)[1].lower()
     extractors = {".txt": read_text_file, ".docx": read_docx_file}
     
     if file_extension not in extractors:
-        return "❌ Unsupported file format. Use .txt or .docx"
+        return "❌ Unsupported file format. Use .txt or .docx", None
 
     text = extractors[file_extension](file_path)
     if not text or not text.strip():
-        return "⚠️ Warning: File is empty or contains no readable text."
+        return "⚠️ Warning: File is empty or contains no readable text.", None
+
+    # A re-upload of the same file is found by the indexed hash instead of comparing full texts
+    digest = content_hash(text)
+    filename = os.path.basename(file_path)
+    path = os.path.abspath(file_path)
+    existing = documents_collection.find_one({"content_hash": digest, "path": path, "owner": owner}, {"_id": 1})
+    if existing:
+        return "ℹ️ Info: This document is already stored in the database.", existing["_id"]
 
-    # Check if content already exists
-    if documents_collection.find_one({"content": text}):
-        return "ℹ️ Info: This document is already stored in the database."
+    previous = find_previous_version(text, path, owner, parent_id)
+    record = {
+        "content": text,
+        "content_hash": digest,
+        "filename": filename,
+        "path": path,
+        "owner": owner,
+        "version": previous.get("version", 1) + 1 if previous else 1,
+        "previous_id": previous["_id"] if previous else None,
+        "uploaded_at": datetime.utcnow(),
+    }
 
     # Store in MongoDB
     try:
-        documents_collection.insert_one({"content": text})
-        return "✅ File processed successfully!"
+        document_id = documents_collection.insert_one(record).inserted_id
+        if previous:
+            return f"✅ File processed successfully! Stored as version {record['version']} of {filename}.", document_id
+        return "✅ File processed successfully!", document_id
     except Exception as e:
-        return f"❌ Error inserting into MongoDB: {e}"
\ No newline at end of file
+        return f"❌ Error inserting into MongoDB: {e}", None
@@ -0,0 +1,50 @@
+import difflib
+
+def align_sentences(old_sentences, new_sentences):
+    """Map each unchanged sentence of the new version to its index in the old version.
+
+    Returns a list with, for every new sentence, the index of the identical
+    sentence in the previous version or None if it was added or edited.
+    """
+    matcher = difflib.SequenceMatcher(None, old_sentences, new_sentences, autojunk=False)
+    alignment = [None] * len(new_sentences)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                alignment[new_start + offset] = old_start + offset
+    return alignment
+
+def previous_result(collection, document):
+    """Latest stored result for the previous version of `document`, if there is one."""
+    previous_id = document.get("previous_id") if document else None
+    if previous_id is None:
+        return None
+    return collection.find_one({"document_id": previous_id}, sort=[("_id", -1)])
+
+def split_by_offsets(items, offsets):
+    """Split a flat list into per-sentence groups using `offsets` (len = sentences + 1)."""
+    return [items[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+def offsets_of(groups):
+    """Inverse of split_by_offsets: cumulative start offsets of each group."""
+    offsets = [0]
+    for group in groups:
+        offsets.append(offsets[-1] + len(group))
+    return offsets
+
+def match_counts(report):
+    """Matched pairs per sentence of a stored report.
+
+    Reports store them because a streamed report keeps at most
+    `STREAM_MAX_MATCHES` matches per sentence; older reports only have
+    their offsets.
+    """
+    if report.get("match_counts") is not None:
+        return report["match_counts"]
+    offsets = report["match_offsets"]
+    return [offsets[i + 1] - offsets[i] for i in range(len(offsets) - 1)]
+
+def summarize(alignment):
+    """Short note on how much of a revision could be reused."""
+    reused = sum(1 for old in alignment if old is not None)
+    return f"♻️ Reused {reused}/{len(alignment)} unchanged sentences from the previous version"
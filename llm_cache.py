@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import config
+import tracing
+
+def normalize(text):
+    """Collapse whitespace so trivially reformatted input maps to the same entry."""
+    return " ".join(text.split())
+
+class LLMCache:
+    """Persistent LLM response cache keyed by model, prompt template and normalized input.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    dropped once more than `max_entries` are stored. Hit/miss counters are
+    kept per process in `stats`.
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or config.LLM_CACHE_PATH
+        self.ttl = config.LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries = config.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        tracing.count(f"llm_cache_{name}")
+
+    @staticmethod
+    def key(model, template, text):
+        payload = "\x1f".join((model, template, normalize(text)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model, template, text):
+        """Return the cached reply, or None on a miss or an expired entry."""
+        return self.get_any(model, [template], text)
+
+    def get_any(self, model, templates, text):
+        """Return the reply cached under the first of `templates` that has a live entry, or None.
+
+        Lets per-sentence results produced by a single and by a batched prompt
+        share one lookup while each stays keyed by the prompt that produced it.
+        """
+        keys = [self.key(model, template, text) for template in templates]
+        now = time.time()
+        with self._conn() as conn:
+            rows = dict(
+                (row[0], row[1:]) for row in conn.execute(
+                    f"SELECT key, response, created_at FROM responses WHERE key IN ({', '.join('?' * len(keys))})", keys
+                )
+            )
+            key = next((key for key in keys if key in rows and now - rows[key][1] < self.ttl), None)
+            if key is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return rows[key][0]
+
+    def put(self, model, template, text, response):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (self.key(model, template, text), model, response, now, now),
+            )
+        self._count("writes")
+        with self._lock:
+            self._puts += 1
+            due = self._puts % 500 == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Delete expired entries, then the least recently used beyond `max_entries`."""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups * 100 if lookups else 0
+        return f"LLM cache: {self.stats['hits']} hits / {self.stats['misses']} misses ({rate:.0f}% hit rate)"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Shared cache instance, or None when caching is disabled in config."""
+    global _cache
+    if not config.LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
@@ -0,0 +1,131 @@
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import ollama
+import config
+import tracing
+from llm_cache import get_cache
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Shared Ollama client for `config.OLLAMA_HOST` (a local fake server in tests)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ollama.Client(host=config.OLLAMA_HOST) if config.OLLAMA_HOST else ollama.Client()
+        return _client
+
+def chat(prompt, model=None, response_format=None, options=None):
+    """Send a single-turn prompt and return the reply text."""
+    kwargs = {}
+    if response_format:
+        kwargs["format"] = response_format
+    if options:
+        kwargs["options"] = options
+    with tracing.span("llm.chat", cat="llm", model=model or config.LLM_MODEL, prompt_chars=len(prompt)):
+        response = get_client().chat(
+            model=model or config.LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs,
+        )
+    tracing.count("llm_calls")
+    tracing.count("llm_prompt_tokens", response.get("prompt_eval_count") or 0)
+    tracing.count("llm_completion_tokens", response.get("eval_count") or 0)
+    return response["message"]["content"]
+
+def cached_chat(template, text, model=None, use_cache=True, refresh=False, **kwargs):
+    """Fill `template` with `text` and chat, reusing a cached reply for the same input.
+
+    `use_cache=False` bypasses the cache entirely (e.g. sampling-based
+    rewrites); `refresh=True` skips the lookup but stores the new reply.
+    """
+    model = model or config.LLM_MODEL
+    cache = get_cache() if use_cache else None
+    if cache is not None and not refresh:
+        cached = cache.get(model, template, text)
+        if cached is not None:
+            return cached
+
+    reply = chat(template.format(text=text), model=model, **kwargs)
+    if cache is not None:
+        cache.put(model, template, text, reply)
+    return reply
+
+def parse_json(reply):
+    """Return the first JSON object (or else list) embedded in a reply, None if there is none."""
+    for pattern in (r"\{.*\}", r"\[.*\]"):
+        block = re.search(pattern, reply or "", re.DOTALL)
+        if block:
+            try:
+                return json.loads(block.group())
+            except ValueError:
+                continue
+    return None
+
+def chat_batch(items, template, parse, single, cache=None, what="request"):
+    """Answer a group of items with one prompt, falling back to `single(item)` for gaps.
+
+    `template` is filled with the item `count` and the `numbered` items;
+    `parse(reply, count)` returns one answer per item, None where missing.
+    """
+    numbered = "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+    prompt = template.format(count=len(items), numbered=numbered)
+    try:
+        answers = parse(chat(prompt, response_format="json"), len(items))
+    except Exception as e:
+        print(f"⚠️ Batched {what} failed, sending sentences one by one: {e}")
+        answers = [None] * len(items)
+
+    results = []
+    for item, answer in zip(items, answers):
+        if answer is None:
+            results.append(single(item))
+            continue
+        if cache is not None:
+            # Stored per item (keyed by the batch prompt) so the answer is reused whatever batch the item lands in
+            cache.put(config.LLM_MODEL, template, item, str(answer))
+        results.append(answer)
+    return results
+
+def chat_many(items, single, batch, mode, batch_size, workers, cache=None, templates=(), parse_cached=None, cancel=None, what="request"):
+    """Answer items with per-item or batched prompts on a bounded pool of parallel requests.
+
+    Items with a reply cached under any of `templates` are answered from
+    `cache` (through `parse_cached`); only the rest are sent to the model.
+    Once the `cancel` event is set no new requests are started and
+    unanswered items stay None.
+    """
+    if mode not in ("single", "batch"):
+        raise ValueError(f"Unknown {what} mode: {mode}")
+
+    answers = [None] * len(items)
+    todo = []
+    for i, item in enumerate(items):
+        cached = cache.get_any(config.LLM_MODEL, templates, item) if cache is not None else None
+        if cached is not None:
+            answers[i] = parse_cached(cached) if parse_cached else cached
+        else:
+            todo.append(i)
+    if not todo:
+        return answers
+
+    if mode == "single":
+        groups = [[i] for i in todo]
+        work = lambda group: [single(items[group[0]])]
+    else:
+        groups = [todo[i : i + batch_size] for i in range(0, len(todo), batch_size)]
+        work = lambda group: batch([items[i] for i in group])
+
+    def run(group):
+        if cancel is not None and cancel.is_set():
+            return [None] * len(group)
+        return work(group)
+
+    with ThreadPoolExecutor(workers) as pool:
+        for group, group_answers in zip(groups, pool.map(run, groups)):
+            for i, answer in zip(group, group_answers):
+                answers[i] = answer
+    return answers
@@ -0,0 +1,426 @@
+"""Offline reference corpus: ingest local files and prior submissions, retrieve candidates with BM25.
+
+Usage:
+    python local_corpus.py ingest corpus/ --workers 8
+    python local_corpus.py ingest --documents
+    python local_corpus.py stats
+
+Texts are split into sentence-segmented passages and spread over SQLite
+shards (`LOCAL_CORPUS_DIR/shard-NN.sqlite3`), each holding its passages and
+an inverted index of term frequencies. Every shard is written by a single
+worker process, so ingestion runs in parallel without lock contention, and
+each file is committed on its own: re-running an interrupted ingestion skips
+files that are already indexed with the same size and modification time.
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+import config
+
+SUPPORTED_EXTENSIONS = (".txt", ".docx", ".html", ".htm")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text):
+    """Lowercase word terms used by the inverted index (stopwords and single characters dropped)."""
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def shard_of(key, shards=None):
+    """Stable shard number of a file path or document key."""
+    return zlib.crc32(key.encode("utf-8")) % (shards or config.LOCAL_CORPUS_SHARDS)
+
+def shard_path(shard, corpus_dir=None):
+    return os.path.join(corpus_dir or config.LOCAL_CORPUS_DIR, f"shard-{shard:02d}.sqlite3")
+
+def open_shard(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sources ("
+        "source TEXT PRIMARY KEY, size INTEGER, mtime REAL, passages INTEGER, ingested_at TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS passages ("
+        "id INTEGER PRIMARY KEY, source TEXT, position INTEGER, text TEXT, length INTEGER)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS passages_source ON passages (source)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS postings ("
+        "term TEXT, passage INTEGER, tf INTEGER, PRIMARY KEY (term, passage)) WITHOUT ROWID"
+    )
+    return conn
+
+def split_passages(text, size=None):
+    """Sentence-segment a text and group the sentences into passages of `size` sentences."""
+    from text_utils import sent_tokenize
+
+    size = size or config.LOCAL_PASSAGE_SENTENCES
+    sentences = [s.strip() for s in sent_tokenize(text) if s.strip()]
+    return [" ".join(sentences[i : i + size]) for i in range(0, len(sentences), size)]
+
+def read_source(path):
+    """Text of a corpus file, by extension."""
+    import file_reader
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        return file_reader.read_docx_file(path)
+    if extension in (".html", ".htm"):
+        return file_reader.read_html_file(path)
+    return file_reader.read_text_file(path)
+
+def index_text(conn, source, text, size=0, mtime=0.0):
+    """Replace the passages of `source` in a shard; returns the number of passages written."""
+    conn.execute("DELETE FROM postings WHERE passage IN (SELECT id FROM passages WHERE source = ?)", (source,))
+    conn.execute("DELETE FROM passages WHERE source = ?", (source,))
+
+    passages = split_passages(text) if text and text.strip() else []
+    for position, passage in enumerate(passages):
+        terms = Counter(tokenize(passage))
+        passage_id = conn.execute(
+            "INSERT INTO passages (source, position, text, length) VALUES (?, ?, ?, ?)",
+            (source, position, passage, sum(terms.values())),
+        ).lastrowid
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", [(term, passage_id, tf) for term, tf in terms.items()])
+
+    conn.execute(
+        "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+        (source, size, mtime, len(passages), datetime.utcnow().isoformat()),
+    )
+    return len(passages)
+
+def ingest_shard(shard, items, corpus_dir=None):
+    """Index one shard's work items: ("file", path) or ("text", key, text). Runs in a worker process.
+
+    Every item is committed on its own, so an interrupted run loses at most
+    the item in progress. Returns throughput counters for the shard.
+    """
+    start = time.perf_counter()
+    stats = {"shard": shard, "items": 0, "skipped": 0, "failed": 0, "bytes": 0, "passages": 0}
+    conn = open_shard(shard_path(shard, corpus_dir))
+    try:
+        for item in items:
+            if item[0] == "file":
+                source = os.path.abspath(item[1])
+                try:
+                    info = os.stat(source)
+                except OSError:
+                    stats["failed"] += 1
+                    continue
+                size, mtime = info.st_size, info.st_mtime
+                row = conn.execute("SELECT size, mtime FROM sources WHERE source = ?", (source,)).fetchone()
+                if row is not None and row[0] == size and row[1] == mtime:
+                    stats["skipped"] += 1
+                    continue
+                text = read_source(source)
+            else:
+                source, text = item[1], item[2]
+                size, mtime = len(text.encode("utf-8")), 0.0
+                if conn.execute("SELECT 1 FROM sources WHERE source = ? AND size = ?", (source, size)).fetchone():
+                    stats["skipped"] += 1
+                    continue
+
+            if text is None:
+                stats["failed"] += 1
+                continue
+            with conn:
+                stats["passages"] += index_text(conn, source, text, size, mtime)
+            stats["items"] += 1
+            stats["bytes"] += size
+    finally:
+        conn.close()
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+def collect_corpus_files(directory):
+    found = []
+    for root, _, files in os.walk(directory):
+        found.extend(os.path.join(root, name) for name in files if name.lower().endswith(SUPPORTED_EXTENSIONS))
+    return sorted(found)
+
+def document_items():
+    """Prior submissions from the `documents` collection as ("text", key, content) items."""
+    documents = config.get_collection("documents")
+    for doc in documents.find({}, {"content": 1}):
+        if doc.get("content"):
+            yield "text", f"documents/{doc['_id']}", doc["content"]
+
+def ingest(directory=None, include_documents=False, workers=None, corpus_dir=None):
+    """Ingest corpus files and/or prior submissions in parallel; returns a throughput summary."""
+    corpus_dir = corpus_dir or config.LOCAL_CORPUS_DIR
+    os.makedirs(corpus_dir, exist_ok=True)
+    shards = config.LOCAL_CORPUS_SHARDS
+
+    work = {shard: [] for shard in range(shards)}
+    if directory:
+        for path in collect_corpus_files(directory):
+            work[shard_of(os.path.abspath(path), shards)].append(("file", path))
+    if include_documents:
+        for item in document_items():
+            work[shard_of(item[1], shards)].append(item)
+    work = {shard: items for shard, items in work.items() if items}
+
+    workers = min(workers or config.LOCAL_CORPUS_WORKERS or os.cpu_count() or 1, max(len(work), 1))
+    total_items = sum(len(items) for items in work.values())
+    print(f"📚 Ingesting {total_items} items into {len(work)} shard(s) with {workers} worker(s)")
+
+    start = time.perf_counter()
+    summary = {"items": 0, "skipped": 0, "failed": 0, "bytes": 0, "passages": 0}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [pool.submit(ingest_shard, shard, items, corpus_dir) for shard, items in work.items()]
+        for future in as_completed(futures):
+            stats = future.result()
+            for key in summary:
+                summary[key] += stats[key]
+            print(
+                f"  shard {stats['shard']:02d}: {stats['items']} indexed, {stats['skipped']} unchanged, "
+                f"{stats['failed']} failed, {stats['passages']} passages in {stats['seconds']:.1f}s"
+            )
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = round(elapsed, 2)
+    summary["mb_per_second"] = round(summary["bytes"] / 2**20 / elapsed, 2) if elapsed else 0
+    summary["items_per_second"] = round(summary["items"] / elapsed, 2) if elapsed else 0
+    summary["passages_per_second"] = round(summary["passages"] / elapsed, 2) if elapsed else 0
+    return summary
+
+def existing_shards(corpus_dir=None):
+    corpus_dir = corpus_dir or config.LOCAL_CORPUS_DIR
+    if not os.path.isdir(corpus_dir):
+        return []
+    return sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir) if re.fullmatch(r"shard-\d+\.sqlite3", name))
+
+def corpus_stats(corpus_dir=None):
+    """Sources, passages and total passage length over all shards."""
+    totals = {"shards": 0, "sources": 0, "passages": 0, "terms": 0}
+    for path in existing_shards(corpus_dir):
+        conn = sqlite3.connect(path)
+        try:
+            totals["shards"] += 1
+            totals["sources"] += conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+            passages, terms = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM passages").fetchone()
+            totals["passages"] += passages
+            totals["terms"] += terms
+        finally:
+            conn.close()
+    return totals
+
+def _in_chunks(conn, query, values, size=500):
+    """Run `query` (with one `{marks}` placeholder list) over `values` in chunks, yielding rows."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        chunk = values[start : start + size]
+        yield from conn.execute(query.format(marks=",".join("?" * len(chunk))), chunk)
+
+def _shard_stats(path, terms):
+    """Passage count, total length and document frequency of `terms` in one shard.
+
+    Frequencies are counted by SQLite on the postings index, so common terms
+    cost no rows in Python.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        passages, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM passages").fetchone()
+        df = dict(_in_chunks(conn, "SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", terms))
+        return {"path": path, "passages": passages, "length": total_length, "df": df}
+    finally:
+        conn.close()
+
+def _shard_postings(path, terms, exclude_sources=()):
+    """Postings of `terms` (already filtered by document frequency) and excluded passage ids of one shard."""
+    conn = sqlite3.connect(path)
+    try:
+        excluded = set()
+        for source in exclude_sources:
+            excluded.update(row[0] for row in conn.execute("SELECT id FROM passages WHERE source = ?", (source,)))
+        postings = {}
+        for term, passage, tf in _in_chunks(conn, "SELECT term, passage, tf FROM postings WHERE term IN ({marks})", terms):
+            postings.setdefault(term, []).append((passage, tf))
+        return {"postings": postings, "excluded": excluded}
+    finally:
+        conn.close()
+
+def _passage_rows(path, ids, columns="id, length"):
+    conn = sqlite3.connect(path)
+    try:
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(f"SELECT {columns} FROM passages WHERE id IN ({marks})", chunk))
+        return rows
+    finally:
+        conn.close()
+
+def search(sentences, top_k=None, max_candidates=None, exclude_sources=(), corpus_dir=None):
+    """Retrieve candidate reference passages for a document's sentences with BM25.
+
+    Each sentence is scored against every passage that shares a term with
+    it; the `top_k` best passages per sentence are pooled and the
+    `max_candidates` best overall returned as `{"url", "content", "score"}`.
+    Document frequencies and lengths are summed over all shards, so scores
+    do not depend on how the corpus was sharded.
+    """
+    top_k = top_k or config.LOCAL_TOP_K
+    max_candidates = max_candidates or config.LOCAL_MAX_CANDIDATES
+    sentence_terms = [set(tokenize(sentence)) for sentence in sentences]
+    all_terms = set().union(*sentence_terms) if sentence_terms else set()
+    paths = existing_shards(corpus_dir)
+    if not all_terms or not paths:
+        return []
+
+    with ThreadPoolExecutor(min(len(paths), 8)) as pool:
+        shards = list(pool.map(lambda path: _shard_stats(path, all_terms), paths))
+
+    total_passages = sum(shard["passages"] for shard in shards)
+    if not total_passages:
+        return []
+    avg_length = sum(shard["length"] for shard in shards) / total_passages
+    df = Counter()
+    for shard in shards:
+        df.update(shard["df"])
+    # Near-stopwords are too common to discriminate and their postings dominate the cost,
+    # so they are dropped before any posting is read; small corpora keep every term
+    max_df = max(config.LOCAL_MAX_DF * total_passages, 100)
+    idf = {term: math.log(1 + (total_passages - n + 0.5) / (n + 0.5)) for term, n in df.items() if n <= max_df}
+    if not idf:
+        return []
+
+    with ThreadPoolExecutor(min(len(paths), 8)) as pool:
+        for shard, found in zip(shards, pool.map(lambda shard: _shard_postings(shard["path"], [t for t in idf if t in shard["df"]], exclude_sources), shards)):
+            shard.update(found)
+
+    best = {}
+    for shard_number, shard in enumerate(shards):
+        candidate_ids = {passage for term, postings in shard["postings"].items() if term in idf for passage, _ in postings}
+        lengths = dict(_passage_rows(shard["path"], candidate_ids))
+        for terms in sentence_terms:
+            scores = Counter()
+            for term in terms:
+                if term not in idf:
+                    continue
+                for passage, tf in shard["postings"].get(term, ()):
+                    if passage in shard["excluded"]:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(passage, avg_length) / avg_length)
+                    scores[passage] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            for passage, score in scores.most_common(top_k):
+                key = (shard_number, passage)
+                best[key] = max(best.get(key, 0.0), score)
+
+    ranked = sorted(best.items(), key=lambda item: -item[1])[:max_candidates]
+    by_shard = {}
+    for (shard_number, passage), score in ranked:
+        by_shard.setdefault(shard_number, {})[passage] = score
+
+    candidates = []
+    for shard_number, scores in by_shard.items():
+        rows = _passage_rows(shards[shard_number]["path"], scores, "id, source, position, text")
+        for passage, source, position, text in rows:
+            candidates.append({"url": f"local://{source}#{position}", "content": text, "score": round(scores[passage], 4)})
+    candidates.sort(key=lambda c: -c["score"])
+    return candidates
+
+def own_sources(document):
+    """Corpus keys of a submission and its earlier versions, which must not count as its references.
+
+    Versions are linked only through an explicit parent or the same upload
+    path with mostly unchanged sentences (see `file_reader.find_previous_version`),
+    so another student's file with the same name is never excluded.
+    """
+    documents = config.get_collection("documents")
+    sources = []
+    while document is not None and len(sources) < 100:
+        sources.append(f"documents/{document['_id']}")
+        previous_id = document.get("previous_id")
+        document = documents.find_one({"_id": previous_id}, {"previous_id": 1}) if previous_id is not None else None
+    return sources
+
+def store_local_references(document_id=None, on_page=None, cancel=None, skip_urls=()):
+    """Retrieve candidate passages for a document from the local corpus and store them in `websave`.
+
+    Rows use the same layout as scraped pages, so the plagiarism check and
+    remover read them unchanged; `on_page` receives each stored record.
+    Passages in `skip_urls` (already stored for the document) are left out.
+    """
+    from preprocessing import document_sentences
+    from storage import BulkWriter, pack_text
+
+    document_id = config.resolve_document_id(document_id)
+    document = config.get_collection("documents").find_one({"_id": document_id})
+    if not document or not document.get("content"):
+        return "⚠️ No document found for the local corpus search.", 0
+    if not existing_shards():
+        return f"⚠️ Local corpus is empty; run `python local_corpus.py ingest` first ({config.LOCAL_CORPUS_DIR}).", 0
+
+    start = time.perf_counter()
+    candidates = search(document_sentences(document), exclude_sources=own_sources(document))
+    print(f"📚 Local corpus: {len(candidates)} candidate passages in {time.perf_counter() - start:.2f}s")
+
+    stored = 0
+    with BulkWriter(config.get_collection("websave")) as writer:
+        for candidate in candidates:
+            if cancel is not None and cancel.is_set():
+                break
+            if candidate["url"] in skip_urls:
+                continue
+            writer.insert({
+                "topic": "local corpus",
+                "topics": ["local corpus"],
+                "url": candidate["url"],
+                **pack_text(candidate["content"]),
+                "document_id": document_id,
+                "created_at": datetime.utcnow(),
+                "source": "local",
+                "score": candidate["score"],
+            })
+            stored += 1
+            if on_page is not None:
+                on_page({"url": candidate["url"], "content": candidate["content"]})
+
+    if stored:
+        return f"✅ {stored} local corpus passages stored in MongoDB (websave collection).", stored
+    return "⚠️ No matching passages in the local corpus.", 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect the offline reference corpus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Index a directory of .txt/.docx/.html files and/or prior submissions")
+    ingest_parser.add_argument("directory", nargs="?", help="Directory of corpus files")
+    ingest_parser.add_argument("--documents", action="store_true", help="Also index every document stored in MongoDB")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Parallel ingestion processes")
+    commands.add_parser("stats", help="Show corpus size")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(f"📊 {corpus_stats()}")
+        return 0
+
+    if not args.directory and not args.documents:
+        parser.error("give a directory, --documents, or both")
+    summary = ingest(args.directory, args.documents, args.workers)
+    print(
+        f"📊 {summary['items']} indexed, {summary['skipped']} unchanged, {summary['failed']} failed: "
+        f"{summary['passages']} passages in {summary['seconds']}s "
+        f"({summary['mb_per_second']} MB/s, {summary['items_per_second']} files/s, {summary['passages_per_second']} passages/s)"
+    )
+    return 0 if not summary["failed"] else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
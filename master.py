@@ -1,25 +1,31 @@
+import time
+_startup_begin = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, ttk
 import threading
-import file_reader
-import document_analyzer
-import web_search
-import plagiarism_checker
-import ai_checker
-import plagiarism_remover
-from pymongo import MongoClient
-
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
+import config
+import embedding_service
+import llm_cache
+import tracing
 
 # GUI Setup
 root = tk.Tk()
 root.title("Plagiarism Remover")
 root.geometry("800x600")
 
-# Global flag for canceling process
-cancel_process = False
+# Scheduler of the running pipeline; cancel_pipeline() sets its cancel event
+current_scheduler = None
+
+STAGE_TITLES = {
+    "file": "Step 1: Processing the file",
+    "preprocess": "Step 1b: Splitting sentences",
+    "topics": "Step 2: Analyzing document",
+    "web": "Step 3: Performing web search",
+    "plagiarism": "Step 4: Checking for plagiarism",
+    "ai": "Step 5: Checking for AI-generated content",
+    "removal": "Step 6: Removing plagiarism",
+}
 
 def select_file():
     file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("Word Documents", "*.docx")])
@@ -28,89 +34,94 @@ def select_file():
         entry_file_path.insert(0, file_path)
 
 def log_message(message):
+    # Stages log from worker threads; Tk widgets may only be touched from the main loop
+    if threading.current_thread() is not threading.main_thread():
+        root.after(0, log_message, message)
+        return
     text_output.insert(tk.END, message + "\n")
     text_output.yview(tk.END)
 
+def ask_on_main_thread(title, message):
+    """Show a yes/no dialog from a worker thread and wait for the answer."""
+    answer = {}
+    done = threading.Event()
+
+    def ask():
+        answer["value"] = messagebox.askyesno(title, message)
+        done.set()
+
+    root.after(0, ask)
+    done.wait()
+    return answer["value"]
+
+def on_stage_event(stage, status, detail):
+    title = STAGE_TITLES.get(stage, stage)
+    if status == "started":
+        log_message(f"\n📌 {title}...")
+    elif status == "progress":
+        percentage, seen = detail
+        log_message(f"⏳ Provisional plagiarism: {percentage:.2f}% after {seen} references")
+    elif status == "skipped":
+        log_message(f"⏭️ {title}: skipped")
+    elif status == "failed":
+        log_message(f"❌ {title} failed: {detail}")
+    elif status == "canceled":
+        log_message(f"❌ {title}: canceled")
+    elif detail is not None:
+        log_message(str(detail))
+
+    if status == "done" and stage == "plagiarism":
+        log_message(f"🧠 {embedding_service.report()}")
+    if status == "done" and stage == "ai" and llm_cache.get_cache() is not None:
+        log_message(f"🗃️ {llm_cache.get_cache().report()}")
+
 def process_pipeline():
-    global cancel_process
-    cancel_process = False
+    global current_scheduler
+    file_path = entry_file_path.get().strip()
+
+    if not file_path:
+        messagebox.showerror("Error", "Please select a file first!")
+        return
+
+    # Pipeline modules (torch, sklearn, NLTK) are imported on first run so the window opens instantly
+    import pipeline
+
+    def confirm_removal(plagiarism_result, ai_result):
+        return ask_on_main_thread("Plagiarism Detected",
+            f"Plagiarism: {plagiarism_result}% | AI Content: {ai_result}%\nDo you want to remove plagiarism?")
+
+    scheduler = pipeline.build_document_pipeline(file_path, confirm_removal=confirm_removal, on_event=on_stage_event)
+    current_scheduler = scheduler
     progress_bar.start()
 
     def run_pipeline():
-        global cancel_process
-        file_path = entry_file_path.get().strip()
-        
-        if not file_path:
-            messagebox.showerror("Error", "Please select a file first!")
-            progress_bar.stop()
-            return
-        
-        log_message("\n📌 Step 1: Processing the file...")
-        file_result = file_reader.process_file(file_path)
-        log_message(file_result)
-        
-        if cancel_process:
+        start = time.perf_counter()
+        status = scheduler.run()
+        root.after(0, progress_bar.stop)
+        log_message(f"⏱️ {scheduler.timing_report()} | total {time.perf_counter() - start:.2f}s")
+        log_message(f"🗄️ {config.round_trips.report()}")
+        if config.TRACE_ENABLED:
+            log_message(f"🔬 {tracing.report()}")
+            log_message(f"🔬 Trace written to {tracing.flush()}")
+        if scheduler.cancel.is_set():
             log_message("❌ Process canceled.")
-            progress_bar.stop()
-            return
-        
-        if "✅" in file_result:
-            log_message("\n📌 Step 2: Analyzing document...")
-            analysis_result = document_analyzer.process_document()
-            log_message(analysis_result)
-            
-            if cancel_process:
-                log_message("❌ Process canceled.")
-                progress_bar.stop()
-                return
-            
-            if "✅" in analysis_result:
-                log_message("\n📌 Step 3: Performing web search...")
-                web_result = web_search.fetch_and_store_web_results()
-                log_message(web_result)
-                
-                if cancel_process:
-                    log_message("❌ Process canceled.")
-                    progress_bar.stop()
-                    return
-                
-                if "✅" in web_result:
-                    log_message("\n📌 Step 4: Checking for plagiarism...")
-                    plagiarism_result = plagiarism_checker.process_plagiarism_check()
-                    log_message(plagiarism_result)
-                    
-                    log_message("\n📌 Step 5: Checking for AI-generated content...")
-                    ai_result = ai_checker.process_ai_detection()
-                    log_message(ai_result)
-                    
-                    if cancel_process:
-                        log_message("❌ Process canceled.")
-                        progress_bar.stop()
-                        return
-                    
-                    user_input = messagebox.askyesno("Plagiarism Detected", 
-                        f"Plagiarism: {plagiarism_result}% | AI Content: {ai_result}%\nDo you want to remove plagiarism?")
-                    
-                    if user_input:
-                        log_message("\n📌 Step 6: Removing plagiarism...")
-                        plagiarism_removed = plagiarism_remover.process_plagiarism_removal()
-                        log_message(plagiarism_removed)
-                    else:
-                        log_message("📌 Plagiarism removal skipped.")
-        
-        progress_bar.stop()
-        log_message("✔️ Process completed successfully!")
-    
+        elif "failed" in status.values():
+            log_message("⚠️ Process finished with errors.")
+        else:
+            log_message("✔️ Process completed successfully!")
+
     threading.Thread(target=run_pipeline, daemon=True).start()
 
 def cancel_pipeline():
-    global cancel_process
-    cancel_process = True
+    if current_scheduler is not None:
+        current_scheduler.cancel.set()
     log_message("⚠️ Canceling process...")
 
 def show_rewritten_content():
     log_message("\n📌 Fetching rewritten content...")
-    result = db["plagrem"].find_one()
+    # Rewrite of the document processed last (or of the newest upload)
+    document_id = getattr(current_scheduler, "document_id", None)
+    result = config.get_collection("plagrem").find_one({"document_id": config.resolve_document_id(document_id)}, sort=[("_id", -1)])
     
     if result and "rewritten_content" in result:
         text_output.insert(tk.END, "\n📜 Rewritten Content:\n" + result["rewritten_content"] + "\n")
@@ -118,9 +129,9 @@ def show_rewritten_content():
         text_output.insert(tk.END, "\n❌ No rewritten content found!\n")
 
 def reset_database():
-    collections = ["algenrel", "documents", "plagiarism_reports", "plagrem", "web_results"]
+    collections = ["aigenrel", "documents", "plagiarism_reports", "plagrem", "web_results", "websave"]
     for collection in collections:
-        db[collection].delete_many({})
+        config.get_collection(collection).delete_many({})
     
     messagebox.showinfo("Reset", "Database cleared successfully!")
     log_message("\n🗑️ All collections cleared. Ready for a new check.")
@@ -144,4 +155,12 @@ progress_bar.pack(pady=10)
 text_output = scrolledtext.ScrolledText(root, height=20, width=90)
 text_output.pack(pady=10)
 
+def report_startup():
+    startup_ms = (time.perf_counter() - _startup_begin) * 1000
+    log_message(f"🕒 Startup: {startup_ms:.0f} ms | RSS: {embedding_service.process_rss_mb()} MB")
+    if config.EMBEDDING_WARMUP:
+        # Load and warm the shared model in the background while the user picks a file
+        threading.Thread(target=embedding_service.get_model, daemon=True).start()
+
+root.after(0, report_startup)
 root.mainloop()
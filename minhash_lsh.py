@@ -0,0 +1,109 @@
+import zlib
+import numpy as np
+
+# Prime just above 2**32 so (a * x + b) stays inside uint64 for 32-bit shingle hashes
+_PRIME = np.uint64(4294967311)
+
+def char_ngrams(text, n=3):
+    """Return the set of character n-grams of a sentence."""
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+def jaccard(set1, set2):
+    """Jaccard similarity of two shingle sets (0 when both are empty)."""
+    union = len(set1 | set2)
+    return len(set1 & set2) / union if union else 0
+
+def candidate_probability(similarity, bands, rows):
+    """Probability that two sentences with the given Jaccard similarity share an LSH bucket."""
+    return 1 - (1 - similarity ** rows) ** bands
+
+class MinHashLSH:
+    """MinHash signatures with a banded locality-sensitive hashing index.
+
+    With `bands * rows` hash permutations, pairs at Jaccard similarity `s`
+    become candidates with probability `1 - (1 - s**rows) ** bands`; more
+    bands (or fewer rows) raise recall at the cost of more exact checks.
+    """
+
+    def __init__(self, bands=16, rows=8, n=3, seed=42):
+        self.bands = bands
+        self.rows = rows
+        self.n = n
+        rng = np.random.default_rng(seed)
+        num_perm = bands * rows
+        self._a = rng.integers(1, 2**31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**31, size=num_perm, dtype=np.uint64)
+        self._buckets = {}
+        self.shingles = []
+
+    def signature(self, shingles):
+        """Compute the MinHash signature of a shingle set."""
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def add_all(self, sentences):
+        """Index reference sentences; ids are their positions in insertion order."""
+        for sentence in sentences:
+            idx = len(self.shingles)
+            shingles = char_ngrams(sentence, self.n)
+            self.shingles.append(shingles)
+            if not shingles:
+                continue  # Too short to ever match
+            for key in self._band_keys(self.signature(shingles)):
+                self._buckets.setdefault(key, []).append(idx)
+        return self
+
+    def candidates(self, sentence):
+        """Return ids of indexed sentences sharing at least one band with `sentence`."""
+        shingles = char_ngrams(sentence, self.n)
+        if not shingles:
+            return set()
+        found = set()
+        for key in self._band_keys(self.signature(shingles)):
+            found.update(self._buckets.get(key, ()))
+        return found
+
+    def query(self, sentence, threshold):
+        """Return ids of indexed sentences whose exact Jaccard similarity exceeds `threshold`."""
+        shingles = char_ngrams(sentence, self.n)
+        return {idx for idx in self.candidates(sentence) if jaccard(shingles, self.shingles[idx]) > threshold}
+
+def brute_force_matches(original_sentences, ref_sentences, threshold, n=3):
+    """Exact n-gram Jaccard matches for every pair, used as the recall baseline."""
+    ref_shingles = [char_ngrams(ref, n) for ref in ref_sentences]
+    hits = []
+    for sentence in original_sentences:
+        shingles = char_ngrams(sentence, n)
+        hits.append({j for j, ref in enumerate(ref_shingles) if jaccard(shingles, ref) > threshold})
+    return hits
+
+def measure_recall(original_sentences, ref_sentences, threshold, bands=16, rows=8):
+    """Compare LSH matches with the brute-force baseline.
+
+    Returns a dict with recall, the number of exact pairs found by each path
+    and how many candidate pairs LSH had to verify.
+    """
+    index = MinHashLSH(bands=bands, rows=rows).add_all(ref_sentences)
+    expected = brute_force_matches(original_sentences, ref_sentences, threshold)
+
+    found = 0
+    total = 0
+    candidates_checked = 0
+    for sentence, truth in zip(original_sentences, expected):
+        candidates = index.candidates(sentence)
+        candidates_checked += len(candidates)
+        total += len(truth)
+        found += len(truth & candidates)
+
+    return {
+        "recall": found / total if total else 1.0,
+        "expected_pairs": total,
+        "found_pairs": found,
+        "candidates_checked": candidates_checked,
+        "brute_force_pairs": len(original_sentences) * len(ref_sentences),
+    }
@@ -0,0 +1,148 @@
+"""ONNX Runtime backend for the sentence embedding model (fp32 or dynamic int8).
+
+The transformer of the SentenceTransformer checkpoint is exported once to
+`config.ONNX_MODEL_DIR/<model>/` together with its tokenizer and pooling
+settings, and an int8 copy is made with dynamic quantization. Later runs
+load only ONNX Runtime and the tokenizer, not the PyTorch model.
+"""
+import inspect
+import json
+import os
+import re
+import numpy as np
+import config
+
+MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model.int8.onnx"
+SETTINGS_FILE = "encoder.json"
+
+def model_dir(model_name=None):
+    """Directory holding the exported files of `model_name`."""
+    return os.path.join(config.ONNX_MODEL_DIR, re.sub(r"[^\w.-]+", "_", model_name or config.EMBEDDING_MODEL))
+
+def export_model(model_name=None, directory=None):
+    """Export a SentenceTransformer's transformer to ONNX (dynamic batch and sequence axes) plus an int8 copy."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_name = model_name or config.EMBEDDING_MODEL
+    directory = directory or model_dir(model_name)
+    os.makedirs(directory, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = next((module for module in model if hasattr(module, "get_pooling_mode_str")), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else "mean"
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode for the ONNX backend: {pooling_mode}")
+
+    sample = model.tokenizer(["an example sentence to trace the graph"], return_tensors="pt")
+    inputs = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class Transformer(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *tensors):
+            return self.auto_model(**dict(zip(inputs, tensors)))[0]
+
+    axes = {0: "batch", 1: "sequence"}
+    path = os.path.join(directory, MODEL_FILE)
+    # torch >= 2.5 can export through dynamo; keep the TorchScript exporter, whose
+    # dynamic axes this relies on. Older versions do not accept the argument.
+    export_options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            Transformer(model[0].auto_model.eval()),
+            tuple(sample[name] for name in inputs),
+            path,
+            input_names=inputs,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: axes for name in inputs + ["last_hidden_state"]},
+            opset_version=14,
+            **export_options,
+        )
+    quantize_dynamic(path, os.path.join(directory, INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+    model.tokenizer.save_pretrained(directory)
+
+    settings = {
+        "model": model_name,
+        "inputs": inputs,
+        "pooling": pooling_mode,
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(directory, SETTINGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    return directory
+
+class OnnxEncoder:
+    """Drop-in for `SentenceTransformer.encode` running the exported model on ONNX Runtime.
+
+    Sentences are tokenized once, sorted by token count and batched in that
+    order, so each batch is padded only to its own longest sentence;
+    embeddings are returned in input order. The model is exported on first
+    use if it is missing.
+    """
+
+    def __init__(self, model_name=None, quantized=False, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("onnxruntime is not installed; use EMBEDDING_BACKEND = 'torch' instead.")
+        from transformers import AutoTokenizer
+
+        directory = model_dir(model_name)
+        if not os.path.exists(os.path.join(directory, SETTINGS_FILE)):
+            export_model(model_name, directory)
+        with open(os.path.join(directory, SETTINGS_FILE), "r", encoding="utf-8") as f:
+            self.settings = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(directory, INT8_MODEL_FILE if quantized else MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.quantized = quantized
+        self.stats = {"batches": 0, "tokens": 0, "padded_tokens": 0}
+
+    def get_sentence_embedding_dimension(self):
+        return self.settings["dimension"]
+
+    def _pool(self, hidden, mask):
+        if self.settings["pooling"] == "cls":
+            return hidden[:, 0]
+        weights = mask[..., None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(sentences), self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        if sentences:
+            inputs = self.settings["inputs"]
+            encoded = self.tokenizer(sentences, truncation=True, max_length=self.settings["max_seq_length"])
+            lengths = [len(ids) for ids in encoded["input_ids"]]
+            order = np.argsort(lengths, kind="stable") if config.EMBEDDING_LENGTH_BUCKETING else np.arange(len(sentences))
+            for start in range(0, len(order), batch_size):
+                rows = order[start : start + batch_size]
+                batch = self.tokenizer.pad({name: [encoded[name][i] for i in rows] for name in inputs}, return_tensors="np")
+                feeds = {name: np.asarray(batch[name], dtype=np.int64) for name in inputs}
+                hidden = self.session.run(None, feeds)[0]
+                embeddings[rows] = self._pool(hidden, feeds["attention_mask"])
+                self.stats["batches"] += 1
+                self.stats["tokens"] += int(sum(lengths[i] for i in rows))
+                self.stats["padded_tokens"] += int(feeds["input_ids"].size)
+
+        if self.settings["normalize"] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        result = embeddings[0] if single else embeddings
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(result)
+        return result
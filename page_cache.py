@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import threading
+import time
+import config
+
+class PageCache:
+    """On-disk cache of extracted page text and search-result lists (SQLite).
+
+    Pages keep their paragraph text with the ETag / Last-Modified validators
+    and fetch time, so stale entries can be revalidated with a conditional
+    GET instead of a full download. Entries are evicted least-recently-used
+    first once the stored text exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=None, ttl=None, search_ttl=None, max_bytes=None):
+        self.path = path or config.PAGE_CACHE_PATH
+        self.ttl = config.PAGE_CACHE_TTL if ttl is None else ttl
+        self.search_ttl = config.SEARCH_CACHE_TTL if search_ttl is None else search_ttl
+        self.max_bytes = config.PAGE_CACHE_MAX_MB * 2**20 if max_bytes is None else max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "stale": 0, "misses": 0, "search_hits": 0, "search_misses": 0}
+
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, content TEXT, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL, accessed_at REAL, size INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "query TEXT, num_results INTEGER, urls TEXT, fetched_at REAL, "
+                "PRIMARY KEY (query, num_results))"
+            )
+
+    def _conn(self):
+        # SQLite connections cannot be shared across threads; keep one per fetch worker
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def count(self, name):
+        """Add one to a stats counter (fetch workers share the cache)."""
+        with self._lock:
+            self.stats[name] += 1
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def get_page(self, url):
+        """Return the cached entry for `url` as a dict, or None."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return dict(row)
+
+    def put_page(self, url, content, etag=None, last_modified=None):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, content, etag, last_modified, now, now, len(content.encode("utf-8"))),
+            )
+
+    def touch(self, url):
+        """Mark a cached page as revalidated (the server answered 304 Not Modified)."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+
+    def get_search(self, query, num_results, allow_stale=False):
+        """Return the cached URL list for a search query, or None if missing or expired."""
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT urls, fetched_at FROM searches WHERE query = ? AND num_results = ?", (query, num_results)
+            ).fetchone()
+        if row is None or (not allow_stale and time.time() - row["fetched_at"] >= self.search_ttl):
+            self.count("search_misses")
+            return None
+        self.count("search_hits")
+        return json.loads(row["urls"])
+
+    def put_search(self, query, num_results, urls):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                (query, num_results, json.dumps(urls), time.time()),
+            )
+
+    def evict(self):
+        """Drop expired searches and least-recently-used pages beyond the size budget."""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM searches WHERE fetched_at < ?", (time.time() - self.search_ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for row in conn.execute("SELECT url, size FROM pages ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM pages WHERE url = ?", (row["url"],))
+                total -= row["size"]
+                removed += 1
+        return removed
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Shared cache instance, or None when caching is disabled in config."""
+    global _cache
+    if not config.PAGE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
@@ -0,0 +1,219 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+
+class StopDownstream(Exception):
+    """Raised by a stage that finished but whose result means dependents should not run."""
+
+class Channel:
+    """Stream of partial results from one stage to another.
+
+    The producer `put`s items and `close`s the channel when done; consumers
+    iterate it and stop when it is closed or the run is cancelled.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, cancel):
+        self._queue = queue.Queue()
+        self._cancel = cancel
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def close(self):
+        self._queue.put(self._CLOSED)
+
+    def __iter__(self):
+        while not self._cancel.is_set():
+            try:
+                item = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is self._CLOSED:
+                self._queue.put(self._CLOSED)  # Let other consumers see the end too
+                return
+            yield item
+
+class StageScheduler:
+    """Runs a DAG of stages, starting each one as soon as its dependencies have succeeded.
+
+    Independent stages run concurrently on a thread pool. Each stage is
+    called with the scheduler itself, giving access to earlier `results`,
+    named `channel`s for streaming and the shared `cancel` event. Stages
+    whose dependency failed, stopped downstream or was cancelled are skipped.
+    """
+
+    def __init__(self, max_workers=4, on_event=None):
+        self.cancel = threading.Event()
+        self.results = {}
+        self.status = {}
+        self.timings = {}
+        self._stages = {}
+        self._channels = {}
+        self._max_workers = max_workers
+        self._on_event = on_event or (lambda stage, status, detail: None)
+        self._lock = threading.Condition()
+
+    def add(self, name, func, deps=()):
+        self._stages[name] = (func, tuple(deps))
+        return self
+
+    def wait_for(self, name):
+        """Block until stage `name` has finished (or the run is cancelled) and return its status."""
+        with self._lock:
+            while name not in self.status and not self.cancel.is_set():
+                self._lock.wait(timeout=0.2)
+            return self.status.get(name)
+
+    def publish(self, stage, detail):
+        """Report a partial result of a running stage (delivered as a "progress" event)."""
+        self._on_event(stage, "progress", detail)
+
+    def channel(self, name):
+        with self._lock:
+            if name not in self._channels:
+                self._channels[name] = Channel(self.cancel)
+            return self._channels[name]
+
+    def _run_stage(self, name, func):
+        start = time.perf_counter()
+        self._on_event(name, "started", None)
+        try:
+            if self.cancel.is_set():
+                raise InterruptedError("canceled")
+            with tracing.span(f"stage.{name}", cat="stage"):
+                result = func(self)
+            status = "canceled" if self.cancel.is_set() else "done"
+        except StopDownstream as e:
+            result, status = str(e), "stopped"
+        except InterruptedError as e:
+            result, status = str(e), "canceled"
+        except Exception as e:
+            result, status = e, "failed"
+
+        with self._lock:
+            self.timings[name] = round(time.perf_counter() - start, 3)
+            self.results[name] = result
+            self.status[name] = status
+            self._lock.notify_all()
+        self._on_event(name, status, result)
+
+    def _ready(self, name):
+        """None while waiting, True when runnable, False when it must be skipped."""
+        if self.cancel.is_set():
+            return False
+        deps = self._stages[name][1]
+        if any(self.status.get(dep) in ("failed", "stopped", "canceled", "skipped") for dep in deps):
+            return False
+        if all(self.status.get(dep) == "done" for dep in deps):
+            return True
+        return None
+
+    def run(self):
+        """Run all stages to completion (or cancellation); returns the status of every stage."""
+        waiting = set(self._stages)
+        running = set()
+        with ThreadPoolExecutor(self._max_workers) as pool:
+            with self._lock:
+                while waiting or running:
+                    for name in sorted(waiting):
+                        ready = self._ready(name)
+                        if ready is None:
+                            continue
+                        waiting.discard(name)
+                        if ready:
+                            running.add(name)
+                            pool.submit(self._run_stage, name, self._stages[name][0])
+                        else:
+                            self.status[name] = "canceled" if self.cancel.is_set() else "skipped"
+                            self._on_event(name, self.status[name], None)
+                    running = {name for name in running if name not in self.status}
+                    if waiting or running:
+                        self._lock.wait(timeout=0.5)
+        return dict(self.status)
+
+    def timing_report(self):
+        return " | ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+
+def build_document_pipeline(file_path, confirm_removal=None, max_workers=4, on_event=None):
+    """DAG for one document: file → preprocess → {topics → web fetch → plagiarism check, AI detection} → removal.
+
+    Sentences are segmented once in the preprocess stage (timed on its own)
+    and cached on the document for every later stage. AI detection starts as
+    soon as they are ready. Scraped pages are
+    streamed from the web stage to the plagiarism stage, which checks them in
+    batches while the rest are still downloading and publishes provisional
+    percentages. `confirm_removal(plagiarism, ai)` decides whether the
+    removal stage runs.
+    """
+    import config
+    import file_reader
+    import document_analyzer
+    import web_search
+    import plagiarism_checker
+    import ai_checker
+    import preprocessing
+    import plagiarism_remover
+
+    scheduler = StageScheduler(max_workers=max_workers, on_event=on_event)
+
+    def read_file(s):
+        config.ensure_indexes()
+        message, document_id = file_reader.store_file(file_path)
+        if "✅" not in message:
+            raise StopDownstream(message)
+        s.document_id = document_id
+        return message
+
+    def topics(s):
+        message = document_analyzer.process_document(s.document_id)
+        if "✅" not in message:
+            raise StopDownstream(message)
+        return message
+
+    def preprocess(s):
+        return preprocessing.preprocess_document(s.document_id)
+
+    def web(s):
+        pages = s.channel("pages")
+        try:
+            message = web_search.fetch_and_store_web_results(s.document_id, on_page=pages.put, cancel=s.cancel)
+        finally:
+            pages.close()
+        if "✅" not in message:
+            raise StopDownstream(message)
+        return message
+
+    def web_pages(s):
+        yield from s.channel("pages")
+        # Never store a report built from a partial fetch
+        if s.wait_for("web") != "done":
+            raise StopDownstream("⚠️ Skipped plagiarism check: no web results.")
+
+    def plagiarism(s):
+        return plagiarism_checker.process_plagiarism_check(
+            s.document_id,
+            pages=web_pages(s),
+            on_progress=lambda percentage, seen: s.publish("plagiarism", (percentage, seen)),
+            cancel=s.cancel,
+        )
+
+    def ai(s):
+        return ai_checker.process_ai_detection(s.document_id, cancel=s.cancel)
+
+    def removal(s):
+        if confirm_removal is not None and not confirm_removal(s.results.get("plagiarism"), s.results.get("ai")):
+            raise StopDownstream("📌 Plagiarism removal skipped.")
+        return plagiarism_remover.process_plagiarism_removal(s.document_id, cancel=s.cancel)
+
+    scheduler.add("file", read_file)
+    scheduler.add("preprocess", preprocess, deps=["file"])
+    scheduler.add("topics", topics, deps=["preprocess"])
+    scheduler.add("web", web, deps=["topics"])
+    scheduler.add("plagiarism", plagiarism, deps=["topics"])
+    scheduler.add("ai", ai, deps=["preprocess"])
+    scheduler.add("removal", removal, deps=["plagiarism", "ai"])
+    return scheduler
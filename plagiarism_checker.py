@@ -1,116 +1,467 @@
 import torch
-import nltk
-import re
-from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer, util
-from nltk.tokenize import sent_tokenize
+import heapq
+import itertools
 from sklearn.feature_extraction.text import TfidfVectorizer
 from datetime import datetime
 import numpy as np
+import config
+from minhash_lsh import MinHashLSH, brute_force_matches
+import ann_index
+from embedding_service import embed_references
+from embedding_store import content_hash
+import incremental
+import tracing
+from embedding_service import encode as encode_sentences
+from text_utils import preprocess_text, sent_tokenize
+from preprocessing import document_sentences
+from storage import text_projection, unpack_text
 
-# Ensure NLTK resources are available
-nltk.download("punkt")
-nltk.download("punkt_tab")
-
-# Load Sentence Transformer model (Use GPU if available)
-device = "cuda" if torch.cuda.is_available() else "cpu"
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2").to(device)
-
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-documents_collection = db["documents"]  
-websave_collection = db["websave"]  
-plagiarism_reports_collection = db["plagiarism_reports"]  
-
-def preprocess_text(text):
-    """Lowercase, remove citations, and clean text."""
-    return re.sub(r"\d+", "", text.lower().strip())
-
-def get_embedding(text):
-    """Generate sentence embeddings."""
-    return embedding_model.encode(text, convert_to_tensor=True)
-
-def fetch_document_text():
-    """Fetch the latest document from MongoDB."""
-    latest_document = documents_collection.find_one(sort=[("_id", -1)])
-    if latest_document and "content" in latest_document:
-        return preprocess_text(latest_document["content"])
-    return None
-
-def fetch_web_results():
-    """Fetch all web search results from MongoDB."""
-    results = websave_collection.find({}, {"content": 1, "_id": 0})
-    return [preprocess_text(res["content"]) for res in results if "content" in res]
-
-def ngram_jaccard_similarity(sent1, sent2, n=3):
-    """Compute Jaccard Similarity for N-grams."""
-    set1 = set([sent1[i : i + n] for i in range(len(sent1) - n + 1)])
-    set2 = set([sent2[i : i + n] for i in range(len(sent2) - n + 1)])
-    return len(set1 & set2) / len(set1 | set2) if set1 | set2 else 0
-
-def tfidf_cosine_similarity(sent1, sent2):
-    """Compute Cosine Similarity using TF-IDF."""
-    vectorizer = TfidfVectorizer().fit([sent1, sent2])
-    vectors = vectorizer.transform([sent1, sent2]).toarray()
-    return np.dot(vectors[0], vectors[1]) / (np.linalg.norm(vectors[0]) * np.linalg.norm(vectors[1]))
-
-def check_plagiarism(original_text, reference_texts, exact_thresh=0.85, paraphrase_thresh=0.7, semantic_thresh=0.75):
-    """Compares original document with web results using multiple similarity methods."""
+documents_collection = config.get_collection("documents")
+websave_collection = config.get_collection("websave")
+plagiarism_reports_collection = config.get_collection("plagiarism_reports")
+
+def split_reference_sentences(reference_texts):
+    """Tokenize every reference text once and return a flat list of sentences."""
+    ref_sentences = []
+    for ref_text in reference_texts:
+        ref_sentences.extend(sent_tokenize(ref_text))
+    return ref_sentences
+
+def semantic_similarity_matrix(original_sentences, ref_sentences, ref_embeddings=None):
+    """Cosine similarity of every original sentence against every reference sentence."""
+    original_embeddings = encode_sentences(original_sentences)
+    if ref_embeddings is None:
+        ref_embeddings = encode_sentences(ref_sentences)
+    else:
+        ref_embeddings = torch.as_tensor(np.asarray(ref_embeddings), device=original_embeddings.device)
+    return original_embeddings @ ref_embeddings.T
+
+def top_k_semantic_matches(similarity_matrix, semantic_thresh, top_k=None):
+    """Return, per original sentence, the reference indices above the threshold.
+
+    Only the `top_k` most similar references of each row are considered; with
+    `top_k=None` every reference above the threshold is kept.
+    """
+    num_refs = similarity_matrix.shape[1]
+    k = num_refs if top_k is None else min(top_k, num_refs)
+    scores, indices = torch.topk(similarity_matrix, k, dim=1)
+    above = scores > semantic_thresh
+
+    semantic_hits = []
+    for row_indices, row_above in zip(indices.tolist(), above.tolist()):
+        semantic_hits.append({j for j, keep in zip(row_indices, row_above) if keep})
+    return semantic_hits
+
+def fetch_latest_document(document_id=None):
+    """Fetch the given document record (or the latest one) from MongoDB."""
+    if document_id is not None:
+        return documents_collection.find_one({"_id": document_id})
+    return documents_collection.find_one(sort=[("_id", -1)])
+
+def fetch_web_references(document_id=None):
+    """Fetch the web search results of the given (or latest) document as (url, preprocessed content) pairs."""
+    query = {"document_id": config.resolve_document_id(document_id)}
+    results = ((res.get("url", ""), unpack_text(res)) for res in websave_collection.find(query, text_projection("url")))
+    return [(url, preprocess_text(text)) for url, text in results if text is not None]
+
+def iter_web_references(document_id=None, batch_size=None):
+    """Stream the given (or latest) document's web search results from a MongoDB cursor as (url, preprocessed content) pairs."""
+    query = {"document_id": config.resolve_document_id(document_id)}
+    cursor = websave_collection.find(query, text_projection("url"))
+    cursor = cursor.batch_size(batch_size or config.STREAM_BATCH_SIZE)
+    for res in cursor:
+        text = unpack_text(res)
+        if text is not None:
+            yield res.get("url", ""), preprocess_text(text)
+
+def carried_references(document):
+    """True if the web stage carried the previous version's references over to `document` (see `web_search`)."""
+    query = {"document_id": document["_id"], "carried_from": document.get("previous_id")}
+    return websave_collection.find_one(query, {"_id": 1}) is not None
+
+def iter_batches(items, size):
+    """Group an iterable into lists of at most `size` items."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+@tracing.traced(cat="similarity")
+def semantic_matches(original_sentences, ref_sentences, semantic_thresh, top_k=None, ref_embeddings=None, semantic_index=None, reference_key=None):
+    """Return, per original sentence, the reference indices whose embedding cosine exceeds the threshold.
+
+    Small reference sets use the full similarity matrix; large ones (or an
+    explicit `semantic_index` of "ivf"/"hnsw") go through an approximate
+    nearest-neighbour index, reused across checks of the same reference set
+    when `reference_key` is given. A prebuilt index object can also be passed
+    as `semantic_index`. Without `top_k` the index is searched again with a
+    wider k while all neighbours found still pass the threshold, so both
+    paths keep every match above it (up to the index's recall).
+    """
+    if hasattr(semantic_index, "search"):
+        index = semantic_index
+    else:
+        method = ann_index.resolve_method(len(ref_sentences), semantic_index)
+        if method == "brute":
+            similarity_matrix = semantic_similarity_matrix(original_sentences, ref_sentences, ref_embeddings)
+            return top_k_semantic_matches(similarity_matrix, semantic_thresh, top_k)
+        if ref_embeddings is None:
+            ref_embeddings = encode_sentences(ref_sentences).cpu().numpy()
+        index = ann_index.get_index(ref_embeddings, method, reference_key)
+
+    query_embeddings = encode_sentences(original_sentences).cpu().numpy()
+    semantic_hits = [set() for _ in original_sentences]
+    rows = np.arange(len(original_sentences))
+    k = min(top_k or config.ANN_TOP_K, len(index))
+    while len(rows):
+        scores, ids = index.search(query_embeddings[rows], k)
+        for row, row_scores, row_ids in zip(rows, scores, ids):
+            semantic_hits[row] = {int(j) for score, j in zip(row_scores, row_ids) if j >= 0 and score > semantic_thresh}
+        if top_k is not None or k >= len(index):
+            break
+        rows = rows[scores[:, -1] > semantic_thresh]  # Every neighbour matched: there may be more
+        k = min(k * 4, len(index))
+    return semantic_hits
+
+@tracing.traced(cat="similarity")
+def exact_matches(original_sentences, ref_sentences, exact_thresh, method="lsh"):
+    """Return, per original sentence, the reference indices whose trigram Jaccard exceeds the threshold.
+
+    `method="lsh"` only verifies MinHash/LSH candidates; `method="brute"`
+    compares every pair and serves as the recall baseline.
+    """
+    if method == "brute":
+        return brute_force_matches(original_sentences, ref_sentences, exact_thresh)
+
+    index = MinHashLSH(bands=config.LSH_BANDS, rows=config.LSH_ROWS).add_all(ref_sentences)
+    return [index.query(sentence, exact_thresh) for sentence in original_sentences]
+
+@tracing.traced(cat="similarity")
+def paraphrase_matches(original_sentences, ref_sentences, paraphrase_thresh, chunk_size=512, ref_chunk_size=8192):
+    """Return, per original sentence, the reference indices whose TF-IDF cosine exceeds the threshold.
+
+    One vocabulary is fitted over the document and all reference sentences,
+    every sentence is transformed into a single sparse matrix, and cosines are
+    computed with sparse products over blocks of `chunk_size` original by
+    `ref_chunk_size` reference sentences, so memory stays bounded however many
+    references there are (common words make the products nearly dense).
+    """
+    paraphrase_hits = [set() for _ in original_sentences]
+    try:
+        vectorizer = TfidfVectorizer().fit(original_sentences + ref_sentences)
+    except ValueError:
+        return paraphrase_hits  # Empty vocabulary (e.g. only stop-characters)
+
+    original_vectors = vectorizer.transform(original_sentences)
+    ref_vectors_t = vectorizer.transform(ref_sentences).T.tocsc()
+
+    for ref_start in range(0, len(ref_sentences), ref_chunk_size):
+        ref_block = ref_vectors_t[:, ref_start : ref_start + ref_chunk_size]
+        for start in range(0, len(original_sentences), chunk_size):
+            block = (original_vectors[start : start + chunk_size] @ ref_block).tocoo()
+            keep = block.data > paraphrase_thresh
+            for row, col in zip(block.row[keep].tolist(), block.col[keep].tolist()):
+                paraphrase_hits[start + row].add(ref_start + col)
+    return paraphrase_hits
+
+def match_sentences(original_sentences, ref_sentences, exact_thresh=0.85, paraphrase_thresh=0.7, semantic_thresh=0.75, top_k=None, exact_method="lsh", reference_embeddings=None, semantic_index=None, reference_key=None):
+    """Return, for every original sentence, the list of its matches against the reference sentences."""
+    if not original_sentences or not len(ref_sentences):
+        return [[] for _ in original_sentences]
+
+    tracing.count("sentences_checked", len(original_sentences))
+    tracing.count("sentence_pairs", len(original_sentences) * len(ref_sentences))
+    with tracing.span("match_sentences", cat="similarity", sentences=len(original_sentences), references=len(ref_sentences)), \
+            tracing.profile("match_sentences"):
+        exact_hits = exact_matches(original_sentences, ref_sentences, exact_thresh, exact_method)
+        paraphrase_hits = paraphrase_matches(original_sentences, ref_sentences, paraphrase_thresh)
+        semantic_hits = semantic_matches(
+            original_sentences, ref_sentences, semantic_thresh, top_k, reference_embeddings, semantic_index, reference_key
+        )
+
+    # Each pair is reported once, by the first method that flags it
+    sentence_matches = []
+    for i, sentence in enumerate(original_sentences):
+        found = []
+        for j in sorted(exact_hits[i] | paraphrase_hits[i] | semantic_hits[i]):
+            if j in exact_hits[i]:
+                method = "Exact Match"
+            elif j in paraphrase_hits[i]:
+                method = "Paraphrase Detection"
+            else:
+                method = "Deep Semantic Similarity"
+            found.append({"original": sentence, "match": ref_sentences[j], "method": method})
+        sentence_matches.append(found)
+    return sentence_matches
+
+def plagiarism_percentage_of(sentence_matches, counts=None):
+    """Document-level percentage: matched pairs over sentences, capped at 100.
+
+    `counts` (pairs per sentence) replaces the lengths of `sentence_matches`
+    where those lists were capped.
+    """
+    if not sentence_matches:
+        return 0.0
+    if counts is None:
+        counts = [len(found) for found in sentence_matches]
+    return min((sum(counts) / len(sentence_matches)) * 100, 100)
+
+METHOD_RANK = {"Exact Match": 2, "Paraphrase Detection": 1, "Deep Semantic Similarity": 0}
+
+class StreamingMatcher:
+    """Running per-sentence matches of a document against references that arrive in batches.
+
+    Every batch is embedded and matched on its own and then dropped, so memory
+    depends on the batch size rather than the reference set. Each sentence
+    keeps at most `max_matches` matches (exact before paraphrase before
+    semantic, earlier before later) while the matched pairs are counted in
+    full, so `percentage()` uses the same formula as the batch check. The
+    paraphrase vocabulary is fitted per batch, so its scores can differ
+    slightly from a check that sees every reference at once.
+
+    With `previous_matches` (per sentence, None for changed sentences) the
+    reused sentences are only compared with references outside `known_hashes`;
+    `previous_counts` gives their full match counts when those lists were capped.
+    """
+
+    def __init__(self, original_sentences, max_matches=None, previous_matches=None, known_hashes=(), previous_counts=None):
+        self.sentences = list(original_sentences)
+        self.max_matches = max_matches or config.STREAM_MAX_MATCHES
+        self.counts = [0] * len(self.sentences)
+        self.references_seen = 0
+        self.reference_hashes = set()
+        self.known_hashes = set(known_hashes)
+        self._kept = [[] for _ in self.sentences]
+        self._seq = itertools.count()
+
+        previous_matches = previous_matches or [None] * len(self.sentences)
+        self.reused = [i for i, found in enumerate(previous_matches) if found is not None]
+        self.changed = [i for i, found in enumerate(previous_matches) if found is None]
+        for i in self.reused:
+            self._keep(i, previous_matches[i], previous_counts[i] if previous_counts is not None else None)
+
+    def _keep(self, i, found, count=None):
+        self.counts[i] += len(found) if count is None else count
+        heap = self._kept[i]
+        for match in found:
+            entry = (METHOD_RANK[match["method"]], -next(self._seq), match)
+            if len(heap) < self.max_matches:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    def _match(self, indices, references):
+        if not indices or not references:
+            return
+        ref_sentences, ref_embeddings = embed_references(references)
+        found = match_sentences([self.sentences[i] for i in indices], ref_sentences, reference_embeddings=ref_embeddings)
+        for i, sentence_found in zip(indices, found):
+            self._keep(i, sentence_found)
+
+    def add(self, references):
+        """Match one batch of `(url, text)` references; returns the provisional percentage."""
+        hashes = [content_hash(text) for _, text in references]
+        self.references_seen += len(references)
+        self.reference_hashes.update(hashes)
+        self._match(self.changed, references)
+        self._match(self.reused, [ref for ref, h in zip(references, hashes) if h not in self.known_hashes])
+        return self.percentage()
+
+    def percentage(self):
+        if not self.sentences:
+            return 0.0
+        return min((sum(self.counts) / len(self.sentences)) * 100, 100)
+
+    def sentence_matches(self):
+        """Kept matches of every sentence in arrival order."""
+        return [[match for _, _, match in sorted(heap, key=lambda entry: -entry[1])] for heap in self._kept]
+
+def check_streaming(original_sentences, references, previous_matches=None, known_hashes=(), batch_size=None, max_matches=None, on_progress=None, cancel=None, previous_counts=None):
+    """Check a document against a stream of `(url, text)` references, batch by batch.
+
+    `on_progress(percentage, references_seen)` is called after every batch
+    with the provisional plagiarism percentage. Returns the StreamingMatcher.
+    """
+    matcher = StreamingMatcher(original_sentences, max_matches, previous_matches, known_hashes, previous_counts)
+    for batch in iter_batches(references, batch_size or config.STREAM_BATCH_SIZE):
+        if cancel is not None and cancel.is_set():
+            break
+        percentage = matcher.add(batch)
+        if on_progress is not None:
+            on_progress(percentage, matcher.references_seen)
+    return matcher
+
+def check_plagiarism(original_text, reference_texts, exact_thresh=0.85, paraphrase_thresh=0.7, semantic_thresh=0.75, top_k=None, exact_method="lsh", reference_sentences=None, reference_embeddings=None, semantic_index=None):
+    """Compares original document with web results using multiple similarity methods.
+
+    All sentences are embedded in one batch per side and compared through a
+    single similarity matrix; `top_k` limits semantic matches per sentence.
+    Paraphrase detection uses one TF-IDF vocabulary fitted for the whole run
+    and exact matches are looked up through a MinHash/LSH index.
+    Pre-split `reference_sentences` with matching `reference_embeddings`
+    (e.g. from the embedding store) skip re-encoding the references, and
+    `semantic_index` selects exact or approximate nearest-neighbour search.
+    """
     original_sentences = sent_tokenize(original_text)
-    plagiarized_count = 0
-    matches = []
-
-    for sentence in original_sentences:
-        original_embedding = get_embedding(sentence)
-        
-        for ref_text in reference_texts:
-            ref_sentences = sent_tokenize(ref_text)
-            
-            for ref_sentence in ref_sentences:
-                if ngram_jaccard_similarity(sentence, ref_sentence) > exact_thresh:
-                    plagiarized_count += 1
-                    matches.append({"original": sentence, "match": ref_sentence, "method": "Exact Match"})
-                    continue  
-                
-                if tfidf_cosine_similarity(sentence, ref_sentence) > paraphrase_thresh:
-                    plagiarized_count += 1
-                    matches.append({"original": sentence, "match": ref_sentence, "method": "Paraphrase Detection"})
-                    continue
-
-                ref_embedding = get_embedding(ref_sentence)
-                similarity = util.pytorch_cos_sim(original_embedding, ref_embedding).item()
-                
-                if similarity > semantic_thresh:
-                    plagiarized_count += 1
-                    matches.append({"original": sentence, "match": ref_sentence, "method": "Deep Semantic Similarity"})
-                    continue
-
-    total_sentences = len(original_sentences)
-    plagiarism_percentage = min((plagiarized_count / total_sentences) * 100, 100)
-
-    return plagiarism_percentage, matches
-
-def store_plagiarism_report(plagiarism_percentage, matches):
+    if reference_sentences is None:
+        ref_sentences = split_reference_sentences(reference_texts)
+    else:
+        ref_sentences = list(reference_sentences)
+
+    sentence_matches = match_sentences(
+        original_sentences, ref_sentences, exact_thresh, paraphrase_thresh, semantic_thresh,
+        top_k, exact_method, reference_embeddings, semantic_index,
+    )
+    matches = [match for found in sentence_matches for match in found]
+    return plagiarism_percentage_of(sentence_matches), matches
+
+def check_revision(original_sentences, references, previous_report):
+    """Re-check a revised document, reusing the previous version's per-sentence results.
+
+    Changed sentences are checked against all references. Unchanged ones keep
+    their previous matches and are only compared with references added since
+    that report. `previous_report` must have been checked against a subset of
+    `references`. Returns per-sentence matches, per-sentence match counts
+    (which exceed the matches kept by a streamed previous report) and the
+    sentence alignment.
+    """
+    previous_matches = incremental.split_by_offsets(previous_report["matches"], previous_report["match_offsets"])
+    previous_counts = incremental.match_counts(previous_report)
+    alignment = incremental.align_sentences(previous_report["sentences"], original_sentences)
+    known_hashes = set(previous_report["reference_hashes"])
+    new_references = [(url, text) for url, text in references if content_hash(text) not in known_hashes]
+
+    changed = [i for i, old in enumerate(alignment) if old is None]
+    unchanged = [i for i, old in enumerate(alignment) if old is not None]
+    sentence_matches = [previous_matches[old] if old is not None else [] for old in alignment]
+    counts = [previous_counts[old] if old is not None else 0 for old in alignment]
+
+    if changed:
+        ref_sentences, ref_embeddings = embed_references(references)
+        fresh = match_sentences(
+            [original_sentences[i] for i in changed], ref_sentences, reference_embeddings=ref_embeddings,
+            reference_key=ann_index.reference_key(content_hash(text) for _, text in references),
+        )
+        for i, found in zip(changed, fresh):
+            sentence_matches[i] = found
+            counts[i] = len(found)
+
+    if unchanged and new_references:
+        ref_sentences, ref_embeddings = embed_references(new_references)
+        extra = match_sentences([original_sentences[i] for i in unchanged], ref_sentences, reference_embeddings=ref_embeddings)
+        for i, found in zip(unchanged, extra):
+            sentence_matches[i] = sentence_matches[i] + found
+            counts[i] += len(found)
+
+    return sentence_matches, counts, alignment
+
+def store_plagiarism_report(plagiarism_percentage, matches, document_id=None, sentences=None, match_offsets=None, reference_hashes=None, match_counts=None):
     """Store plagiarism report in MongoDB."""
     report = {
         "timestamp": datetime.utcnow(),
         "plagiarism_percentage": plagiarism_percentage,
         "matches": matches,
     }
+    if document_id is not None:
+        # Per-sentence layout lets the next revision of this document reuse unchanged results
+        report.update({
+            "document_id": document_id,
+            "sentences": sentences,
+            "match_offsets": match_offsets,
+            "match_counts": match_counts,
+            "reference_hashes": reference_hashes,
+        })
     plagiarism_reports_collection.insert_one(report)
     return f"✅ Plagiarism report stored successfully. Detected {plagiarism_percentage:.2f}% plagiarism."
 
-def process_plagiarism_check():
-    """Main function to check plagiarism and store results."""
-    original_text = fetch_document_text()
-    reference_texts = fetch_web_results()
+def process_plagiarism_check(document_id=None, pages=None, stream=None, on_progress=None, cancel=None):
+    """Main function to check plagiarism and store results.
+
+    With a `pages` iterable of `{"url", "content"}` records (e.g. from the web
+    fetcher), or with `stream=True`, references are consumed in batches as
+    they arrive and `on_progress` receives provisional percentages.
+    """
+    document = fetch_latest_document(document_id)
 
-    if not original_text:
+    if not document or "content" not in document:
         return "⚠️ No document found for plagiarism check."
 
-    if not reference_texts:
+    document_id = document["_id"]
+    original_sentences = document_sentences(document, normalized=True)
+    previous = incremental.previous_result(plagiarism_reports_collection, document) if config.INCREMENTAL_RECHECK else None
+    if previous and "match_offsets" not in previous:
+        previous = None
+
+    stream = config.PLAGIARISM_STREAMING if stream is None else stream
+    if pages is not None or stream:
+        if pages is not None:
+            references = ((page["url"], preprocess_text(page["content"])) for page in pages)
+        else:
+            references = iter_web_references(document_id)
+
+        # The whole reference set is only known at the end of the stream, so reuse is decided
+        # up front: it is valid when the previous version's references were carried over
+        previous_matches, previous_counts, known_hashes = None, None, ()
+        if previous and (pages is not None or carried_references(document)):
+            old_matches = incremental.split_by_offsets(previous["matches"], previous["match_offsets"])
+            old_counts = incremental.match_counts(previous)
+            alignment = incremental.align_sentences(previous["sentences"], original_sentences)
+            previous_matches = [old_matches[old] if old is not None else None for old in alignment]
+            previous_counts = [old_counts[old] if old is not None else 0 for old in alignment]
+            known_hashes = previous["reference_hashes"]
+
+        matcher = check_streaming(
+            original_sentences, references, previous_matches, known_hashes,
+            on_progress=on_progress, cancel=cancel, previous_counts=previous_counts,
+        )
+        if cancel is not None and cancel.is_set():
+            return "❌ Plagiarism check canceled."
+        if not matcher.references_seen:
+            return "⚠️ No web search results found."
+
+        reference_hashes = matcher.reference_hashes
+        if previous_matches is not None:
+            print(incremental.summarize(alignment))
+            missing = set(known_hashes) - reference_hashes
+            if missing:
+                # Unchanged sentences keep their matches against these, so the report covers them too
+                print(f"⚠️ {len(missing)} references of the previous version were not seen again")
+                reference_hashes = reference_hashes | missing
+        sentence_matches = matcher.sentence_matches()
+        matches = [match for found in sentence_matches for match in found]
+        return store_plagiarism_report(
+            matcher.percentage(), matches,
+            document_id=document["_id"],
+            sentences=original_sentences,
+            match_offsets=incremental.offsets_of(sentence_matches),
+            reference_hashes=sorted(reference_hashes),
+            match_counts=matcher.counts,
+        )
+
+    references = fetch_web_references(document_id)
+    if not references:
         return "⚠️ No web search results found."
 
-    plagiarism_percentage, matches = check_plagiarism(original_text, reference_texts)
-    return store_plagiarism_report(plagiarism_percentage, matches)
\ No newline at end of file
+    reference_hashes = [content_hash(text) for _, text in references]
+    if previous and set(previous["reference_hashes"]) <= set(reference_hashes):
+        sentence_matches, counts, alignment = check_revision(original_sentences, references, previous)
+        print(incremental.summarize(alignment))
+    else:
+        ref_sentences, ref_embeddings = embed_references(references)
+        sentence_matches = match_sentences(
+            original_sentences, ref_sentences, reference_embeddings=ref_embeddings,
+            reference_key=ann_index.reference_key(reference_hashes),
+        )
+        counts = [len(found) for found in sentence_matches]
+
+    matches = [match for found in sentence_matches for match in found]
+    return store_plagiarism_report(
+        plagiarism_percentage_of(sentence_matches, counts), matches,
+        document_id=document["_id"],
+        sentences=original_sentences,
+        match_offsets=incremental.offsets_of(sentence_matches),
+        reference_hashes=sorted(set(reference_hashes)),
+        match_counts=counts,
+    )
@@ -1,112 +1,270 @@
 import torch
-import nltk
-import ollama
-from pymongo import MongoClient
-from nltk.tokenize import sent_tokenize
-from sentence_transformers import SentenceTransformer, util
 from datetime import datetime
+import numpy as np
+import ann_index
+import config
+import llm_client
+from llm_cache import get_cache
+from embedding_service import embed_references
+from embedding_service import encode as encode_sentences
+from embedding_store import content_hash
+import incremental
+import tracing
+from text_utils import sent_tokenize
+from preprocessing import document_sentences, document_spans
+from storage import text_projection, unpack_text
 
-# Ensure NLTK resources are available
+documents_collection = config.get_collection("documents")  # Original documents
+websave_collection = config.get_collection("websave")  # Scraped reference pages
+rewritten_collection = config.get_collection("plagrem")  # Stores rewritten content
 
+def fetch_latest_document(document_id=None):
+    """Fetch the given document (or the latest one) from MongoDB."""
+    if document_id is not None:
+        return documents_collection.find_one({"_id": document_id})
+    latest_document = documents_collection.find_one(sort=[("_id", -1)])
+    return latest_document if latest_document else None
 
-# Load sentence transformer model for similarity check
-device = "cuda" if torch.cuda.is_available() else "cpu"
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2").to(device)
+@tracing.traced(cat="similarity")
+def flag_sentences(original_sentences, reference_sentences, threshold=0.8, reference_embeddings=None, semantic_index=None, reference_key=None):
+    """Return one flag per original sentence: does any reference sentence exceed the threshold?
 
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-documents_collection = db["documents"]  # Original documents
-rewritten_collection = db["plagrem"]  # Stores rewritten content
+    `reference_key` lets an approximate index be reused by later checks of the same references.
+    """
+    if not original_sentences or not len(reference_sentences):
+        return [False] * len(original_sentences)
 
-def get_embedding(text):
-    """Generate sentence embeddings."""
-    return embedding_model.encode(text, convert_to_tensor=True)
+    original_embeddings = encode_sentences(original_sentences)
+    if hasattr(semantic_index, "search") or ann_index.resolve_method(len(reference_sentences), semantic_index) != "brute":
+        # Approximate nearest neighbour: only the best reference per sentence is needed
+        index = semantic_index
+        if not hasattr(index, "search"):
+            if reference_embeddings is None:
+                reference_embeddings = encode_sentences(reference_sentences).cpu().numpy()
+            index = ann_index.get_index(np.asarray(reference_embeddings), semantic_index, reference_key)
+        scores, _ = index.search(original_embeddings.cpu().numpy(), 1)
+        best_scores = torch.from_numpy(scores[:, 0])
+    else:
+        if reference_embeddings is None:
+            reference_embeddings = encode_sentences(reference_sentences)
+        else:
+            reference_embeddings = torch.as_tensor(np.asarray(reference_embeddings), device=original_embeddings.device)
+        best_scores = (original_embeddings @ reference_embeddings.T).max(dim=1).values
 
-def fetch_latest_document():
-    """Fetch the latest document from MongoDB."""
-    latest_document = documents_collection.find_one(sort=[("_id", -1)])
-    return latest_document if latest_document else None
+    return [score > threshold for score in best_scores.tolist()]
 
-def detect_plagiarism(original_text, reference_texts, threshold=0.8):
+def detect_plagiarism(original_text, reference_texts, threshold=0.8, reference_sentences=None, reference_embeddings=None, semantic_index=None):
     """
     Detects plagiarism using sentence-level similarity.
     Returns sentences that need to be rewritten.
     """
     original_sentences = sent_tokenize(original_text)
-    plagiarized_sentences = []
+    if reference_sentences is None:
+        reference_sentences = [ref for ref_text in reference_texts for ref in sent_tokenize(ref_text)]
+    flags = flag_sentences(original_sentences, reference_sentences, threshold, reference_embeddings, semantic_index)
+    return [sentence for sentence, flagged in zip(original_sentences, flags) if flagged]
 
-    for sentence in original_sentences:
-        original_embedding = get_embedding(sentence)
+def detect_revision(original_sentences, references, previous):
+    """Flag sentences of a revised document, reusing the previous version's flags.
 
-        for ref_text in reference_texts:
-            ref_sentences = sent_tokenize(ref_text)
-            ref_embeddings = [get_embedding(ref) for ref in ref_sentences]
+    Changed sentences are compared with all references; unchanged ones keep
+    their flag and are only compared with references added since then.
+    """
+    alignment = incremental.align_sentences(previous["sentences"], original_sentences)
+    known_hashes = set(previous["reference_hashes"])
+    new_references = [(url, text) for url, text in references if content_hash(text) not in known_hashes]
+    flags = [previous["flags"][old] if old is not None else False for old in alignment]
+
+    changed = [i for i, old in enumerate(alignment) if old is None]
+    recheck = [i for i, old in enumerate(alignment) if old is not None and not flags[i]]
+    for indices, refs in ((changed, references), (recheck if new_references else [], new_references)):
+        if indices:
+            ref_sentences, ref_embeddings = embed_references(refs)
+            fresh = flag_sentences([original_sentences[i] for i in indices], ref_sentences, reference_embeddings=ref_embeddings)
+            for i, flagged in zip(indices, fresh):
+                flags[i] = flags[i] or flagged
+    print(incremental.summarize(alignment))
+    return flags
 
-            for ref_embedding, ref_sentence in zip(ref_embeddings, ref_sentences):
-                similarity = util.pytorch_cos_sim(original_embedding, ref_embedding).item()
-                if similarity > threshold:
-                    plagiarized_sentences.append(sentence)
-                    break  # Stop checking once plagiarism is detected for this sentence
+REWRITE_PROMPT = "Paraphrase the following text while maintaining its meaning and making it sound natural:\n\n{text}"
 
-    return plagiarized_sentences
+REWRITE_BATCH_PROMPT = (
+    "Paraphrase each numbered sentence below while maintaining its meaning and making it sound natural. "
+    'Respond only with JSON of the form {{"rewrites": [rewrite_1, ..., rewrite_{count}]}} '
+    "containing exactly {count} sentences in the same order:\n\n{numbered}"
+)
 
-def rewrite_text_mistral(text):
+def rewrite_text_mistral(text, refresh=False):
     """
     Uses Mistral LLM to generate high-quality paraphrased content.
+    Cached rewrites are reused unless `config.LLM_CACHE_REWRITES` is off;
+    `refresh=True` asks for a new rewrite and replaces the cached one.
     """
-    prompt = f"Paraphrase the following text while maintaining its meaning and making it sound natural:\n\n{text}"
-    response = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
-    return response["message"]["content"]
+    return llm_client.cached_chat(REWRITE_PROMPT, text, use_cache=config.LLM_CACHE_REWRITES, refresh=refresh)
+
+def parse_batch_rewrites(reply, count):
+    """Parse a batched reply into `count` rewrites (None where one is missing or empty)."""
+    rewrites = [None] * count
+    data = llm_client.parse_json(reply)
+    if isinstance(data, dict):
+        data = data.get("rewrites")
+    if isinstance(data, list):
+        for i, value in enumerate(data[:count]):
+            if isinstance(value, str) and value.strip():
+                rewrites[i] = value.strip()
+    return rewrites
+
+def rewrite_sentence(sentence, refresh=False):
+    """Rewrite one sentence with its own LLM request (None if the request fails)."""
+    try:
+        return rewrite_text_mistral(sentence, refresh=refresh)
+    except Exception as e:
+        print(f"⚠️ Rewrite failed for a sentence: {e}")
+        return None
+
+def rewrite_batch(sentences, refresh=False):
+    """Rewrite a group of sentences with one prompt, falling back per sentence for gaps."""
+    cache = get_cache() if config.LLM_CACHE_REWRITES else None
+    single = lambda sentence: rewrite_sentence(sentence, refresh)
+    return llm_client.chat_batch(sentences, REWRITE_BATCH_PROMPT, parse_batch_rewrites, single, cache, "rewrite")
 
-def validate_rewrite(original, rewritten):
+def rewrite_sentences(sentences, mode=None, batch_size=None, workers=None, refresh=False, cancel=None):
+    """Rewrite sentences with per-sentence or batched prompts on a bounded pool of parallel requests.
+
+    Cached rewrites are reused unless `refresh` is set. Once the `cancel`
+    event is set no new requests are started; sentences without a rewrite
+    (failed or cancelled) stay None.
     """
-    Ensures the rewritten sentence retains the original meaning using semantic similarity.
+    return llm_client.chat_many(
+        sentences,
+        lambda sentence: rewrite_sentence(sentence, refresh),
+        lambda group: rewrite_batch(group, refresh),
+        mode or config.REWRITE_MODE,
+        batch_size or config.REWRITE_BATCH_SIZE,
+        workers or config.LLM_CONCURRENCY,
+        cache=get_cache() if config.LLM_CACHE_REWRITES and not refresh else None,
+        templates=(REWRITE_PROMPT, REWRITE_BATCH_PROMPT),
+        cancel=cancel,
+        what="rewrite",
+    )
+
+def validate_rewrites(originals, rewrites, threshold=None):
+    """Validate many rewrites with one batched embedding pass; missing or unchanged rewrites fail."""
+    threshold = config.REWRITE_MIN_SIMILARITY if threshold is None else threshold
+    checked = [i for i, (original, rewrite) in enumerate(zip(originals, rewrites)) if rewrite and rewrite != original]
+    valid = [False] * len(originals)
+    if not checked:
+        return valid
+
+    embeddings = encode_sentences([originals[i] for i in checked] + [rewrites[i] for i in checked])
+    similarities = (embeddings[: len(checked)] * embeddings[len(checked) :]).sum(dim=1)  # Normalized: dot = cosine
+    for i, similarity in zip(checked, similarities.tolist()):
+        valid[i] = similarity >= threshold
+    return valid
+
+@tracing.traced()
+def rewrite_and_validate(sentences, retries=None, cancel=None):
+    """Rewrite sentences and validate them as a batch; only the failures are rewritten again.
+
+    Returns `{sentence: rewrite}`, keeping the original sentence where no
+    rewrite passed validation.
     """
-    original_embedding = get_embedding(original)
-    rewritten_embedding = get_embedding(rewritten)
-    similarity = util.pytorch_cos_sim(original_embedding, rewritten_embedding).item()
+    retries = config.REWRITE_RETRIES if retries is None else retries
+    accepted = {}
+    pending = list(sentences)
+    for attempt in range(retries + 1):
+        if not pending or (cancel is not None and cancel.is_set()):
+            break
+        # Retries ask for a fresh sample instead of the cached rewrite that just failed
+        rewrites = rewrite_sentences(pending, refresh=attempt > 0, cancel=cancel)
+        failed = []
+        for sentence, rewrite, valid in zip(pending, rewrites, validate_rewrites(pending, rewrites)):
+            if valid:
+                accepted[sentence] = rewrite
+            else:
+                failed.append(sentence)
+        if failed:
+            again = " Rewriting them again..." if attempt < retries else ""
+            print(f"⚠️ {len(failed)} of {len(pending)} rewrites failed validation.{again}")
+        pending = failed
+    accepted.update((sentence, sentence) for sentence in pending)
+    return accepted
 
-    # Acceptable similarity range: 0.65 - 0.85 (Ensures meaning is preserved)
-    return similarity >= 0.65
+def apply_rewrites(text, spans, replacements):
+    """Build the rewritten text in one pass; `replacements` maps sentence index to its new text.
 
-def process_plagiarism_removal():
+    Only the sentences at the given spans are replaced, so other
+    occurrences of the same wording are left untouched.
+    """
+    pieces = []
+    cursor = 0
+    for i, (start, end) in enumerate(spans):
+        if i in replacements and start >= cursor:
+            pieces.append(text[cursor:start])
+            pieces.append(replacements[i])
+            cursor = end
+    pieces.append(text[cursor:])
+    return "".join(pieces)
+
+def process_plagiarism_removal(document_id=None, cancel=None):
     """Main function to detect and rewrite plagiarized content."""
     print("🔍 Fetching latest document...")
-    document = fetch_latest_document()
+    document = fetch_latest_document(document_id)
     
     if not document:
         print("⚠️ No document found.")
         return
     
     original_text = document["content"]
-    reference_texts = [doc["content"] for doc in db["websave"].find({}, {"content": 1, "_id": 0})]
+    query = {"document_id": document["_id"]}
+    references = []
+    for doc in websave_collection.find(query, text_projection("url")):
+        text = unpack_text(doc)
+        if text is not None:
+            references.append((doc.get("url", ""), text))
+    original_sentences = document_sentences(document)
+    reference_hashes = sorted({content_hash(text) for _, text in references})
+
+    previous = incremental.previous_result(rewritten_collection, document) if config.INCREMENTAL_RECHECK else None
+    reusable = previous and "flags" in previous and set(previous["reference_hashes"]) <= set(reference_hashes)
 
     print("🔎 Detecting plagiarized content...")
-    plagiarized_sentences = detect_plagiarism(original_text, reference_texts)
+    if reusable:
+        flags = detect_revision(original_sentences, references, previous)
+    else:
+        reference_sentences, reference_embeddings = embed_references(references)
+        flags = flag_sentences(
+            original_sentences, reference_sentences, reference_embeddings=reference_embeddings,
+            reference_key=ann_index.reference_key(content_hash(text) for _, text in references),
+        )
+    plagiarized_sentences = list(dict.fromkeys(s for s, flagged in zip(original_sentences, flags) if flagged))
 
     if not plagiarized_sentences:
         print("✅ No plagiarism detected.")
         return
 
-    rewritten_sentences = {}
+    previous_rewrites = previous.get("rewritten_sentences", {}) if reusable else {}
+    # Rewrites validated for the previous version are kept as they are
+    rewritten_sentences = {
+        sentence: previous_rewrites[sentence]
+        for sentence in plagiarized_sentences
+        if previous_rewrites.get(sentence, sentence) != sentence
+    }
 
     print("✍️ Rewriting plagiarized sentences...")
-    for sentence in plagiarized_sentences:
-        rewritten = rewrite_text_mistral(sentence)
-
-        # Validate the rewritten text
-        if validate_rewrite(sentence, rewritten):
-            rewritten_sentences[sentence] = rewritten
-        else:
-            print(f"⚠️ Failed validation for: {sentence} → Rewriting again...")
-            rewritten = rewrite_text_mistral(sentence)  # Try again
-            rewritten_sentences[sentence] = rewritten if validate_rewrite(sentence, rewritten) else sentence
+    todo = [sentence for sentence in plagiarized_sentences if sentence not in rewritten_sentences]
+    rewritten_sentences.update(rewrite_and_validate(todo, cancel=cancel))
+    if cancel is not None and cancel.is_set():
+        print("❌ Plagiarism removal canceled.")
+        return
 
-    # Replace plagiarized sentences with rewritten ones
-    rewritten_text = original_text
-    for original, rewritten in rewritten_sentences.items():
-        rewritten_text = rewritten_text.replace(original, rewritten)
+    # Replace the flagged sentences with their rewrites, at their own positions only
+    replacements = {
+        i: rewritten_sentences[sentence]
+        for i, (sentence, flagged) in enumerate(zip(original_sentences, flags))
+        if flagged and rewritten_sentences.get(sentence, sentence) != sentence
+    }
+    rewritten_text = apply_rewrites(original_text, document_spans(document), replacements)
 
     print("🚀 Plagiarism removed successfully!")
 
@@ -115,7 +273,11 @@ def process_plagiarism_removal():
         "timestamp": datetime.utcnow(),
         "original_content": original_text,
         "rewritten_content": rewritten_text,
-        "rewritten_sentences": rewritten_sentences
+        "rewritten_sentences": rewritten_sentences,
+        "document_id": document["_id"],
+        "sentences": original_sentences,
+        "flags": flags,
+        "reference_hashes": reference_hashes,
     })
 
     print("✅ Rewritten content stored successfully.")
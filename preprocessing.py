@@ -0,0 +1,94 @@
+"""Sentence segmentation and normalization, done once per document.
+
+The result is cached on the document record under `preprocessed`:
+
+    {"version": ..., "sentences": [...], "spans": [[start, end], ...], "normalized": [...]}
+
+`sentences` are the sentences as written, `spans` their character offsets in
+the stored content (for highlighting) and `normalized` the same sentences
+after `preprocess_text`, as compared by the plagiarism checker. Large batches
+are segmented on a process pool.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import config
+from storage import BulkWriter
+from text_utils import locate_sentences, preprocess_text, sent_tokenize
+
+stats = {"texts": 0, "cached": 0, "sentences": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def preprocess(text):
+    """Sentences of `text` with their character spans and normalized forms."""
+    sentences = sent_tokenize(text)
+    return {
+        "version": config.PREPROCESS_VERSION,
+        "sentences": sentences,
+        "spans": [list(span) for span in locate_sentences(text, sentences)],
+        "normalized": [preprocess_text(sentence) for sentence in sentences],
+    }
+
+def preprocess_many(texts, workers=None):
+    """Preprocess many texts, on a process pool when there are at least PREPROCESS_POOL_MIN of them."""
+    texts = list(texts)
+    workers = workers or config.PREPROCESS_WORKERS or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers > 1 and len(texts) >= config.PREPROCESS_POOL_MIN:
+        chunksize = max(1, len(texts) // (workers * 4))
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(preprocess, texts, chunksize=chunksize))
+    else:
+        results = [preprocess(text) for text in texts]
+
+    with _stats_lock:
+        stats["texts"] += len(texts)
+        stats["sentences"] += sum(len(result["sentences"]) for result in results)
+        stats["seconds"] += time.perf_counter() - start
+    return results
+
+def ensure_preprocessed(documents, workers=None):
+    """Attach `preprocessed` to every document record, segmenting and storing only the missing ones."""
+    documents = list(documents)
+    missing = [
+        doc for doc in documents
+        if doc.get("content") is not None and (doc.get("preprocessed") or {}).get("version") != config.PREPROCESS_VERSION
+    ]
+    with _stats_lock:
+        stats["cached"] += len(documents) - len(missing)
+    if missing:
+        results = preprocess_many((doc["content"] for doc in missing), workers)
+        with BulkWriter(config.get_collection("documents")) as writer:
+            for doc, result in zip(missing, results):
+                doc["preprocessed"] = result
+                writer.update({"_id": doc["_id"]}, {"$set": {"preprocessed": result}})
+    return documents
+
+def document_sentences(document, normalized=False):
+    """Cached sentences of a document record (normalized ones with `normalized=True`)."""
+    ensure_preprocessed([document])
+    return document["preprocessed"]["normalized" if normalized else "sentences"]
+
+def document_spans(document):
+    """Character `(start, end)` of every cached sentence in the document content."""
+    ensure_preprocessed([document])
+    return [tuple(span) for span in document["preprocessed"]["spans"]]
+
+def preprocess_document(document_id=None):
+    """Pipeline stage: make sure the given (or latest) document has cached sentences."""
+    documents = config.get_collection("documents")
+    document_id = config.resolve_document_id(document_id)
+    document = documents.find_one({"_id": document_id}) if document_id is not None else None
+    if not document or not document.get("content"):
+        return "⚠️ No document found for preprocessing."
+    cached = (document.get("preprocessed") or {}).get("version") == config.PREPROCESS_VERSION
+    sentences = document_sentences(document)
+    return f"✅ {len(sentences)} sentences {'cached' if cached else 'segmented'}."
+
+def report():
+    return (
+        f"Tokenization: {stats['texts']} texts segmented ({stats['cached']} cached), "
+        f"{stats['sentences']} sentences in {stats['seconds']:.2f}s"
+    )
@@ -0,0 +1,166 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import numpy as np
+import config
+
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+def normalize_url(url):
+    """Canonical form of a URL, so mirrors of the same address compare equal.
+
+    Lowercases scheme and host, drops "www.", default ports, fragments,
+    tracking parameters and a trailing slash, and sorts the query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/") or "/"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    # http and https versions of a page are the same reference
+    return urlunsplit(("https" if scheme == "http" else scheme, host, path, urlencode(query), ""))
+
+def normalize_text(text):
+    """Whitespace- and case-insensitive form used for hashing paragraphs and pages."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def text_hash(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+def simhash(text, bits=64, shingle=3):
+    """SimHash fingerprint of a text over overlapping word shingles.
+
+    Texts that share most of their shingles get fingerprints a few bits
+    apart, so near-duplicate pages are found by Hamming distance.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < shingle:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i : i + shingle]) for i in range(len(words) - shingle + 1)]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=np.uint64,
+    )
+    bit_values = (hashes[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)
+    votes = bit_values.sum(axis=0) * 2 > len(shingles)
+    return sum(1 << i for i, vote in enumerate(votes) if vote)
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class ReferenceDeduper:
+    """Filters reference pages of one run before they are stored or compared.
+
+    A page is dropped when its normalized URL or its normalized text was seen
+    before, or when its SimHash is within `max_distance` bits of a kept page
+    (mirrors, syndicated copies). From the rest, paragraphs that repeat a
+    paragraph already kept from another page (shared navigation, footers)
+    and short paragraphs that are entirely a boilerplate string (cookie
+    banners, "Sign up", "Share this article") are stripped; every dropped
+    paragraph is recorded in `dropped` with the reason. Works on a stream:
+    each page is judged against the pages kept so far, so callers feed pages
+    in a fixed order (e.g. search rank) to get the same result every run.
+    """
+
+    def __init__(self, max_distance=None, min_chars=None, patterns=None):
+        self.max_distance = config.SIMHASH_MAX_DISTANCE if max_distance is None else max_distance
+        self.min_chars = config.MIN_REFERENCE_CHARS if min_chars is None else min_chars
+        self.boilerplate = re.compile("|".join(f"(?:{p})" for p in patterns or config.BOILERPLATE_PATTERNS), re.IGNORECASE)
+        self.dropped = []
+        self._urls = set()
+        self._texts = set()
+        self._paragraphs = set()
+        self._fingerprints = []
+        self.stats = {"pages": 0, "kept": 0, "duplicate_urls": 0, "duplicate_content": 0, "near_duplicates": 0, "repeated_paragraphs": 0, "boilerplate_paragraphs": 0, "short": 0}
+
+    def seen_url(self, url):
+        """True if an equivalent URL was already accepted; otherwise remembers it."""
+        key = normalize_url(url)
+        if key in self._urls:
+            return True
+        self._urls.add(key)
+        return False
+
+    def strip_boilerplate(self, text, url=None):
+        """Drop repeated and boilerplate paragraphs; paragraphs are separated by newlines."""
+        kept = []
+        for paragraph in text.split("\n"):
+            key = normalize_text(paragraph)
+            if not key:
+                continue
+            if key in self._paragraphs:
+                reason = "repeated"
+            elif len(key) < config.BOILERPLATE_MAX_CHARS and self.boilerplate.fullmatch(key):
+                reason = "boilerplate"
+            else:
+                kept.append((key, paragraph))
+                continue
+            self.stats[f"{reason}_paragraphs"] += 1
+            self.dropped.append({"url": url, "reason": reason, "paragraph": paragraph.strip()[:120]})
+        self._paragraphs.update(key for key, _ in kept)
+        return "\n".join(paragraph for _, paragraph in kept)
+
+    def report(self, limit=None):
+        """Dedup counters plus the first `limit` dropped paragraphs, one per line."""
+        limit = config.BOILERPLATE_LOG_LIMIT if limit is None else limit
+        lines = [f"🧹 Reference dedup: {self.stats}"]
+        lines += [f"   - dropped {d['reason']} paragraph from {d['url']}: {d['paragraph']!r}" for d in self.dropped[:limit]]
+        if len(self.dropped) > limit:
+            lines.append(f"   ... and {len(self.dropped) - limit} more")
+        return "\n".join(lines)
+
+    def keep(self, url, text):
+        """Register an already cleaned page (e.g. carried over from an earlier run) without changing it."""
+        self.seen_url(url)
+        self._texts.add(text_hash(text))
+        self._fingerprints.append(simhash(text))
+        self._paragraphs.update(key for key in map(normalize_text, text.split("\n")) if key)
+
+    def clean(self, url, text):
+        """Return the cleaned text of a page, or None if it is a duplicate or too short to use."""
+        self.stats["pages"] += 1
+        if self.seen_url(url):
+            self.stats["duplicate_urls"] += 1
+            return None
+
+        digest = text_hash(text)
+        if digest in self._texts:
+            self.stats["duplicate_content"] += 1
+            return None
+
+        fingerprint = simhash(text)
+        if any(hamming(fingerprint, kept) <= self.max_distance for kept in self._fingerprints):
+            self.stats["near_duplicates"] += 1
+            return None
+
+        cleaned = self.strip_boilerplate(text, url)
+        if len(cleaned) <= self.min_chars:
+            self.stats["short"] += 1
+            return None
+
+        self._texts.add(digest)
+        self._fingerprints.append(fingerprint)
+        self.stats["kept"] += 1
+        return cleaned
+
+def dedupe_urls(urls_by_topic):
+    """Collapse URLs that normalize to the same address; returns {url: [topics]} in search order."""
+    topics_by_key = {}
+    first_url = {}
+    for topic, urls in urls_by_topic.items():
+        for url in urls:
+            key = normalize_url(url)
+            first_url.setdefault(key, url)
+            topics = topics_by_key.setdefault(key, [])
+            if topic not in topics:
+                topics.append(topic)
+    return {first_url[key]: topics for key, topics in topics_by_key.items()}
@@ -1,13 +1,10 @@
-from pymongo import MongoClient
+import config
 
-# Connect to MongoDB (Make sure MongoDB is running)
-client = MongoClient("mongodb://localhost:27017/")
-
-# Database Name
-db = client["plagir"]
+# Connect to MongoDB (Make sure MongoDB is running); URI and database name come from config
+db = config.get_db()
 
 # List of required collections
-collections = ["documents", "web_results", "plagrem" , "websave" , "plagiarism_reports" , "aigrnrel"]
+collections = ["documents", "web_results", "plagrem" , "websave" , "plagiarism_reports" , "aigenrel"]
 
 # Create collections if they don't exist
 for collection in collections:
@@ -17,4 +14,7 @@ for collection in collections:
     else:
         print(f"Collection '{collection}' already exists.")
 
+# Per-document lookup, content-hash and retention (TTL) indexes
+config.ensure_indexes(db)
+
 print("✅ MongoDB setup complete.")
\ No newline at end of file
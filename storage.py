@@ -0,0 +1,73 @@
+import threading
+import zlib
+from bson.binary import Binary
+from pymongo import InsertOne, UpdateOne
+import config
+
+def pack_text(text, field="content"):
+    """Fields storing `text`: zlib-compressed under `<field>_z` when it is large, plain otherwise."""
+    if text is not None and len(text) >= config.COMPRESS_MIN_BYTES:
+        return {f"{field}_z": Binary(zlib.compress(text.encode("utf-8"), config.COMPRESS_LEVEL))}
+    return {field: text}
+
+def unpack_text(record, field="content"):
+    """Text stored by pack_text (or by older code in plain form); None if the record has neither."""
+    if record.get(f"{field}_z") is not None:
+        return zlib.decompress(record[f"{field}_z"]).decode("utf-8")
+    return record.get(field)
+
+def text_projection(*fields, field="content"):
+    """Projection loading `fields` plus both stored forms of the text field."""
+    projection = {name: 1 for name in fields}
+    projection.update({field: 1, f"{field}_z": 1, "_id": 0})
+    return projection
+
+class BulkWriter:
+    """Buffers writes for one collection and sends them as unordered bulk writes.
+
+    Operations are flushed every `batch_size` operations and when the writer
+    is flushed or closed (also on leaving a `with` block), so many small
+    writes cost one round trip per batch. Unordered batches let the server
+    apply them in parallel and keep going past a failed operation.
+    """
+
+    def __init__(self, collection, batch_size=None):
+        self.collection = collection
+        self.batch_size = batch_size or config.BULK_WRITE_SIZE
+        self.stats = {"operations": 0, "batches": 0, "errors": 0}
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def insert(self, document):
+        self._add(InsertOne(document))
+
+    def update(self, query, update, upsert=False):
+        self._add(UpdateOne(query, update, upsert=upsert))
+
+    def _add(self, operation):
+        with self._lock:
+            self._pending.append(operation)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            self.collection.bulk_write(pending, ordered=False)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"❌ Bulk write to {self.collection.name} failed: {e}")
+        self.stats["operations"] += len(pending)
+        self.stats["batches"] += 1
+
+    close = flush
@@ -0,0 +1,59 @@
+import os
+import sys
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """A fresh in-memory MongoDB (mongomock) behind `config.get_db()`."""
+    mongomock = pytest.importorskip("mongomock")
+    import config
+
+    monkeypatch.setattr(config, "_client", mongomock.MongoClient())
+    monkeypatch.setattr(config, "_indexes_ready", False)
+    return config.get_db()
+
+class WordHashEncoder:
+    """Deterministic stand-in for the embedding model: hashed bag of words, L2-normalized."""
+
+    dim = 64
+
+    def encode(self, sentences, batch_size=None, convert_to_tensor=False, normalize_embeddings=False):
+        import re
+        import zlib
+        import numpy as np
+
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in re.findall(r"\w+", sentence.lower()):
+                vectors[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        if convert_to_tensor:
+            import torch
+
+            return torch.from_numpy(vectors)
+        return vectors
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Put `WordHashEncoder` in place of the shared embedding model."""
+    import embedding_service
+
+    encoder = WordHashEncoder()
+    monkeypatch.setattr(embedding_service, "_model", encoder)
+    return encoder
+
+@pytest.fixture
+def simple_sentences(monkeypatch):
+    """Split sentences on end punctuation instead of NLTK's punkt (which may not be downloaded)."""
+    import re
+    import nltk.tokenize
+    import text_utils
+
+    monkeypatch.setattr(text_utils, "_punkt_ready", True)
+    monkeypatch.setattr(nltk.tokenize, "sent_tokenize", lambda text: [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s])
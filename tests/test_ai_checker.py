@@ -0,0 +1,114 @@
+import json
+import threading
+
+import pytest
+import ai_checker
+import llm_client
+from ai_checker import analyze_text_for_ai, parse_batch_scores, parse_score, score_sentences
+from llm_cache import LLMCache
+
+@pytest.mark.parametrize("reply", [
+    '{"scores": [0.1, 0.9, 0.5]}',
+    'Sure! Here you go: {"scores": [0.1, 0.9, 0.5]} Hope that helps.',
+    "[0.1, 0.9, 0.5]",
+    '{"1": 0.1, "2": 0.9, "3": 0.5}',
+    "1. 0.1\n2) 0.9\n3: score = 0.5",
+])
+def test_reply_formats(reply):
+    assert parse_batch_scores(reply, 3) == [0.1, 0.9, 0.5]
+
+def test_missing_and_extra_scores():
+    assert parse_batch_scores('{"scores": [0.2]}', 3) == [0.2, None, None]
+    assert parse_batch_scores("[0.2, 0.3, 0.4, 0.5]", 2) == [0.2, 0.3]
+    assert parse_batch_scores('{"2": 0.4, "7": 0.9}', 3) == [None, 0.4, None]
+
+def test_invalid_values_become_none():
+    assert parse_batch_scores('{"scores": ["high", null, -0.5, 250]}', 4) == [None, None, None, None]
+
+def test_percentages_are_scaled():
+    assert parse_batch_scores("[80, 0.3]", 2) == [0.8, 0.3]
+
+def test_broken_json_falls_back_to_numbered_lines():
+    assert parse_batch_scores('{"scores": [0.1, \n1. 0.4\n2. 0.6', 2) == [0.4, 0.6]
+
+@pytest.mark.parametrize("reply", [None, "", "I cannot score these sentences."])
+def test_unusable_replies(reply):
+    assert parse_batch_scores(reply, 2) == [None, None]
+
+def test_single_reply():
+    assert parse_score("Score: 0.75") == 0.75
+    assert parse_score("no idea") is None
+
+class FakeLLM:
+    """Scores a sentence by its length; batched replies are JSON and may leave gaps."""
+
+    def __init__(self, gaps=()):
+        self.prompts = []
+        self.gaps = set(gaps)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def score(sentence):
+        return round(len(sentence) / 100, 2)
+
+    def __call__(self, prompt, response_format=None, **kwargs):
+        with self.lock:
+            self.prompts.append(prompt)
+        if response_format != "json":
+            return f"Score: {self.score(prompt.rsplit(chr(10), 1)[-1])}"
+        lines = [line.split(". ", 1)[1] for line in prompt.split("\n") if line[:1].isdigit()]
+        return json.dumps({"scores": [None if s in self.gaps else self.score(s) for s in lines]})
+
+@pytest.fixture
+def llm(monkeypatch, tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"))
+    monkeypatch.setattr(ai_checker, "get_cache", lambda: cache)
+    fake = FakeLLM()
+    monkeypatch.setattr(llm_client, "chat", fake)
+    return fake
+
+SENTENCES = [f"Sentence number {i} {'x' * i}." for i in range(10)]
+
+def test_batches_need_fewer_requests_and_give_the_same_scores(llm):
+    single = score_sentences(SENTENCES, "single", use_cache=False)
+    requests = len(llm.prompts)
+    batched = score_sentences(SENTENCES, "batch", batch_size=4, use_cache=False)
+
+    assert single == batched == [FakeLLM.score(s) for s in SENTENCES]
+    assert requests == 10
+    assert len(llm.prompts) - requests == 3
+
+def test_missing_batch_scores_fall_back_per_sentence(llm):
+    llm.gaps = {SENTENCES[1]}
+
+    scores = score_sentences(SENTENCES[:3], "batch", use_cache=False)
+
+    assert scores == [FakeLLM.score(s) for s in SENTENCES[:3]]
+    assert len(llm.prompts) == 2
+
+def test_scores_are_reused_across_modes_and_batches(llm):
+    score_sentences(SENTENCES[:4], "batch", batch_size=2)
+    llm.prompts.clear()
+
+    scores = score_sentences(SENTENCES[2:6], "single")
+
+    assert scores == [FakeLLM.score(s) for s in SENTENCES[2:6]]
+    assert len(llm.prompts) == 2  # Only the two new sentences
+
+def test_cancelled_scoring_sends_nothing(llm):
+    cancel = threading.Event()
+    cancel.set()
+
+    assert score_sentences(SENTENCES[:3], "batch", cancel=cancel) == [None, None, None]
+    assert llm.prompts == []
+
+def test_revision_scores_only_changed_sentences(llm):
+    _, previous = analyze_text_for_ai("x", sentences=SENTENCES[:3])
+    llm.prompts.clear()
+    revised = [SENTENCES[0], "A brand new sentence.", SENTENCES[2]]
+
+    percentage, results = analyze_text_for_ai("x", previous_results=previous, sentences=revised)
+
+    assert [r["raw_score"] for r in results] == [FakeLLM.score(s) for s in revised]
+    assert len(llm.prompts) == 1
+    assert percentage == round(sum(FakeLLM.score(s) for s in revised) / 3 * 100, 2)
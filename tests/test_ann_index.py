@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import ann_index
+import config
+from ann_index import BruteForceIndex, IVFIndex, build_index, get_index, measure_recall
+
+def clustered(n=4000, dim=32, clusters=40, seed=0):
+    """Unit vectors around random centres, like sentence embeddings of related pages."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    vectors = centres[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ANN_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(ann_index, "_loaded", ann_index.OrderedDict())
+    return tmp_path
+
+def test_brute_force_is_exact():
+    vectors = clustered(300)
+    scores, ids = BruteForceIndex(vectors, chunk_size=7).search(vectors[:20], 5)
+
+    expected = np.argsort(-(vectors[:20] @ vectors.T), axis=1)[:, :5]
+    assert (ids == expected).all()
+    assert np.allclose(scores[:, 0], 1, atol=1e-5)
+
+def test_ivf_recall_at_k():
+    vectors = clustered()
+    queries = clustered(200, seed=1)
+    index = IVFIndex(vectors, nprobe=16)
+
+    assert measure_recall(index, vectors, queries, k=10) >= 0.9
+
+def test_more_probes_raise_recall():
+    vectors = clustered()
+    queries = clustered(200, seed=1)
+    index = IVFIndex(vectors)
+
+    _, truth = BruteForceIndex(vectors).search(queries, 10)
+    recall = []
+    for nprobe in (1, 4, index.nlist):
+        _, found = index.search(queries, 10, nprobe=nprobe)
+        recall.append(np.mean([len(set(t) & set(f)) / 10 for t, f in zip(truth, found)]))
+    assert recall[0] <= recall[1] <= recall[2] == 1.0
+
+def test_missing_slots_are_minus_one():
+    scores, ids = IVFIndex(clustered(50), nlist=5, nprobe=1).search(clustered(3, seed=2), 50)
+
+    assert ids.shape == (3, 50)
+    assert ((ids == -1) == np.isinf(scores)).all()
+
+def test_auto_method_switches_at_the_threshold(monkeypatch):
+    monkeypatch.setattr(config, "ANN_MIN_VECTORS", 100)
+
+    assert ann_index.resolve_method(99, "auto") == "brute"
+    assert ann_index.resolve_method(100, "auto") in ("ivf", "hnsw")
+    with pytest.raises(ValueError):
+        build_index(clustered(10), "lsh")
+
+def test_index_is_saved_and_reloaded(index_dir, monkeypatch):
+    vectors = clustered(500)
+    key = ann_index.reference_key(["a", "b"])
+    first = get_index(vectors, "ivf", key)
+    assert list(index_dir.iterdir())
+
+    monkeypatch.setattr(ann_index, "_loaded", ann_index.OrderedDict())  # A new process
+    monkeypatch.setattr(ann_index, "build_index", lambda *args: pytest.fail("index rebuilt"))
+    loaded = get_index(vectors, "ivf", key)
+
+    assert loaded is not first
+    queries = clustered(20, seed=3)
+    assert (loaded.search(queries, 5)[1] == first.search(queries, 5)[1]).all()
+    assert get_index(vectors, "ivf", key) is loaded  # Kept in memory afterwards
+
+def test_other_reference_sets_get_their_own_index(index_dir):
+    vectors = clustered(500)
+
+    first = get_index(vectors, "ivf", ann_index.reference_key(["a"]))
+    second = get_index(vectors[:400], "ivf", ann_index.reference_key(["b"]))
+
+    assert first is not second and len(second) == 400
+
+@pytest.mark.skipif(ann_index.faiss is None, reason="faiss is not installed")
+def test_hnsw_recall_at_k():
+    vectors = clustered()
+    assert measure_recall(ann_index.FaissHNSWIndex(vectors), vectors, clustered(200, seed=1)) >= 0.9
+
+def test_semantic_stage_finds_the_same_matches_through_an_index(fake_model):
+    import plagiarism_checker
+
+    refs = [f"reference sentence number {i} about topic {i % 7}" for i in range(300)]
+    originals = ["reference sentence number 12 about topic 5", "something else entirely", "topic 3 reference sentence"]
+
+    exact = plagiarism_checker.semantic_matches(originals, refs, 0.75, semantic_index="brute")
+    approximate = plagiarism_checker.semantic_matches(originals, refs, 0.75, semantic_index=IVFIndex(
+        fake_model.encode(refs, normalize_embeddings=True), nprobe=64))
+
+    assert approximate == exact
+    assert 12 in exact[0]
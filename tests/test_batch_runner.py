@@ -0,0 +1,82 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import batch_runner
+from batch_runner import collect_files, load_journal, run_batch
+
+def write(path, text="An essay."):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_directory_is_searched_recursively_for_supported_files(tmp_path):
+    expected = [write(tmp_path / "a.txt"), write(tmp_path / "class" / "b.DOCX"), write(tmp_path / "class" / "c.txt")]
+    write(tmp_path / "notes.md")
+
+    assert collect_files(str(tmp_path)) == sorted(expected)
+
+def test_manifests_list_paths_relative_to_themselves(tmp_path):
+    (tmp_path / "lists").mkdir()
+    (tmp_path / "lists" / "batch.txt").write_text("# week 1\nessay.txt\n\n/abs/other.txt\n", encoding="utf-8")
+    (tmp_path / "lists" / "batch.json").write_text(json.dumps(["essay.txt"]), encoding="utf-8")
+
+    base = str(tmp_path / "lists")
+    assert collect_files(str(tmp_path / "lists" / "batch.txt")) == [os.path.join(base, "essay.txt"), "/abs/other.txt"]
+    assert collect_files(str(tmp_path / "lists" / "batch.json")) == [os.path.join(base, "essay.txt")]
+
+def test_journal_keeps_finished_files_and_ignores_a_torn_line(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    journal.write_text(
+        json.dumps({"path": "a", "digest": "1", "status": "done"}) + "\n"
+        + json.dumps({"path": "b", "digest": "2", "status": "failed"}) + "\n"
+        + '{"path": "c", "dig',
+        encoding="utf-8",
+    )
+
+    assert list(load_journal(str(journal))) == ["a|1"]
+    assert load_journal(str(tmp_path / "missing.jsonl")) == {}
+
+class ThreadPool(ThreadPoolExecutor):
+    """In-process stand-in for the spawned worker pool."""
+
+    def __init__(self, workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(workers)
+
+@pytest.fixture
+def fake_submissions(mongo, monkeypatch):
+    processed = []
+    def process_submission(path, reports_dir, remove=False):
+        processed.append(path)
+        if "broken" in path:
+            raise RuntimeError("unreadable file")
+        return {"report": os.path.join(reports_dir, "r.json"), "document_id": "id", "seconds": 0.1, "sentences": 3, "timings": {}}
+    monkeypatch.setattr(batch_runner, "ProcessPoolExecutor", ThreadPool)
+    monkeypatch.setattr(batch_runner, "process_submission", process_submission)
+    return processed
+
+def test_rerun_skips_finished_files_and_retries_failed_ones(tmp_path, fake_submissions):
+    files = [write(tmp_path / "in" / name) for name in ("a.txt", "b.txt", "broken.txt")]
+    journal = str(tmp_path / "journal.jsonl")
+
+    first = run_batch(files, str(tmp_path / "reports"), journal, workers=2)
+    second = run_batch(files, str(tmp_path / "reports"), journal, workers=2)
+
+    assert (first["processed"], first["failed"], first["skipped"]) == (2, 1, 0)
+    assert (second["processed"], second["failed"], second["skipped"]) == (0, 1, 2)
+    assert sorted(fake_submissions) == sorted(files + files[2:])
+
+def test_changed_file_is_processed_again(tmp_path, fake_submissions):
+    path = write(tmp_path / "in" / "a.txt")
+    journal = str(tmp_path / "journal.jsonl")
+    run_batch([path], str(tmp_path / "reports"), journal)
+
+    write(tmp_path / "in" / "a.txt", "A revised essay.")
+    summary = run_batch([path], str(tmp_path / "reports"), journal)
+
+    assert summary["processed"] == 1 and summary["skipped"] == 0
+
+def test_cli_reports_empty_sources(tmp_path, capsys):
+    assert batch_runner.main([str(tmp_path)]) == 1
+    assert "No .txt or .docx files" in capsys.readouterr().out
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+import collusion
+import config
+from embedding_store import EmbeddingStore
+from text_utils import locate_sentences
+
+rng = random.Random(3)
+VOCABULARY = [f"w{i}" for i in range(3000)]
+
+def sentence():
+    return " ".join(rng.choice(VOCABULARY) for _ in range(12)).capitalize() + "."
+
+def essay(sentences=20):
+    return [sentence() for _ in range(sentences)]
+
+@pytest.fixture
+def cohort_db(mongo, fake_model, tmp_path, monkeypatch):
+    monkeypatch.setattr(collusion, "get_store", lambda: EmbeddingStore(str(tmp_path / "store")))
+    def insert(sentences, filename="essay.txt"):
+        text = " ".join(sentences)
+        preprocessed = {
+            "version": config.PREPROCESS_VERSION,
+            "sentences": sentences,
+            "spans": locate_sentences(text, sentences),
+            "normalized": [s.lower() for s in sentences],
+        }
+        return mongo.documents.insert_one({"content": text, "filename": filename, "preprocessed": preprocessed}).inserted_id
+    return insert
+
+def test_copied_run_always_shares_a_fingerprint():
+    source = essay(5)
+    words = " ".join(source).split()
+    k, window = config.COLLUSION_KGRAM, config.COLLUSION_WINDOW
+    for start in range(0, len(words) - (k + window - 1), 7):
+        copy = [sentence() + " " + " ".join(words[start : start + k + window - 1]) + " " + sentence()]
+
+        assert set(collusion.winnow(source)) & set(collusion.winnow(copy))
+
+def test_copied_half_is_reported_and_unrelated_essays_are_not(cohort_db, mongo):
+    original = essay()
+    ids = [cohort_db(original), cohort_db(essay(10) + original[:10]), cohort_db(essay()), cohort_db(essay())]
+
+    report = collusion.detect_collusion(collusion.select_cohort(ids))
+
+    assert report["documents"] == 4 and report["all_pairs"] == 6
+    assert report["candidate_pairs"] < report["all_pairs"]
+    [pair] = report["pairs"]
+    assert {pair["a"], pair["b"]} == {ids[0], ids[1]}
+    assert pair["score"] == 0.5
+    match = pair["matches"][0]
+    document = mongo.documents.find_one({"_id": pair["a"]})
+    start, end = match["a_span"]
+    assert document["content"][start:end] == match["a_sentence"]
+
+def test_identical_submissions_are_reported_once(cohort_db):
+    text = essay()
+    alice, bob = cohort_db(text), cohort_db(text)
+    other = cohort_db(essay())
+
+    cohort = collusion.select_cohort(submissions=[("alice/essay.txt", alice), ("bob/essay.txt", bob), ("carol/essay.txt", other), ("dan/essay.txt", other)])
+    report = collusion.detect_collusion(cohort)
+
+    labels = sorted((pair["a_filename"], pair["b_filename"]) for pair in report["pairs"])
+    assert labels == [("alice/essay.txt", "bob/essay.txt"), ("carol/essay.txt", "dan/essay.txt")]
+    assert all(pair["identical"] for pair in report["pairs"])
+    assert report["submissions"] == 4
+
+def test_shared_assignment_prompt_is_not_collusion(cohort_db):
+    prompt = essay(3)
+    ids = [cohort_db(prompt + essay(10)) for _ in range(12)]
+
+    report = collusion.detect_collusion(collusion.select_cohort(ids))
+
+    assert report["pairs"] == []
+
+def test_superseded_versions_are_left_out(cohort_db, mongo):
+    first = cohort_db(essay())
+    second = cohort_db(essay())
+    mongo.documents.update_one({"_id": second}, {"$set": {"previous_id": first}})
+
+    assert [doc["_id"] for doc in collusion.select_cohort()] == [second]
+    assert {doc["_id"] for doc in collusion.select_cohort([first, second])} == {first, second}
+
+def test_report_is_stored(cohort_db, mongo):
+    original = essay()
+    ids = [cohort_db(original), cohort_db(original[:15] + essay(5))]
+
+    message = collusion.run_collusion(ids)
+
+    assert "1 suspicious pairs among 2 documents" in message
+    assert mongo.collusion_reports.count_documents({}) == 1
@@ -0,0 +1,42 @@
+import config
+import plagiarism_checker
+
+def test_every_results_collection_is_indexed_by_document(mongo):
+    config.ensure_indexes()
+
+    for name, indexes in config.INDEXES.items():
+        keys = [info["key"] for info in mongo[name].index_information().values()]
+        for expected in indexes:
+            assert [tuple(pair) for pair in expected] in [[tuple(pair) for pair in key] for key in keys]
+
+def test_retention_creates_ttl_indexes(mongo):
+    config.ensure_indexes()
+
+    ttl = mongo.websave.index_information()["created_at_ttl"]
+    assert ttl["expireAfterSeconds"] == config.RETENTION["websave"][1] * 24 * 3600
+
+def test_retention_can_be_switched_off(mongo, monkeypatch):
+    config.ensure_indexes()
+    monkeypatch.setitem(config.RETENTION, "websave", ("created_at", None))
+
+    config.ensure_indexes(mongo)
+
+    assert "created_at_ttl" not in mongo.websave.index_information()
+
+def test_latest_document_is_only_a_fallback(mongo):
+    first = mongo.documents.insert_one({"content": "a"}).inserted_id
+    second = mongo.documents.insert_one({"content": "b"}).inserted_id
+
+    assert config.resolve_document_id() == second
+    assert config.resolve_document_id(first) == first
+
+def test_references_are_scoped_to_their_document(mongo):
+    first = mongo.documents.insert_one({"content": "a"}).inserted_id
+    second = mongo.documents.insert_one({"content": "b"}).inserted_id
+    mongo.websave.insert_many([
+        {"document_id": first, "url": "https://a.example", "content": "Page for the first."},
+        {"document_id": second, "url": "https://b.example", "content": "Page for the second."},
+    ])
+
+    assert plagiarism_checker.fetch_web_references(first) == [("https://a.example", "page for the first.")]
+    assert [url for url, _ in plagiarism_checker.fetch_web_references()] == ["https://b.example"]
@@ -0,0 +1,60 @@
+import pytest
+import config
+import document_analyzer
+import llm_client
+from document_analyzer import candidate_phrases, chunk_text, clean_topics, extract_key_topics, extract_keyphrases
+
+ESSAY = [
+    "Neural networks learn representations from labelled training data.",
+    "Deep neural networks need large labelled training data sets.",
+    "Gradient descent adjusts the weights of neural networks.",
+    "Overfitting happens when neural networks memorise training data.",
+    "Regularisation and dropout reduce overfitting in deep networks.",
+]
+
+def test_candidates_do_not_cross_punctuation_or_stop_words():
+    phrases = candidate_phrases("The neural network, trained in 2020, failed.", max_words=2)
+
+    assert "neural network" in phrases and "network" in phrases
+    assert not any(p.startswith("the ") or "network trained" in p or "2020" in p for p in phrases)
+
+def test_keyphrases_are_relevant_distinct_and_capped(fake_model):
+    topics = extract_keyphrases(ESSAY, max_topics=4)
+
+    assert len(topics) == 4
+    assert topics[0] in ("neural networks", "training data", "labelled training data")
+    for i, topic in enumerate(topics):
+        for other in topics[i + 1 :]:
+            assert not set(topic.split()) <= set(other.split()) and not set(other.split()) <= set(topic.split())
+
+def test_no_usable_phrases():
+    assert extract_keyphrases(["", "   "]) == []
+    assert extract_keyphrases(["It is. Of the."]) == []
+
+def test_local_mode_needs_no_llm(fake_model, monkeypatch):
+    monkeypatch.setattr(llm_client, "cached_chat", lambda *args, **kwargs: pytest.fail("LLM called"))
+
+    assert extract_key_topics(" ".join(ESSAY), ESSAY, mode="local")
+
+def test_local_mode_falls_back_to_the_llm(monkeypatch):
+    monkeypatch.setattr(llm_client, "cached_chat", lambda template, text: "1. **Topic A**\n- Topic B: details\n")
+
+    assert extract_key_topics("It is.", ["It is."], mode="local") == ["Topic A", "Topic B"]
+
+def test_long_documents_are_reduced_chunk_by_chunk(monkeypatch):
+    monkeypatch.setattr(config, "TOPIC_CHUNK_CHARS", 60)
+    prompts = []
+    def cached_chat(template, text):
+        prompts.append(template)
+        return "\n".join(f"- topic {len(prompts)}.{i}" for i in range(3))
+    monkeypatch.setattr(llm_client, "cached_chat", cached_chat)
+
+    topics = document_analyzer.extract_topics_llm(" ".join(ESSAY), ESSAY, max_topics=2)
+
+    assert prompts.count(document_analyzer.TOPICS_PROMPT) == len(chunk_text(ESSAY, 60)) > 1
+    assert len(topics) == 2
+
+def test_clean_topics():
+    lines = ["Here are the key topics:", "1. Machine learning", "* machine learning", "**Ethics**: fairness of models", "", "- Data."]
+
+    assert clean_topics(lines, 5) == ["Machine learning", "Ethics", "Data"]
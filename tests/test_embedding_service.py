@@ -0,0 +1,63 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import embedding_service
+from embedding_store import EmbeddingStore
+
+@pytest.fixture
+def counted_loads(monkeypatch):
+    """Unloaded shared model whose (slow) loads are counted."""
+    from conftest import WordHashEncoder
+
+    loads = []
+    def load_model(backend=None):
+        loads.append(backend)
+        time.sleep(0.05)
+        return WordHashEncoder(), "cpu"
+    monkeypatch.setattr(embedding_service, "_model", None)
+    monkeypatch.setattr(embedding_service, "load_model", load_model)
+    return loads
+
+def test_model_is_loaded_lazily_and_once(counted_loads):
+    assert not embedding_service.is_loaded()
+    assert "not loaded" in embedding_service.report()
+
+    threads = [threading.Thread(target=embedding_service.get_model) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    embedding_service.encode(["one more sentence"])
+
+    assert len(counted_loads) == 1
+    assert embedding_service.is_loaded()
+    assert embedding_service.stats["device"] == "cpu"
+    assert embedding_service.stats["load_seconds"] >= 0.05
+
+def test_every_checker_encodes_through_the_shared_model(counted_loads):
+    import plagiarism_checker
+    import plagiarism_remover
+
+    plagiarism_checker.encode_sentences(["a sentence"])
+    plagiarism_remover.encode_sentences(["another sentence"])
+
+    assert len(counted_loads) == 1
+
+def test_encode_is_normalized(fake_model):
+    vectors = embedding_service.encode(["first sentence", "second one here"]).numpy()
+
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+
+def test_embed_references_uses_the_shared_model_and_store(fake_model, simple_sentences, tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+
+    sentences, embeddings = embedding_service.embed_references([("u", "A first line. A second line.")], store=store)
+
+    assert sentences == ["A first line.", "A second line."]
+    assert np.allclose(embeddings, fake_model.encode(sentences, normalize_embeddings=True))
+
+def test_unknown_backend(monkeypatch):
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        embedding_service.load_model("tensorflow")
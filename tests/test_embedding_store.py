@@ -0,0 +1,77 @@
+import multiprocessing
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+def _store_page(path, url, text, sentences, vectors):
+    EmbeddingStore(path).add(url, text, sentences, vectors)
+
+def _run(target, *args):
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0
+
+def test_round_trip(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    store.add("u", "One. Two.", ["One.", "Two."], vectors)
+
+    sentences, stored = EmbeddingStore(str(tmp_path)).get("u", "One. Two.")
+    assert sentences == ["One.", "Two."]
+    np.testing.assert_array_equal(stored, vectors)
+    assert EmbeddingStore(str(tmp_path)).get("u", "changed text") is None
+
+def test_store_opened_empty_reads_page_written_by_another_process(tmp_path):
+    # Like two batch workers that both open the store before anything is stored
+    reader = EmbeddingStore(str(tmp_path))
+    assert reader.dim is None
+    vectors = np.random.default_rng(0).random((3, 4), dtype=np.float32)
+    _run(_store_page, str(tmp_path), "u", "text", ["a", "b", "c"], vectors)
+
+    sentences, stored = reader.get("u", "text")
+    assert sentences == ["a", "b", "c"]
+    np.testing.assert_array_equal(stored, vectors)
+    assert reader.dim == 4
+
+def test_writers_in_several_processes_append_without_overlap(tmp_path):
+    rng = np.random.default_rng(1)
+    pages = [(f"u{i}", f"text {i}", [f"s{i}"] * (i + 1), rng.random((i + 1, 4), dtype=np.float32)) for i in range(4)]
+    processes = [multiprocessing.get_context("spawn").Process(target=_store_page, args=(str(tmp_path), *page)) for page in pages]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(str(tmp_path))
+    assert len(store) == 4
+    for url, text, sentences, vectors in pages:
+        np.testing.assert_array_equal(store.get(url, text)[1], vectors)
+
+def test_load_or_embed_encodes_only_new_pages(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    encoded = []
+
+    def encode(sentences):
+        encoded.extend(sentences)
+        return np.ones((len(sentences), 2), dtype=np.float32)
+
+    split = lambda text: text.split(". ")
+    store.load_or_embed([("a", "x. y")], split, encode)
+    sentences, matrix = store.load_or_embed([("a", "x. y"), ("b", "z")], split, encode)
+    assert encoded == ["x", "y", "z"]
+    assert sentences == ["x", "y", "z"]
+    assert matrix.shape == (3, 2)
+
+def test_unreferenced_tail_is_ignored_and_truncated(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add("a", "a", ["a"], np.ones((1, 2), dtype=np.float32))
+    with open(store._vectors_path, "ab") as f:
+        f.write(b"\0" * 5)  # A writer that crashed before committing
+
+    store.add("b", "b", ["b"], np.full((1, 2), 2, dtype=np.float32))
+    fresh = EmbeddingStore(str(tmp_path))
+    np.testing.assert_array_equal(fresh.get("a", "a")[1], [[1, 1]])
+    np.testing.assert_array_equal(fresh.get("b", "b")[1], [[2, 2]])
@@ -0,0 +1,34 @@
+import config
+import file_reader
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_identical_files_of_two_students_are_separate_documents(mongo, tmp_path):
+    config.ensure_indexes()
+    text = "The same essay, handed in twice."
+    _, alice = file_reader.store_file(write(tmp_path, "alice/essay.txt", text), owner="alice")
+    _, bob = file_reader.store_file(write(tmp_path, "bob/essay.txt", text), owner="bob")
+
+    assert alice != bob
+    assert {doc["owner"] for doc in mongo.documents.find()} == {"alice", "bob"}
+
+def test_re_upload_of_the_same_file_returns_the_stored_document(mongo, tmp_path):
+    path = write(tmp_path, "essay.txt", "An essay.")
+    _, first = file_reader.store_file(path, owner="alice")
+    message, again = file_reader.store_file(path, owner="alice")
+
+    assert again == first
+    assert "already stored" in message
+    assert mongo.documents.count_documents({}) == 1
+
+def test_content_hash_index_is_not_unique(mongo):
+    mongo.documents.create_index("content_hash", unique=True, name="content_hash_unique")
+    config.ensure_indexes()
+
+    indexes = mongo.documents.index_information()
+    assert "content_hash_unique" not in indexes
+    assert not indexes["content_hash_path"].get("unique")
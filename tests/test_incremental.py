@@ -0,0 +1,146 @@
+import pytest
+import config
+import plagiarism_checker
+import plagiarism_remover
+from incremental import align_sentences, match_counts, offsets_of, previous_result, split_by_offsets, summarize
+from text_utils import content_hash
+
+def test_unchanged_sentences_are_reused():
+    old = ["A.", "B.", "C.", "D."]
+    new = ["A.", "B2.", "C.", "D.", "E."]
+
+    assert align_sentences(old, new) == [0, None, 2, 3, None]
+
+def test_moved_and_deleted_sentences():
+    assert align_sentences(["A.", "B.", "C."], ["C.", "A."]) in ([None, 0], [2, None])
+    assert align_sentences(["A.", "B.", "C."], ["A.", "C."]) == [0, 2]
+
+def test_repeated_sentences_map_to_distinct_old_indices():
+    alignment = align_sentences(["X.", "Y.", "X."], ["X.", "Y.", "X."])
+
+    assert alignment == [0, 1, 2]
+
+def test_empty_versions():
+    assert align_sentences([], ["A."]) == [None]
+    assert align_sentences(["A."], []) == []
+
+def test_long_documents_are_not_treated_as_junk():
+    # difflib's autojunk would otherwise ignore sentences repeated in large documents
+    old = ["Same."] * 150 + ["Tail."]
+    new = ["Same."] * 150 + ["New tail."]
+
+    assert align_sentences(old, new) == list(range(150)) + [None]
+
+def test_offsets_round_trip():
+    groups = [["a"], [], ["b", "c"]]
+    offsets = offsets_of(groups)
+
+    assert offsets == [0, 1, 1, 3]
+    assert split_by_offsets([m for g in groups for m in g], offsets) == groups
+
+def test_summarize():
+    assert summarize([0, None, 1]) == "♻️ Reused 2/3 unchanged sentences from the previous version"
+
+def stored_document(mongo, sentences, **fields):
+    preprocessed = {"version": config.PREPROCESS_VERSION, "sentences": sentences, "normalized": sentences, "spans": []}
+    return mongo.documents.insert_one({"content": " ".join(sentences), "preprocessed": preprocessed, **fields}).inserted_id
+
+def overlap_matcher(monkeypatch):
+    """Replace embedding and matching by word overlap; returns the recorded match calls."""
+    calls = []
+
+    def match_sentences(original_sentences, ref_sentences, reference_embeddings=None, reference_key=None):
+        calls.append((list(original_sentences), list(ref_sentences)))
+        return [
+            [{"original": s, "match": ref, "method": "Exact Match"} for ref in ref_sentences if set(s.split()) & set(ref.split())]
+            for s in original_sentences
+        ]
+
+    monkeypatch.setattr(plagiarism_checker, "embed_references", lambda references: ([text for _, text in references], None))
+    monkeypatch.setattr(plagiarism_checker, "match_sentences", match_sentences)
+    return calls
+
+def test_streamed_revision_checks_only_changed_sentences_and_new_references(mongo, monkeypatch):
+    calls = overlap_matcher(monkeypatch)
+    previous_id = stored_document(mongo, ["alpha one", "beta two"])
+    mongo.plagiarism_reports.insert_one({
+        "document_id": previous_id,
+        "sentences": ["alpha one", "beta two"],
+        "matches": [{"original": "alpha one", "match": "alpha page", "method": "Exact Match"}],
+        "match_offsets": [0, 1, 1],
+        "reference_hashes": [content_hash("alpha page")],
+    })
+    document_id = stored_document(mongo, ["alpha one", "gamma three"], previous_id=previous_id)
+    mongo.websave.insert_many([
+        {"url": "a", "content": "alpha page", "document_id": document_id, "carried_from": previous_id},
+        {"url": "g", "content": "gamma page", "document_id": document_id},
+    ])
+
+    plagiarism_checker.process_plagiarism_check(document_id, stream=True)
+
+    assert sorted(calls) == [(["alpha one"], ["gamma page"]), (["gamma three"], ["alpha page", "gamma page"])]
+    report = mongo.plagiarism_reports.find_one({"document_id": document_id})
+    assert report["plagiarism_percentage"] == 100
+    assert report["reference_hashes"] == sorted({content_hash("alpha page"), content_hash("gamma page")})
+
+def test_streamed_revision_without_carried_references_is_checked_once_in_full(mongo, monkeypatch):
+    calls = overlap_matcher(monkeypatch)
+    previous_id = stored_document(mongo, ["alpha one"])
+    mongo.plagiarism_reports.insert_one({
+        "document_id": previous_id, "sentences": ["alpha one"], "matches": [], "match_offsets": [0, 0],
+        "reference_hashes": [content_hash("gone page")],
+    })
+    document_id = stored_document(mongo, ["alpha one"], previous_id=previous_id)
+    mongo.websave.insert_one({"url": "a", "content": "alpha page", "document_id": document_id})
+
+    plagiarism_checker.process_plagiarism_check(document_id, stream=True)
+
+    assert calls == [(["alpha one"], ["alpha page"])]
+
+def test_revision_reuses_full_counts_of_a_capped_report(mongo, monkeypatch):
+    calls = overlap_matcher(monkeypatch)
+    sentences = ["alpha one", "beta two", "delta four"]
+    previous_id = stored_document(mongo, sentences)
+    mongo.plagiarism_reports.insert_one({
+        "document_id": previous_id,
+        "sentences": sentences,
+        "matches": [{"original": "alpha one", "match": "alpha page", "method": "Exact Match"}],
+        "match_offsets": [0, 1, 1, 1],
+        "match_counts": [2, 0, 0],  # A streamed report kept one of two matches
+        "reference_hashes": [content_hash("alpha page")],
+    })
+    document_id = stored_document(mongo, sentences, previous_id=previous_id)
+    mongo.websave.insert_one({"url": "a", "content": "alpha page", "document_id": document_id})
+
+    plagiarism_checker.process_plagiarism_check(document_id, stream=False)
+
+    assert calls == []
+    report = mongo.plagiarism_reports.find_one({"document_id": document_id})
+    assert report["match_counts"] == [2, 0, 0]
+    assert report["plagiarism_percentage"] == pytest.approx(200 / 3)
+
+def test_previous_result_is_the_latest_of_the_previous_version(mongo):
+    reports = mongo["plagiarism_reports"]
+    reports.insert_many([{"document_id": 1, "n": 1}, {"document_id": 1, "n": 2}, {"document_id": 2, "n": 3}])
+
+    assert previous_result(reports, {"_id": 2, "previous_id": 1})["n"] == 2
+    assert previous_result(reports, {"_id": 1}) is None
+
+def test_match_counts_of_older_reports_come_from_offsets():
+    assert match_counts({"match_offsets": [0, 2, 2, 5]}) == [2, 0, 3]
+    assert match_counts({"match_offsets": [0, 2], "match_counts": [40]}) == [40]
+
+def test_removal_revision_rechecks_only_what_can_have_changed(monkeypatch):
+    calls = []
+    def flag_sentences(sentences, ref_sentences, reference_embeddings=None):
+        calls.append((list(sentences), list(ref_sentences)))
+        return [any(set(s.split()) & set(r.split()) for r in ref_sentences) for s in sentences]
+    monkeypatch.setattr(plagiarism_remover, "embed_references", lambda refs: ([text for _, text in refs], None))
+    monkeypatch.setattr(plagiarism_remover, "flag_sentences", flag_sentences)
+    previous = {"sentences": ["copied one", "own two", "own three"], "flags": [True, False, False], "reference_hashes": [content_hash("copied")]}
+    references = [("old", "copied"), ("new", "three")]
+
+    flags = plagiarism_remover.detect_revision(["copied one", "edited two", "own three"], references, previous)
+
+    assert flags == [True, False, True]
+    assert calls == [(["edited two"], ["copied", "three"]), (["own three"], ["three"])]
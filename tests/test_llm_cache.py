@@ -0,0 +1,76 @@
+import time
+
+import pytest
+import config
+import llm_client
+from llm_cache import LLMCache
+
+MODEL = "mistral"
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(str(tmp_path / "llm.sqlite3"), ttl=60, max_entries=3)
+
+def test_reformatted_input_shares_an_entry(cache):
+    cache.put(MODEL, "T: {text}", "Some  input\ntext", "reply")
+
+    assert cache.get(MODEL, "T: {text}", "Some input text") == "reply"
+    assert cache.get("other-model", "T: {text}", "Some input text") is None
+    assert cache.get(MODEL, "Other: {text}", "Some input text") is None
+
+def test_entries_persist_across_instances(cache):
+    cache.put(MODEL, "T", "input", "reply")
+
+    assert LLMCache(cache.path).get(MODEL, "T", "input") == "reply"
+
+def test_expired_entries_miss_and_are_evicted(cache):
+    cache.put(MODEL, "T", "input", "reply")
+    with cache._conn() as conn:
+        conn.execute("UPDATE responses SET created_at = created_at - 120")
+
+    assert cache.get(MODEL, "T", "input") is None
+    cache.evict()
+    with cache._conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for text in ("a", "b", "c", "d"):
+        cache.put(MODEL, "T", text, text.upper())
+        time.sleep(0.01)
+    cache.get(MODEL, "T", "a")  # Used again: now the most recent
+
+    cache.evict()
+
+    assert [cache.get(MODEL, "T", text) for text in "abcd"] == ["A", None, "C", "D"]
+
+def test_get_any_prefers_the_first_live_template(cache):
+    cache.put(MODEL, "batch", "input", "from batch")
+
+    assert cache.get_any(MODEL, ("single", "batch"), "input") == "from batch"
+    cache.put(MODEL, "single", "input", "from single")
+    assert cache.get_any(MODEL, ("single", "batch"), "input") == "from single"
+    assert cache.stats == {"hits": 2, "misses": 0, "writes": 2}
+    assert "100% hit rate" in cache.report()
+
+@pytest.fixture
+def chats(monkeypatch, cache):
+    replies = []
+    def chat(prompt, model=None, **kwargs):
+        replies.append(prompt)
+        return f"reply {len(replies)}"
+    monkeypatch.setattr(llm_client, "chat", chat)
+    monkeypatch.setattr(llm_client, "get_cache", lambda: cache)
+    return replies
+
+def test_cached_chat_reuses_replies(chats):
+    assert llm_client.cached_chat("Topics of: {text}", "essay") == "reply 1"
+    assert llm_client.cached_chat("Topics of: {text}", " essay ") == "reply 1"
+    assert chats == ["Topics of: essay"]
+
+def test_refresh_replaces_and_bypass_skips_the_cache(chats, cache):
+    llm_client.cached_chat("P: {text}", "essay")
+
+    assert llm_client.cached_chat("P: {text}", "essay", refresh=True) == "reply 2"
+    assert llm_client.cached_chat("P: {text}", "essay") == "reply 2"
+    assert llm_client.cached_chat("P: {text}", "essay", use_cache=False) == "reply 3"
+    assert cache.get(config.LLM_MODEL, "P: {text}", "essay") == "reply 2"
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+import config
+import llm_client
+from llm_cache import LLMCache
+
+SINGLE = "One: {text}"
+BATCH = "Many ({count}):\n{numbered}"
+
+def upper_parse(reply, count):
+    lines = reply.splitlines()[1:]
+    return [line.split(". ", 1)[1].upper() if "skip" not in line else None for line in lines][:count]
+
+@pytest.fixture
+def prompts(monkeypatch):
+    sent = []
+    def chat(prompt, **kwargs):
+        sent.append(prompt)
+        return prompt
+    monkeypatch.setattr(llm_client, "chat", chat)
+    return sent
+
+def test_batch_falls_back_per_item_and_caches_answers(prompts, tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"))
+    single = lambda item: f"single {item}"
+
+    answers = llm_client.chat_batch(["a", "skip b", "c"], BATCH, upper_parse, single, cache)
+
+    assert answers == ["A", "single skip b", "C"]
+    assert prompts == ["Many (3):\n1. a\n2. skip b\n3. c"]
+    assert cache.get(config.LLM_MODEL, BATCH, "c") == "C"
+    assert cache.get(config.LLM_MODEL, BATCH, "skip b") is None
+
+def test_failed_batch_request_answers_items_one_by_one(monkeypatch):
+    def chat(prompt, **kwargs):
+        raise ConnectionError("down")
+    monkeypatch.setattr(llm_client, "chat", chat)
+
+    assert llm_client.chat_batch(["a", "b"], BATCH, upper_parse, str.upper) == ["A", "B"]
+
+def test_many_sends_only_uncached_items_in_batches(prompts, tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"))
+    cache.put(config.LLM_MODEL, SINGLE, "b", "cached b")
+    batch = lambda group: llm_client.chat_batch(group, BATCH, upper_parse, None, cache)
+
+    answers = llm_client.chat_many(["a", "b", "c", "d"], None, batch, "batch", 2, 2, cache, (SINGLE, BATCH))
+
+    assert answers == ["A", "cached b", "C", "D"]
+    assert sorted(prompts) == ["Many (1):\n1. d", "Many (2):\n1. a\n2. c"]
+
+def test_many_single_mode_and_cached_parsing(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"))
+    cache.put(config.LLM_MODEL, BATCH, "b", "2")
+
+    answers = llm_client.chat_many(["1", "b"], int, None, "single", 1, 2, cache, (SINGLE, BATCH), parse_cached=int)
+
+    assert answers == [1, 2]
+
+def test_cancel_stops_new_requests():
+    cancel = threading.Event()
+    cancel.set()
+    calls = []
+
+    answers = llm_client.chat_many(["a", "b"], calls.append, None, "single", 1, 1, cancel=cancel)
+
+    assert answers == [None, None]
+    assert calls == []
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match="Unknown rewrite mode"):
+        llm_client.chat_many(["a"], str, None, "fast", 1, 1, what="rewrite")
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import config
+import local_corpus
+from local_corpus import ingest_shard, search
+
+ARTICLES = {
+    "photosynthesis.txt": "Photosynthesis converts light energy into chemical energy. Chlorophyll absorbs red and blue light.",
+    "volcanoes.txt": "Volcanoes erupt when magma rises through the crust. Lava cools into igneous rock.",
+    "rivers.txt": "Rivers carve valleys over millions of years. Sediment settles where the current slows.",
+}
+
+class ThreadPool(ThreadPoolExecutor):
+    """In-process stand-in for the spawned ingestion workers."""
+
+    def __init__(self, workers, mp_context=None):
+        super().__init__(workers)
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, simple_sentences):
+    monkeypatch.setattr(config, "LOCAL_CORPUS_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(config, "LOCAL_PASSAGE_SENTENCES", 1)
+    monkeypatch.setattr(local_corpus, "ProcessPoolExecutor", ThreadPool)
+    source = tmp_path / "articles"
+    source.mkdir()
+    for name, text in ARTICLES.items():
+        (source / name).write_text(text, encoding="utf-8")
+    return source
+
+def test_search_ranks_the_copied_passage_first(corpus):
+    summary = local_corpus.ingest(str(corpus), workers=2)
+
+    found = search(["Chlorophyll in leaves absorbs red and blue light."])
+
+    assert (summary["items"], summary["passages"]) == (3, 6)
+    assert found[0]["content"] == "Chlorophyll absorbs red and blue light."
+    assert found[0]["url"].startswith("local://") and found[0]["url"].endswith("photosynthesis.txt#1")
+
+def test_scores_do_not_depend_on_sharding(corpus, tmp_path, monkeypatch):
+    sentences = ["Magma rises and lava cools into rock.", "Light energy and chemical energy."]
+    results = []
+    for shards in (1, 5):
+        monkeypatch.setattr(config, "LOCAL_CORPUS_SHARDS", shards)
+        corpus_dir = str(tmp_path / f"index-{shards}")
+        local_corpus.ingest(str(corpus), corpus_dir=corpus_dir)
+        results.append({c["content"]: c["score"] for c in search(sentences, corpus_dir=corpus_dir)})
+
+    assert results[0] == results[1] and results[0]
+
+def test_rerun_skips_unchanged_files_and_reindexes_edited_ones(corpus):
+    local_corpus.ingest(str(corpus))
+    (corpus / "rivers.txt").write_text("Glaciers grind mountains into moraines.", encoding="utf-8")
+
+    summary = local_corpus.ingest(str(corpus))
+
+    assert (summary["items"], summary["skipped"]) == (1, 2)
+    assert all("Rivers" not in c["content"] for c in search(["Rivers carve valleys."]))
+    assert "Glaciers" in search(["Glaciers grind mountains."])[0]["content"]
+    assert local_corpus.corpus_stats()["sources"] == 3
+
+def test_excluded_sources_are_not_returned(tmp_path, monkeypatch, simple_sentences):
+    ingest_shard(0, [("text", "documents/1", "My own essay about tides."), ("text", "documents/2", "Another essay about tides.")], str(tmp_path))
+
+    found = search(["An essay about tides."], exclude_sources=["documents/1"], corpus_dir=str(tmp_path))
+
+    assert [c["url"] for c in found] == ["local://documents/2#0"]
+
+def test_passages_are_stored_as_references_of_the_document(corpus, mongo):
+    local_corpus.ingest(str(corpus))
+    sentences = ["Volcanoes erupt when magma rises.", "Lava cools into igneous rock."]
+    document_id = mongo.documents.insert_one({
+        "content": " ".join(sentences),
+        "preprocessed": {"version": config.PREPROCESS_VERSION, "sentences": sentences, "spans": [[0, 33], [34, 63]], "normalized": []},
+    }).inserted_id
+    pages = []
+
+    message, stored = local_corpus.store_local_references(document_id, on_page=pages.append)
+
+    assert "✅" in message and stored == len(pages) >= 2
+    assert {row["source"] for row in mongo.websave.find({"document_id": document_id})} == {"local"}
+
+    mongo.websave.delete_many({})
+    _, stored = local_corpus.store_local_references(document_id, skip_urls={pages[0]["url"]})
+    assert sorted(row["url"] for row in mongo.websave.find()) == sorted(page["url"] for page in pages[1:])
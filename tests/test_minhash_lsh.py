@@ -0,0 +1,61 @@
+import random
+
+import pytest
+from minhash_lsh import MinHashLSH, brute_force_matches, candidate_probability, char_ngrams, jaccard, measure_recall
+from plagiarism_checker import exact_matches
+
+WORDS = "source essay student library research paper method result data model theory claim evidence".split()
+
+def corpus(seed=7, size=300):
+    """Random reference sentences plus lightly edited copies of some of them as the document."""
+    rng = random.Random(seed)
+    refs = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(size)]
+    originals = []
+    for ref in rng.sample(refs, 40):
+        words = ref.split()
+        words[rng.randrange(len(words))] = rng.choice(WORDS)  # One word changed
+        originals.append(" ".join(words))
+    originals += [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(20)]
+    return originals, refs
+
+def test_jaccard_and_ngrams():
+    assert char_ngrams("abcd") == {"abc", "bcd"}
+    assert char_ngrams("ab") == set()
+    assert jaccard({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+    assert jaccard(set(), set()) == 0
+
+def test_lsh_finds_what_brute_force_finds():
+    originals, refs = corpus()
+    threshold = 0.85
+    expected = brute_force_matches(originals, refs, threshold)
+
+    index = MinHashLSH().add_all(refs)
+    found = [index.query(sentence, threshold) for sentence in originals]
+
+    total = sum(len(hits) for hits in expected)
+    recalled = sum(len(hits & truth) for hits, truth in zip(found, expected))
+    assert total > 0
+    assert recalled / total >= 0.95
+    assert all(hits <= truth for hits, truth in zip(found, expected))  # Every hit is verified exactly
+
+def test_recall_report_checks_far_fewer_pairs_than_brute_force():
+    originals, refs = corpus()
+    report = measure_recall(originals, refs, 0.85)
+
+    assert report["recall"] >= 0.95
+    assert report["candidates_checked"] < report["brute_force_pairs"] / 10
+
+def test_exact_stage_methods_agree():
+    originals, refs = corpus(seed=11)
+
+    assert exact_matches(originals, refs, 0.9, method="lsh") == exact_matches(originals, refs, 0.9, method="brute")
+
+def test_candidate_probability_is_an_s_curve():
+    assert candidate_probability(0.9, 16, 8) > 0.99
+    assert candidate_probability(0.3, 16, 8) < 0.01
+
+def test_short_sentences_never_match():
+    index = MinHashLSH().add_all(["ab", "abcdef"])
+
+    assert index.query("ab", 0.5) == set()
+    assert index.query("abcdef", 0.5) == {1}
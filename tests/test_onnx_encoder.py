@@ -0,0 +1,75 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import config
+import embedding_service
+from embedding_store import default_path
+
+SENTENCES = ["the essay cites a source.", "copy this text", "a", "this student copied the text of a source essay and cited it."]
+WORDS = "the a an of to and in is it on for with as by this that essay source student cite cites copy copied text sentence model".split()
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """A small random BERT checkpoint saved locally, so nothing is downloaded."""
+    pytest.importorskip("onnxruntime")
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("sentence_transformers")
+
+    directory = str(tmp_path_factory.mktemp("tiny-bert"))
+    with open(os.path.join(directory, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS + list("abcdefghijklmnopqrstuvwxyz.,")))
+    transformers.BertTokenizerFast(vocab_file=os.path.join(directory, "vocab.txt")).save_pretrained(directory)
+    model_config = transformers.BertConfig(
+        vocab_size=len(WORDS) + 33, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=128,
+    )
+    transformers.BertModel(model_config).save_pretrained(directory)
+    return directory
+
+@pytest.fixture
+def backend(tiny_model, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_MODEL", tiny_model)
+    monkeypatch.setattr(config, "ONNX_MODEL_DIR", str(tmp_path / "onnx"))
+    return lambda name: embedding_service.load_model(name)[0]
+
+def test_onnx_matches_torch_in_input_order(backend, monkeypatch):
+    expected = backend("torch").encode(SENTENCES, normalize_embeddings=True)
+    onnx = backend("onnx")
+
+    bucketed = onnx.encode(SENTENCES, batch_size=2, normalize_embeddings=True)
+    padded_bucketed = onnx.stats["padded_tokens"]
+    monkeypatch.setattr(config, "EMBEDDING_LENGTH_BUCKETING", False)
+    unsorted = onnx.encode(SENTENCES, batch_size=2, normalize_embeddings=True)
+
+    assert np.abs(bucketed - expected).max() < 1e-5
+    assert np.abs(unsorted - expected).max() < 1e-5
+    assert padded_bucketed < onnx.stats["padded_tokens"] - padded_bucketed
+
+def test_int8_stays_close_to_fp32(backend):
+    fp32 = backend("onnx").encode(SENTENCES, normalize_embeddings=True)
+    int8 = backend("onnx-int8").encode(SENTENCES, normalize_embeddings=True)
+
+    assert ((fp32 * int8).sum(axis=1) > 0.95).all()
+
+def test_export_is_reused(backend):
+    import onnx_encoder
+
+    backend("onnx")
+    with open(os.path.join(onnx_encoder.model_dir(), onnx_encoder.SETTINGS_FILE), encoding="utf-8") as f:
+        settings = json.load(f)
+    exported = os.path.getmtime(os.path.join(onnx_encoder.model_dir(), onnx_encoder.MODEL_FILE))
+    encoder = backend("onnx-int8")
+
+    assert settings["pooling"] == "mean" and settings["dimension"] == 32
+    assert os.path.getmtime(os.path.join(onnx_encoder.model_dir(), onnx_encoder.MODEL_FILE)) == exported
+    assert encoder.encode("a").shape == (32,)
+
+def test_each_backend_has_its_own_embedding_store(monkeypatch):
+    paths = set()
+    for backend_name in ("torch", "onnx", "onnx-int8"):
+        monkeypatch.setattr(config, "EMBEDDING_BACKEND", backend_name)
+        paths.add(default_path())
+
+    assert len(paths) == 3
@@ -0,0 +1,123 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import config
+import web_search
+from page_cache import PageCache
+
+PAGE = "<p>" + "A cached reference paragraph with plenty of words in it. " * 3 + "</p>"
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """Serves one page with an ETag and answers matching conditional requests with 304."""
+
+    requests = []
+    available = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests.append(self.headers.get("If-None-Match"))
+        if not self.available:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path / "pages.sqlite3"), ttl=60, search_ttl=60)
+    monkeypatch.setattr(web_search, "get_cache", lambda: cache)
+    return cache
+
+@pytest.fixture
+def etag_server(monkeypatch):
+    monkeypatch.setattr(config, "FETCH_RETRIES", 1)
+    ETagHandler.requests, ETagHandler.available = [], True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/article"
+    server.shutdown()
+
+def age(cache, url, seconds):
+    with cache._conn() as conn:
+        conn.execute("UPDATE pages SET fetched_at = fetched_at - ? WHERE url = ?", (seconds, url))
+
+def test_fresh_page_is_served_without_a_request(cache, etag_server):
+    first = web_search.extract_text_from_url(etag_server)
+    second = web_search.extract_text_from_url(etag_server)
+
+    assert first == second and "cached reference paragraph" in first
+    assert ETagHandler.requests == [None]
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 1
+
+def test_expired_page_is_revalidated_with_its_etag(cache, etag_server):
+    web_search.extract_text_from_url(etag_server)
+    age(cache, etag_server, 120)
+
+    kind, content, timing = web_search.fetch_page(etag_server)
+
+    assert (kind, timing["cache"]) == ("content", "revalidated")
+    assert "cached reference paragraph" in content
+    assert ETagHandler.requests == [None, '"v1"']
+    assert cache.is_fresh(cache.get_page(etag_server))  # 304 renews the entry
+
+def test_stale_copy_is_served_when_the_server_fails(cache, etag_server):
+    web_search.extract_text_from_url(etag_server)
+    age(cache, etag_server, 120)
+    ETagHandler.available = False
+
+    kind, content, timing = web_search.fetch_page(etag_server)
+
+    assert (kind, timing["cache"]) == ("content", "stale")
+    assert cache.stats["stale"] == 1
+
+def test_offline_mode_never_touches_the_network(cache, etag_server, monkeypatch):
+    monkeypatch.setattr(config, "PAGE_CACHE_OFFLINE", True)
+
+    assert web_search.fetch_page(etag_server)[0] is None
+    assert ETagHandler.requests == []
+
+def test_search_results_expire(cache):
+    cache.put_search("plagiarism", 5, ["a", "b"])
+
+    assert cache.get_search("plagiarism", 5) == ["a", "b"]
+    assert cache.get_search("plagiarism", 10) is None
+    with cache._conn() as conn:
+        conn.execute("UPDATE searches SET fetched_at = fetched_at - 120")
+    assert cache.get_search("plagiarism", 5) is None
+    assert cache.get_search("plagiarism", 5, allow_stale=True) == ["a", "b"]
+    assert cache.evict() == 0 and cache.get_search("plagiarism", 5, allow_stale=True) is None
+
+def test_least_recently_used_pages_are_evicted_first(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite3"), max_bytes=250)
+    for url in ("a", "b", "c"):
+        cache.put_page(url, "x" * 100)
+        time.sleep(0.01)
+    cache.get_page("a")  # Used again: now the most recent
+
+    assert cache.evict() == 1
+    assert cache.get_page("b") is None
+    assert cache.get_page("a") is not None and cache.get_page("c") is not None
+
+def test_counters_are_exact_under_concurrency(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite3"))
+    threads = [threading.Thread(target=lambda: [cache.count("hits") for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.stats["hits"] == 8000
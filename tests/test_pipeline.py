@@ -0,0 +1,105 @@
+import threading
+import time
+
+from pipeline import StageScheduler, StopDownstream
+
+def sleeper(seconds, result=None):
+    def stage(s):
+        time.sleep(seconds)
+        return result
+    return stage
+
+def test_independent_stages_overlap():
+    scheduler = StageScheduler(max_workers=4)
+    scheduler.add("file", sleeper(0.05))
+    scheduler.add("web", sleeper(0.3), deps=["file"])
+    scheduler.add("ai", sleeper(0.3), deps=["file"])
+    scheduler.add("report", lambda s: (s.results["web"], s.results["ai"]), deps=["web", "ai"])
+
+    start = time.perf_counter()
+    status = scheduler.run()
+
+    assert status == {"file": "done", "web": "done", "ai": "done", "report": "done"}
+    assert time.perf_counter() - start < 0.55  # Serial would take 0.65s
+    assert set(scheduler.timings) == set(status)
+
+def test_dependencies_finish_first():
+    order = []
+    lock = threading.Lock()
+    def stage(name):
+        def run(s):
+            with lock:
+                order.append(name)
+        return run
+    scheduler = StageScheduler()
+    for name, deps in (("c", ["a", "b"]), ("a", []), ("b", ["a"]), ("d", ["c"])):
+        scheduler.add(name, stage(name), deps)
+
+    scheduler.run()
+
+    assert order == ["a", "b", "c", "d"]
+
+def stop(s):
+    raise StopDownstream("no topics")
+
+def test_failed_or_stopped_stages_skip_their_dependents():
+    events = []
+    scheduler = StageScheduler(on_event=lambda stage, status, detail: events.append((stage, status)))
+    scheduler.add("file", lambda s: "ok")
+    scheduler.add("topics", stop, deps=["file"])
+    scheduler.add("web", lambda s: "never", deps=["topics"])
+    scheduler.add("ai", lambda s: 1 / 0, deps=["file"])
+    scheduler.add("removal", lambda s: "never", deps=["web", "ai"])
+
+    status = scheduler.run()
+
+    assert status == {"file": "done", "topics": "stopped", "web": "skipped", "ai": "failed", "removal": "skipped"}
+    assert scheduler.results["topics"] == "no topics"
+    assert isinstance(scheduler.results["ai"], ZeroDivisionError)
+    assert ("web", "started") not in events
+
+def test_channel_streams_items_while_the_producer_runs():
+    received = []
+    def producer(s):
+        pages = s.channel("pages")
+        for i in range(3):
+            pages.put(i)
+            time.sleep(0.05)
+        received.append("producer done")
+        pages.close()
+    def consumer(s):
+        for item in s.channel("pages"):
+            received.append(item)
+    scheduler = StageScheduler()
+    scheduler.add("web", producer)
+    scheduler.add("check", consumer)
+
+    scheduler.run()
+
+    assert received == [0, 1, 2, "producer done"]
+
+def test_progress_is_published_and_wait_for_blocks():
+    events = []
+    scheduler = StageScheduler(on_event=lambda stage, status, detail: events.append((stage, status, detail)))
+    scheduler.add("web", sleeper(0.1, "pages"))
+    scheduler.add("check", lambda s: (s.publish("check", 50), s.wait_for("web"))[1])
+
+    scheduler.run()
+
+    assert ("check", "progress", 50) in events
+    assert scheduler.results["check"] == "done"
+
+def test_cancel_stops_waiting_stages():
+    def web(s):
+        s.cancel.set()
+        return "partial"
+    scheduler = StageScheduler()
+    scheduler.add("web", web)
+    scheduler.add("check", lambda s: "never", deps=["web"])
+    scheduler.add("late", lambda s: list(s.channel("never-closed")))
+
+    status = scheduler.run()
+
+    assert status["web"] == "canceled"
+    assert status["check"] == "canceled"
+    assert status["late"] in ("canceled", "done")
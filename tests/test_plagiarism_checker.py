@@ -0,0 +1,92 @@
+import pytest
+import torch
+import plagiarism_checker
+from plagiarism_checker import check_plagiarism, semantic_similarity_matrix, top_k_semantic_matches
+
+DOCUMENT = "The quick brown fox jumps over the lazy dog. Completely original thoughts live here."
+REFERENCES = ["Intro text. The quick brown fox jumps over the lazy dog.", "Nothing related at all."]
+
+def test_similarity_matrix_matches_pairwise_cosines(fake_model):
+    originals = ["a b c", "d e", "a d"]
+    refs = ["a b", "e", "c d e", "f"]
+
+    matrix = semantic_similarity_matrix(originals, refs)
+
+    vectors = torch.from_numpy(fake_model.encode(originals + refs, normalize_embeddings=True))
+    for i in range(len(originals)):
+        for j in range(len(refs)):
+            assert matrix[i, j].item() == pytest.approx(torch.dot(vectors[i], vectors[len(originals) + j]).item(), abs=1e-6)
+
+def test_top_k_keeps_only_the_best_references_above_threshold():
+    matrix = torch.tensor([[0.9, 0.8, 0.1, 0.95], [0.2, 0.3, 0.1, 0.0]])
+
+    assert top_k_semantic_matches(matrix, 0.5) == [{0, 1, 3}, set()]
+    assert top_k_semantic_matches(matrix, 0.5, top_k=2) == [{0, 3}, set()]
+    assert top_k_semantic_matches(matrix, 0.5, top_k=10) == [{0, 1, 3}, set()]
+
+def test_references_are_encoded_once(fake_model, simple_sentences, monkeypatch):
+    calls = []
+    encode = plagiarism_checker.encode_sentences
+    monkeypatch.setattr(plagiarism_checker, "encode_sentences", lambda sentences: calls.append(len(sentences)) or encode(sentences))
+
+    check_plagiarism(DOCUMENT, REFERENCES)
+
+    assert calls == [2, 3]  # One batch of originals, one of all reference sentences
+
+def test_copied_sentence_is_reported_as_exact_match(fake_model, simple_sentences):
+    percentage, matches = check_plagiarism(DOCUMENT, REFERENCES)
+
+    assert percentage == 50
+    assert matches == [{
+        "original": "The quick brown fox jumps over the lazy dog.",
+        "match": "The quick brown fox jumps over the lazy dog.",
+        "method": "Exact Match",
+    }]
+
+def test_presplit_references_with_embeddings_skip_encoding(fake_model, simple_sentences):
+    sentences = ["Intro text.", "The quick brown fox jumps over the lazy dog."]
+    embeddings = fake_model.encode(sentences, normalize_embeddings=True)
+
+    assert check_plagiarism(DOCUMENT, [], reference_sentences=sentences, reference_embeddings=embeddings) == check_plagiarism(DOCUMENT, REFERENCES)
+
+def test_no_references():
+    assert plagiarism_checker.match_sentences(["A."], []) == [[]]
+    assert plagiarism_checker.plagiarism_percentage_of([]) == 0.0
+
+ORIGINALS = [
+    "students must cite every source they use",
+    "the library opens at nine",
+    "cite every source you use in the essay",
+    "weather was nice",
+    "nine sources were cited",
+]
+REFERENCE_SENTENCES = [
+    "every source must be cited by students",
+    "the library opens at nine in the morning",
+    "unrelated sentence about cooking",
+    "students cite every source they use",
+    "essays use sources",
+    "the weather was nice today",
+    "opening hours of the library",
+]
+
+def dense_paraphrase_hits(originals, refs, threshold):
+    """Baseline: one dense cosine matrix over the same fitted vocabulary."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    vectorizer = TfidfVectorizer().fit(originals + refs)
+    similarities = cosine_similarity(vectorizer.transform(originals), vectorizer.transform(refs))
+    return [{j for j, score in enumerate(row) if score > threshold} for row in similarities]
+
+@pytest.mark.parametrize("chunk_size, ref_chunk_size", [(512, 8192), (2, 3), (1, 1)])
+def test_sparse_paraphrase_blocks_match_the_dense_matrix(chunk_size, ref_chunk_size):
+    for threshold in (0.3, 0.5, 0.7):
+        expected = dense_paraphrase_hits(ORIGINALS, REFERENCE_SENTENCES, threshold)
+        actual = plagiarism_checker.paraphrase_matches(ORIGINALS, REFERENCE_SENTENCES, threshold, chunk_size, ref_chunk_size)
+
+        assert actual == expected
+    assert any(expected)
+
+def test_paraphrase_with_empty_vocabulary():
+    assert plagiarism_checker.paraphrase_matches(["!", "?"], ["."], 0.5) == [set(), set()]
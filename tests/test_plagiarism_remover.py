@@ -0,0 +1,43 @@
+import json
+
+import config
+import llm_client
+from plagiarism_remover import apply_rewrites, parse_batch_rewrites, rewrite_sentences
+
+TEXT = "Copied line. Own words here. Copied line."
+SPANS = [(0, 12), (13, 28), (29, 41)]
+
+def test_only_the_given_spans_are_replaced():
+    assert apply_rewrites(TEXT, SPANS, {2: "Rewritten line."}) == "Copied line. Own words here. Rewritten line."
+
+def test_several_replacements_keep_the_text_between_them():
+    text = "One.\n\nTwo.  Three."
+    spans = [(0, 4), (6, 10), (12, 18)]
+
+    assert apply_rewrites(text, spans, {0: "1.", 2: "3."}) == "1.\n\nTwo.  3."
+
+def test_no_replacements_returns_the_text():
+    assert apply_rewrites(TEXT, SPANS, {}) == TEXT
+
+def test_overlapping_spans_are_skipped():
+    assert apply_rewrites("abcdef", [(0, 4), (2, 6)], {0: "X", 1: "Y"}) == "Xef"
+
+def test_batch_rewrites_fallbacks():
+    assert parse_batch_rewrites('{"rewrites": ["a", " b "]}', 2) == ["a", "b"]
+    assert parse_batch_rewrites('{"rewrites": ["a", "", 3]}', 4) == ["a", None, None, None]
+    assert parse_batch_rewrites("not json", 1) == [None]
+
+def test_batched_rewrites_fall_back_per_sentence(monkeypatch):
+    monkeypatch.setattr(config, "LLM_CACHE_REWRITES", False)
+    prompts = []
+    def chat(prompt, **kwargs):
+        prompts.append(prompt)
+        if kwargs.get("response_format") == "json":
+            return json.dumps({"rewrites": ["First, reworded.", ""]})
+        return "Second, reworded."
+    monkeypatch.setattr(llm_client, "chat", chat)
+
+    rewrites = rewrite_sentences(["First.", "Second."], mode="batch", batch_size=5)
+
+    assert rewrites == ["First, reworded.", "Second, reworded."]
+    assert len(prompts) == 2
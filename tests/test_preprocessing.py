@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import config
+import preprocessing
+from preprocessing import document_sentences, document_spans, ensure_preprocessed, preprocess, preprocess_many
+
+TEXTS = [f"Essay {i} starts here. It cites 3 sources!  Does it end? Yes, on line {i}." for i in range(80)]
+
+class ThreadPool(ThreadPoolExecutor):
+    """In-process stand-in for the spawned tokenizer workers."""
+
+    def __init__(self, workers, mp_context=None):
+        super().__init__(workers)
+
+def test_spans_and_normalized_forms(simple_sentences):
+    result = preprocess("First one.  Second, in CAPITALS!")
+
+    assert result["sentences"] == ["First one.", "Second, in CAPITALS!"]
+    assert result["spans"] == [[0, 10], [12, 32]]
+    assert result["normalized"] == ["first one.", "second, in capitals!"]
+
+def test_pooled_results_match_serial_ones_in_order(simple_sentences, monkeypatch):
+    serial = preprocess_many(TEXTS, workers=1)
+    monkeypatch.setattr(preprocessing, "ProcessPoolExecutor", ThreadPool)
+    monkeypatch.setattr(config, "PREPROCESS_POOL_MIN", 10)
+
+    assert preprocess_many(TEXTS, workers=4) == serial
+
+def test_worker_processes_match_serial_results():
+    nltk = pytest.importorskip("nltk")
+    try:
+        nltk.data.find("tokenizers/punkt_tab")
+    except LookupError:
+        pytest.skip("NLTK punkt data is not installed")
+
+    assert preprocess_many(TEXTS, workers=2) == preprocess_many(TEXTS, workers=1)
+
+def test_only_missing_or_outdated_documents_are_segmented(simple_sentences, mongo, monkeypatch):
+    segmented = []
+    def counted(texts, workers=None):
+        texts = list(texts)
+        segmented.extend(texts)
+        return preprocess_many(texts, workers)
+    monkeypatch.setattr(preprocessing, "preprocess_many", counted)
+    current = {"_id": 1, "content": "Cached.", "preprocessed": preprocess("Cached.")}
+    outdated = {"_id": 2, "content": "Old cache.", "preprocessed": {**preprocess("Old cache."), "version": config.PREPROCESS_VERSION - 1}}
+    fresh = {"_id": 3, "content": "Never seen. Two sentences."}
+
+    ensure_preprocessed([current, outdated, fresh])
+
+    assert segmented == ["Old cache.", "Never seen. Two sentences."]
+    assert document_sentences(fresh) == ["Never seen.", "Two sentences."]
+    assert document_sentences(outdated, normalized=True) == ["old cache."]
+    assert document_spans(fresh) == [(0, 11), (12, 26)]
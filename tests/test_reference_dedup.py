@@ -0,0 +1,43 @@
+from reference_dedup import ReferenceDeduper
+
+def clean(*pages):
+    deduper = ReferenceDeduper(min_chars=10)
+    return [deduper.clean(url, text) for url, text in pages], deduper
+
+def test_navigation_and_consent_strings_are_dropped():
+    page = "\n".join([
+        "Skip to content",
+        "Accept all cookies",
+        "This website uses cookies to improve your experience.",
+        "A real paragraph about the history of printing presses in Europe.",
+        "© 2024 Example Media. All rights reserved.",
+        "Privacy Policy | Terms of Use | Contact Us",
+        "Share this article",
+        "Sign up",
+    ])
+    (cleaned,), deduper = clean(("https://a.example/1", page))
+
+    assert cleaned == "A real paragraph about the history of printing presses in Europe."
+    assert deduper.stats["boilerplate_paragraphs"] == 7
+
+def test_prose_mentioning_boilerplate_words_is_kept():
+    page = "\n".join([
+        "An article about advertising: how advertisement budgets moved online.",
+        "Students must sign up for the course before the deadline.",
+        "Subscribers to the newsletter got the cookie recipe first.",
+    ])
+    (cleaned,), _ = clean(("https://a.example/1", page))
+
+    assert cleaned == page
+
+def test_paragraphs_repeated_across_pages_are_dropped_and_logged():
+    footer = "Example Media is an independent publisher of science news."
+    (first, second), deduper = clean(
+        ("https://a.example/1", f"First article body about volcanoes and lava.\n{footer}"),
+        ("https://a.example/2", f"Second article body about glaciers and ice.\n{footer}"),
+    )
+
+    assert footer in first
+    assert second == "Second article body about glaciers and ice."
+    assert deduper.dropped == [{"url": "https://a.example/2", "reason": "repeated", "paragraph": footer}]
+    assert "dropped repeated paragraph from https://a.example/2" in deduper.report()
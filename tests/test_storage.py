@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+import config
+from storage import BulkWriter, pack_text, text_projection, unpack_text
+
+def test_large_text_is_stored_compressed(monkeypatch):
+    monkeypatch.setattr(config, "COMPRESS_MIN_BYTES", 100)
+    large = "A long reference page. " * 50
+
+    packed = pack_text(large)
+
+    assert set(packed) == {"content_z"} and len(packed["content_z"]) < len(large)
+    assert unpack_text(packed) == large
+    assert pack_text("short") == {"content": "short"}
+    assert unpack_text({"content": "short"}) == "short"
+    assert unpack_text({}) is None
+
+def test_projection_loads_both_forms():
+    assert text_projection("url") == {"url": 1, "content": 1, "content_z": 1, "_id": 0}
+
+class Recording:
+    """Collection wrapper counting bulk writes (round trips)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.batches = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append((len(operations), ordered))
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+def test_writes_are_sent_in_unordered_batches(mongo):
+    pages = Recording(mongo.websave)
+
+    with BulkWriter(pages, batch_size=4) as writer:
+        for i in range(10):
+            writer.insert({"url": f"https://example.com/{i}"})
+
+    assert pages.batches == [(4, False), (4, False), (2, False)]
+    assert mongo.websave.count_documents({}) == 10
+    assert writer.stats == {"operations": 10, "batches": 3, "errors": 0}
+
+def test_concurrent_writers_lose_nothing(mongo):
+    pages = Recording(mongo.websave)
+    writer = BulkWriter(pages, batch_size=7)
+    def insert(worker):
+        for i in range(50):
+            writer.insert({"worker": worker, "i": i})
+    threads = [threading.Thread(target=insert, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush()
+
+    assert mongo.websave.count_documents({}) == 200
+    assert sum(size for size, _ in pages.batches) == 200
+
+def test_failed_batch_is_reported_not_raised(mongo, capsys):
+    mongo.websave.create_index("url", unique=True)
+    writer = BulkWriter(mongo.websave)
+    writer.insert({"url": "a"})
+    writer.insert({"url": "a"})
+    writer.insert({"url": "b"})
+
+    writer.flush()
+
+    assert writer.stats["errors"] == 1
+    assert "Bulk write to websave failed" in capsys.readouterr().out
+
+def test_collections_create_the_client_lazily_and_share_it(monkeypatch):
+    pytest.importorskip("mongomock")
+    monkeypatch.setattr(config, "_client", None)
+    monkeypatch.setattr(config, "MONGO_URI", "mongomock://")
+
+    collection = config.get_collection("documents")
+    assert config._client is None
+
+    collection.insert_one({"content": "x"})
+    clients = set()
+    threads = [threading.Thread(target=lambda: clients.add(id(config.get_client()))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients == {id(config._client)}
+    assert config.get_db()["documents"].count_documents({}) == 1
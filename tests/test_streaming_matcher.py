@@ -0,0 +1,104 @@
+import pytest
+import plagiarism_checker
+from plagiarism_checker import StreamingMatcher, check_streaming
+
+def match(method, name):
+    return {"original": "s", "match": name, "method": method}
+
+EXACT, PARAPHRASE, SEMANTIC = "Exact Match", "Paraphrase Detection", "Deep Semantic Similarity"
+
+@pytest.fixture
+def no_embedding(monkeypatch):
+    """Fail loudly if a test reaches the embedding model."""
+    def embed_references(references):
+        raise AssertionError(f"embedded {references}")
+    monkeypatch.setattr(plagiarism_checker, "embed_references", embed_references)
+
+@pytest.fixture
+def fake_matching(monkeypatch):
+    """Match each original sentence against references by word overlap; records every call."""
+    calls = []
+
+    def embed_references(references):
+        return [text for _, text in references], None
+
+    def match_sentences(original_sentences, ref_sentences, reference_embeddings=None):
+        calls.append((list(original_sentences), list(ref_sentences)))
+        return [
+            [match(EXACT, ref) for ref in ref_sentences if set(sentence.split()) & set(ref.split())]
+            for sentence in original_sentences
+        ]
+
+    monkeypatch.setattr(plagiarism_checker, "embed_references", embed_references)
+    monkeypatch.setattr(plagiarism_checker, "match_sentences", match_sentences)
+    return calls
+
+def test_eviction_keeps_strongest_methods_in_arrival_order(no_embedding):
+    found = [match(SEMANTIC, "a"), match(PARAPHRASE, "b"), match(SEMANTIC, "c"), match(EXACT, "d")]
+    matcher = StreamingMatcher(["s"], max_matches=2, previous_matches=[found])
+
+    assert [m["match"] for m in matcher.sentence_matches()[0]] == ["b", "d"]
+    assert matcher.counts == [4]  # Evicted matches still count
+
+def test_ties_keep_the_earlier_match(no_embedding):
+    found = [match(SEMANTIC, name) for name in "abcd"]
+    matcher = StreamingMatcher(["s"], max_matches=2, previous_matches=[found])
+
+    assert [m["match"] for m in matcher.sentence_matches()[0]] == ["a", "b"]
+
+def test_stronger_late_match_replaces_the_latest_of_equal_rank(no_embedding):
+    matcher = StreamingMatcher(["s"], max_matches=2)
+    matcher._keep(0, [match(PARAPHRASE, "a"), match(PARAPHRASE, "b")])
+    matcher._keep(0, [match(EXACT, "c"), match(PARAPHRASE, "d")])
+
+    assert [m["match"] for m in matcher.sentence_matches()[0]] == ["a", "c"]
+
+def test_percentage_counts_every_pair_and_is_capped(no_embedding):
+    matcher = StreamingMatcher(["s", "t"], max_matches=1, previous_matches=[[match(EXACT, "a")] * 3, []])
+
+    assert matcher.percentage() == 100
+    assert StreamingMatcher(["s", "t"], previous_matches=[[match(EXACT, "a")], []]).percentage() == 50
+
+def test_no_references(no_embedding):
+    matcher = check_streaming(["one sentence", "another"], [])
+
+    assert matcher.references_seen == 0
+    assert matcher.percentage() == 0
+    assert matcher.sentence_matches() == [[], []]
+    assert matcher.add([]) == 0
+
+def test_no_sentences(no_embedding):
+    assert StreamingMatcher([]).percentage() == 0
+
+def test_batches_accumulate_and_report_progress(fake_matching):
+    progress = []
+    references = [("u1", "red apple"), ("u2", "green pear"), ("u3", "red pear")]
+    matcher = check_streaming(
+        ["red fruit", "blue sky"], references, batch_size=2,
+        on_progress=lambda percentage, seen: progress.append((percentage, seen)),
+    )
+
+    assert progress == [(50.0, 2), (100.0, 3)]
+    assert [m["match"] for m in matcher.sentence_matches()[0]] == ["red apple", "red pear"]
+    assert matcher.sentence_matches()[1] == []
+    assert len(fake_matching) == 2
+
+def test_reused_sentences_only_see_new_references(fake_matching):
+    known = plagiarism_checker.content_hash("red apple")
+    previous = [[match(EXACT, "red apple")], None]
+    matcher = StreamingMatcher(["red fruit", "green leaf"], previous_matches=previous, known_hashes=[known])
+    matcher.add([("u1", "red apple"), ("u2", "green red")])
+
+    # The changed sentence is matched against both references, the reused one only against the new
+    assert fake_matching == [(["green leaf"], ["red apple", "green red"]), (["red fruit"], ["green red"])]
+    assert [m["match"] for m in matcher.sentence_matches()[0]] == ["red apple", "green red"]
+
+def test_cancel_stops_before_the_next_batch(fake_matching):
+    import threading
+
+    cancel = threading.Event()
+    cancel.set()
+    matcher = check_streaming(["red"], [("u1", "red")], cancel=cancel)
+
+    assert matcher.references_seen == 0
+    assert fake_matching == []
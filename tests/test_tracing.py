@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import config
+import tracing
+
+@pytest.fixture
+def trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "TRACE_ENABLED", True)
+    monkeypatch.setattr(config, "TRACE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "round_trips", config.RoundTripCounter())
+    tracing.reset()
+    yield tmp_path
+    tracing.reset()
+
+def spans():
+    return [event for event in tracing._events if event["ph"] == "X"]
+
+def test_nothing_is_recorded_when_disabled(monkeypatch):
+    monkeypatch.setattr(config, "TRACE_ENABLED", False)
+    tracing.reset()
+
+    with tracing.span("work"):
+        tracing.count("items")
+
+    assert tracing._events == [] and tracing.counters() == {}
+    assert tracing.flush() is None
+
+@tracing.traced()
+def traced_function(fail=False):
+    time.sleep(0.01)
+    if fail:
+        raise KeyError("boom")
+
+def test_spans_record_duration_name_and_errors(trace):
+    with tracing.span("outer", cat="stage", document="d1") as outer:
+        traced_function()
+        outer.set(sentences=3)
+    with pytest.raises(KeyError):
+        traced_function(fail=True)
+
+    inner, outer_event, failed = spans()
+    assert inner["name"] == "test_tracing.traced_function" and inner["dur"] >= 10000
+    assert outer_event["args"] == {"document": "d1", "sentences": 3} and outer_event["dur"] >= inner["dur"]
+    assert failed["args"]["error"] == "KeyError"
+    assert tracing.summary()["test_tracing.traced_function"]["calls"] == 2
+
+def test_counters_accumulate_across_threads(trace):
+    threads = [threading.Thread(target=lambda: [tracing.count("pages") for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracing.count("pages", 0)
+
+    assert tracing.counters() == {"pages": 400}
+    assert "pages 400" in tracing.report()
+
+def test_spans_count_only_their_own_threads_round_trips(trace):
+    command = SimpleNamespace(command_name="find")
+    other_started = threading.Event()
+    finish = threading.Event()
+    def other_thread():
+        config.round_trips.started(command)
+        other_started.set()
+        finish.wait()
+        config.round_trips.started(command)
+
+    with tracing.span("stage"):
+        worker = threading.Thread(target=other_thread)
+        worker.start()
+        other_started.wait()
+        config.round_trips.started(command)
+        config.round_trips.started(command)
+        finish.set()
+        worker.join()
+
+    assert spans()[0]["args"]["db_round_trips"] == 2
+    assert config.round_trips.total() == 4
+
+def test_flushes_get_distinct_files_and_start_a_new_trace(trace):
+    paths = []
+    for document in ("doc", "doc"):
+        with tracing.span("check"):
+            pass
+        paths.append(tracing.flush(name=document))
+
+    assert len(set(paths)) == 2 and all(os.path.dirname(p) == str(trace) for p in paths)
+    with open(paths[0], encoding="utf-8") as f:
+        data = json.load(f)
+    assert [e["name"] for e in data["traceEvents"] if e["ph"] == "X"] == ["check"]
+    assert data["otherData"]["spans"]["check"]["calls"] == 1
+    assert tracing.flush() is None  # Nothing recorded since
+
+def test_profile_writes_folded_stacks(trace, monkeypatch):
+    monkeypatch.setattr(config, "TRACE_PROFILE", True)
+    monkeypatch.setattr(config, "TRACE_PROFILE_INTERVAL", 0.001)
+
+    with tracing.profile("match"):
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+    path = tracing.flush()
+
+    with open(os.path.splitext(path)[0] + ".folded", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.startswith("match;") for line in lines)
+    assert any("test_profile_writes_folded_stacks" in line for line in lines)
+
+def test_an_upload_is_one_span(trace, mongo, tmp_path):
+    import file_reader
+
+    path = tmp_path / "essay.txt"
+    path.write_text("An essay.", encoding="utf-8")
+    file_reader.process_file(str(path))
+
+    assert [event["name"] for event in spans()] == ["file_reader.process_file"]
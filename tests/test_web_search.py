@@ -0,0 +1,104 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import config
+import web_search
+from reference_dedup import ReferenceDeduper
+
+def test_results_are_released_in_search_order():
+    urls = ["a", "b", "c", "d"]
+    arrivals = [{"url": url} for url in ["c", "a", "d", "b"]]
+
+    released = [res["url"] for res in web_search.in_search_order(iter(arrivals), urls)]
+    assert released == urls
+
+def test_cleaning_does_not_depend_on_completion_order():
+    shared = "Shared navigation paragraph that appears on both of these pages."
+    pages = {
+        "https://a.example/1": f"{shared}\nFirst page prose about glaciers and their retreat over the decades.",
+        "https://b.example/2": f"{shared}\nSecond page prose about harbors and the ships that used them.",
+    }
+    urls = list(pages)
+
+    def cleaned(order):
+        deduper = ReferenceDeduper(min_chars=10)
+        results = ({"url": url, "content": pages[url]} for url in order)
+        return {res["url"]: deduper.clean(res["url"], res["content"]) for res in web_search.in_search_order(results, urls)}
+
+    assert cleaned(urls) == cleaned(urls[::-1])
+    assert shared in cleaned(urls[::-1])[urls[0]]
+
+def test_revision_gets_previous_references_once(mongo):
+    previous_id = mongo.documents.insert_one({"content": "v1"}).inserted_id
+    document_id = mongo.documents.insert_one({"content": "v2", "previous_id": previous_id}).inserted_id
+    mongo.websave.insert_many([
+        {"url": "https://a.example/1", "content": "page one", "document_id": previous_id},
+        {"url": "https://b.example/2", "content": "page two", "document_id": previous_id},
+    ])
+
+    pages = []
+    carried = web_search.carry_forward_references(document_id, pages.append)
+    again = web_search.carry_forward_references(document_id)
+
+    assert [page["content"] for page in pages] == ["page one", "page two"]
+    assert len(carried) == len(again) == 2
+    assert mongo.websave.count_documents({"document_id": document_id}) == 2
+    assert web_search.carry_forward_references(previous_id) == []
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the next status of `statuses` (then 200) or sleeps for `delay` seconds."""
+    statuses = []
+    delay = 0
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests += 1
+        time.sleep(self.delay)
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b"<p>A stub page with enough text to count as a reference.</p>"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setattr(config, "FETCH_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(config, "FETCH_RETRIES", 3)
+    StubHandler.statuses, StubHandler.delay, StubHandler.requests = [], 0, 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None  # The deadline test hangs up mid-response
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/page"
+    server.shutdown()
+
+def test_server_errors_are_retried(stub_server):
+    StubHandler.statuses = [503, 429]
+    html, timing = web_search.fetch_html(stub_server)
+
+    assert "stub page" in html
+    assert timing["attempts"] == 3
+
+def test_not_found_is_not_retried(stub_server):
+    StubHandler.statuses = [404]
+    html, timing = web_search.fetch_html(stub_server)
+
+    assert html is None
+    assert timing["attempts"] == 1
+    assert StubHandler.requests == 1
+
+def test_slow_server_stops_at_the_deadline(stub_server, monkeypatch):
+    monkeypatch.setattr(config, "FETCH_TIMEOUT", 5)
+    StubHandler.delay = 1
+    start = time.monotonic()
+    html, timing = web_search.fetch_html(stub_server, deadline=time.monotonic() + 0.3)
+
+    assert html is None
+    assert time.monotonic() - start < 1
+    assert timing["attempts"] == 1
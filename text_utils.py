@@ -0,0 +1,61 @@
+import hashlib
+import re
+import threading
+
+_punkt_ready = False
+_punkt_lock = threading.Lock()
+
+def ensure_punkt():
+    """Download the NLTK sentence tokenizer data once, on first use."""
+    global _punkt_ready
+    if _punkt_ready:
+        return
+    with _punkt_lock:
+        if _punkt_ready:
+            return
+        import nltk
+
+        for resource in ("punkt", "punkt_tab"):
+            try:
+                nltk.data.find(f"tokenizers/{resource}")
+            except LookupError:
+                nltk.download(resource, quiet=True)
+        _punkt_ready = True
+
+def sent_tokenize(text):
+    """Split text into sentences, fetching the tokenizer data if needed."""
+    ensure_punkt()
+    from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+    return nltk_sent_tokenize(text)
+
+def content_hash(text):
+    """Stable hash of the exact text (uploaded documents, embedded reference pages)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def preprocess_text(text):
+    """Lowercase, remove citations, and clean text."""
+    return re.sub(r"\d+", "", text.lower().strip())
+
+def locate_sentences(text, sentences):
+    """Character `(start, end)` of each sentence in `text`, searching left to right.
+
+    A sentence that cannot be found verbatim (e.g. after normalization) is
+    given the span following the previous one.
+    """
+    spans = []
+    cursor = 0
+    for sentence in sentences:
+        start = text.find(sentence, cursor)
+        if start < 0:
+            start = cursor
+            end = min(len(text), start + len(sentence))
+        else:
+            end = start + len(sentence)
+        spans.append((start, end))
+        cursor = end
+    return spans
+
+def sentence_spans(text):
+    """Sentences of `text` with their character offsets, as `(sentence, start, end)`."""
+    sentences = sent_tokenize(text)
+    return [(sentence, start, end) for sentence, (start, end) in zip(sentences, locate_sentences(text, sentences))]
@@ -0,0 +1,206 @@
+"""Spans, counters and an optional sampling profiler, written as a Chrome trace.
+
+With `config.TRACE_ENABLED` every `span` / `traced` call records a complete
+event (with the MongoDB round trips its thread made inside it) and `count`
+adds to a named counter. `flush()` writes everything recorded so far to
+`TRACE_DIR/trace-<time>-<pid>-[<name>-]<sequence>.json` in the Chrome
+trace-event format, viewable in chrome://tracing or ui.perfetto.dev. With `TRACE_PROFILE` the
+code under `profile()` is also sampled, and the stacks are written next to
+the trace in folded-stack format for flame graph tools.
+
+When tracing is off, spans and counters cost one attribute lookup.
+"""
+import contextlib
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import config
+
+_events = []
+_counters = Counter()
+_stacks = Counter()
+_threads = {}
+_lock = threading.Lock()
+_flushes = itertools.count(1)  # Keeps file names of flushes within one second apart
+
+def _now_us():
+    return round(time.perf_counter() * 1e6, 1)
+
+def _record(event):
+    thread = threading.current_thread()
+    event.setdefault("pid", os.getpid())
+    event.setdefault("tid", thread.ident)
+    with _lock:
+        _threads[thread.ident] = thread.name
+        _events.append(event)
+
+class _Span:
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **args):
+        """Attach extra arguments (e.g. sizes known only inside the span)."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self._round_trips = config.round_trips.thread_total()
+        self._start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        round_trips = config.round_trips.thread_total() - self._round_trips
+        if round_trips:
+            self.args["db_round_trips"] = round_trips
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _record({"name": self.name, "cat": self.cat, "ph": "X", "ts": self._start, "dur": round(end - self._start, 1), "args": self.args})
+        return False
+
+class _NoSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name, cat="function", **args):
+    """Context manager timing the enclosed block as one trace event."""
+    if not config.TRACE_ENABLED:
+        return _NO_SPAN
+    return _Span(name, cat, args)
+
+def traced(name=None, cat="function"):
+    """Decorator recording every call of a function as a span (named `module.function` by default)."""
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.TRACE_ENABLED:
+                return func(*args, **kwargs)
+            with _Span(label, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, value=1):
+    """Add `value` to a named counter (shown as a counter track in the trace)."""
+    if not config.TRACE_ENABLED or not value:
+        return
+    with _lock:
+        _counters[name] += value
+        total = _counters[name]
+    _record({"name": name, "ph": "C", "ts": _now_us(), "args": {name: total}})
+
+@contextlib.contextmanager
+def profile(name):
+    """Sample the calling thread's stack every TRACE_PROFILE_INTERVAL seconds while the block runs."""
+    if not (config.TRACE_ENABLED and config.TRACE_PROFILE):
+        yield
+        return
+
+    target = threading.get_ident()
+    stop = threading.Event()
+    stacks = Counter()
+
+    def sample():
+        while not stop.wait(config.TRACE_PROFILE_INTERVAL):
+            frame = sys._current_frames().get(target)
+            frames = []
+            while frame is not None:
+                frames.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)})")
+                frame = frame.f_back
+            if frames:
+                stacks[";".join([name] + frames[::-1])] += 1
+
+    sampler = threading.Thread(target=sample, name=f"profiler-{name}", daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        with _lock:
+            _stacks.update(stacks)
+
+def summary():
+    """Per-span totals recorded so far: `{name: {"calls", "total_s", "max_s"}}`, slowest first."""
+    with _lock:
+        events = [event for event in _events if event["ph"] == "X"]
+    totals = {}
+    for event in events:
+        entry = totals.setdefault(event["name"], {"calls": 0, "total_s": 0.0, "max_s": 0.0})
+        entry["calls"] += 1
+        entry["total_s"] += event["dur"] / 1e6
+        entry["max_s"] = max(entry["max_s"], event["dur"] / 1e6)
+    for entry in totals.values():
+        entry["total_s"] = round(entry["total_s"], 4)
+        entry["max_s"] = round(entry["max_s"], 4)
+    return dict(sorted(totals.items(), key=lambda item: -item[1]["total_s"]))
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def report(limit=5):
+    """One-line summary of the slowest spans and the counters."""
+    spans = ", ".join(f"{name} {entry['total_s']:.2f}s/{entry['calls']}" for name, entry in list(summary().items())[:limit])
+    counted = ", ".join(f"{name} {value}" for name, value in sorted(counters().items()))
+    return f"Trace: {spans or 'no spans'} | {counted or 'no counters'}"
+
+def reset():
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _stacks.clear()
+
+def flush(path=None, name=None):
+    """Write the recorded trace (and profile, if any) and start a new one; returns the trace path or None.
+
+    Without a `path` the file name holds the time, process id, `name` (e.g.
+    a document id) and a per-process sequence number.
+    """
+    if not config.TRACE_ENABLED:
+        return None
+    totals = summary()
+    with _lock:
+        events = list(_events)
+        counted = dict(_counters)
+        stacks = dict(_stacks)
+        threads = dict(_threads)
+    if not events and not stacks:
+        return None
+
+    if path is None:
+        os.makedirs(config.TRACE_DIR, exist_ok=True)
+        label = f"{name}-" if name else ""
+        path = os.path.join(config.TRACE_DIR, f"trace-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{label}{next(_flushes)}.json")
+    pid = os.getpid()
+    metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"plagremover {pid}"}}]
+    metadata += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+    trace = {
+        "traceEvents": metadata + events,
+        "displayTimeUnit": "ms",
+        "otherData": {"counters": counted, "spans": totals, "db_round_trips": dict(config.round_trips.counts)},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace, f)
+    if stacks:
+        with open(os.path.splitext(path)[0] + ".folded", "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {samples}\n" for stack, samples in sorted(stacks.items()))
+    reset()
+    return path
@@ -1,15 +1,21 @@
-from pymongo import MongoClient
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from googlesearch import search
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+from datetime import datetime
+import threading
 import random
 import time
+import config
+import tracing
+from page_cache import get_cache
+from storage import BulkWriter, pack_text, unpack_text
+from reference_dedup import ReferenceDeduper, dedupe_urls, normalize_url
 
-# Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["plagir"]
-websave_collection = db["websave"]  # Collection for scraped data
-key_topics_collection = db["web_results"]  # Collection for key topics
+websave_collection = config.get_collection("websave")  # Collection for scraped data
+key_topics_collection = config.get_collection("web_results")  # Collection for key topics
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36",
@@ -17,66 +23,412 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 ]
 
-def fetch_key_topics():
-    """Fetch the latest key topics from MongoDB."""
-    latest_entry = key_topics_collection.find_one(sort=[("_id", -1)])
+def fetch_key_topics(document_id=None):
+    """Fetch the key topics of the given (or latest) document from MongoDB."""
+    query = {"document_id": config.resolve_document_id(document_id)}
+    latest_entry = key_topics_collection.find_one(query, sort=[("_id", -1)])
     return latest_entry["topics"] if latest_entry else []
 
+@tracing.traced(cat="web")
 def search_web(query, num_results=5):
-    """Search Google and return webpage URLs."""
+    """Search Google and return webpage URLs (cached per query)."""
+    cache = get_cache()
+    if cache is not None:
+        urls = cache.get_search(query, num_results, allow_stale=config.PAGE_CACHE_OFFLINE)
+        tracing.count("search_cache_hits" if urls is not None else "search_cache_misses")
+        if urls is not None or config.PAGE_CACHE_OFFLINE:
+            return urls or []
+
     try:
-        return list(search(query, num_results=num_results))
+        urls = list(search(query, num_results=num_results))
     except Exception as e:
         print(f"⚠️ Google Search Error: {e}")
         return []
 
-def extract_text_from_url(url):
-    """Extract main content from a webpage with retries."""
-    headers = {"User-Agent": random.choice(USER_AGENTS)}
+    if cache is not None and urls:
+        cache.put_search(query, num_results, urls)
+    return urls
 
-    for attempt in range(3):  # Retry up to 3 times
-        try:
-            response = requests.get(url, headers=headers, timeout=10, verify=False)
-            response.raise_for_status()  
-            
-            soup = BeautifulSoup(response.text, "html.parser")
-            paragraphs = soup.find_all("p")
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+
+def get_session():
+    """Shared HTTP session whose connection pools are reused across fetch workers."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.FETCH_POOL_HOSTS, pool_maxsize=config.FETCH_PER_HOST_LIMIT)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
 
-            content = "\n".join(p.get_text() for p in paragraphs if p.get_text())
+def _host_semaphore(url):
+    host = urlsplit(url).netloc.lower()
+    with _session_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(config.FETCH_PER_HOST_LIMIT)
+        return _host_limits[host]
 
-            if len(content) > 100:
-                return content  
-            else:
-                print(f"⚠️ Skipped {url} (Insufficient content)")
-                return None
+def backoff_delay(attempt, base=None, cap=None):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    base = config.FETCH_BACKOFF_BASE if base is None else base
+    cap = config.FETCH_BACKOFF_CAP if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
 
+def is_retryable(error):
+    """Connection errors, timeouts, 429 and 5xx answers may succeed later; other failures (e.g. 404) will not."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is not None and (status == 429 or status >= 500)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def fetch_html(url, deadline=None, retries=None, etag=None, last_modified=None):
+    """Download a page, retrying with backoff until it succeeds, retries run out or the deadline passes.
+
+    Only failures that `is_retryable` are retried.
+
+    Returns `(html, timing)`; `html` is None on failure and `timing` holds the
+    attempt count, download seconds, HTTP status, the response validators and
+    the last error. Passing `etag` / `last_modified` makes the request
+    conditional; a 304 answer returns None with `timing["status"] == 304`.
+    """
+    retries = config.FETCH_RETRIES if retries is None else retries
+    headers = {"User-Agent": random.choice(USER_AGENTS)}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    timing = {"attempts": 0, "fetch_seconds": 0.0, "status": None, "error": None}
+    start = time.perf_counter()
+
+    for attempt in range(retries):
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            timing["error"] = "deadline exceeded"
+            break
+        timing["attempts"] += 1
+        try:
+            with _host_semaphore(url):
+                timeout = config.FETCH_TIMEOUT if remaining is None else min(config.FETCH_TIMEOUT, remaining)
+                response = get_session().get(url, headers=headers, timeout=timeout, verify=False)
+            timing["status"] = response.status_code
+            response.raise_for_status()
+            timing["fetch_seconds"] = round(time.perf_counter() - start, 3)
+            if response.status_code == 304:
+                return None, timing
+            timing["etag"] = response.headers.get("ETag")
+            timing["last_modified"] = response.headers.get("Last-Modified")
+            return response.text, timing
         except requests.exceptions.RequestException as e:
+            timing["error"] = str(e)
             print(f"⚠️ Attempt {attempt+1} failed for {url}: {e}")
-            time.sleep(2)  
+            if not is_retryable(e):
+                break
+            if attempt + 1 < retries:
+                delay = backoff_delay(attempt)
+                if deadline is not None:
+                    delay = min(delay, max(0, deadline - time.monotonic()))
+                time.sleep(delay)
+
+    timing["fetch_seconds"] = round(time.perf_counter() - start, 3)
+    return None, timing
+
+@tracing.traced(cat="web")
+def parse_paragraphs(html):
+    """Extract paragraph text from an HTML page (CPU-bound; runs off the I/O workers)."""
+    soup = BeautifulSoup(html, "html.parser")
+    paragraphs = soup.find_all("p")
+    return "\n".join(p.get_text() for p in paragraphs if p.get_text())
+
+@tracing.traced(cat="web")
+def fetch_page(url, deadline=None):
+    """Return a page from the cache when fresh (or unchanged on the server), else download it.
+
+    Returns `(kind, payload, timing)` where kind is "content" (cached
+    paragraph text), "html" (a fresh download still to be parsed) or None on
+    failure; `timing["cache"]` records hit / revalidated / stale / miss. A
+    stale cached copy is served when the download fails.
+    """
+    cache = get_cache()
+    entry = cache.get_page(url) if cache is not None else None
+
+    if entry is not None and (cache.is_fresh(entry) or config.PAGE_CACHE_OFFLINE):
+        cache.count("hits")
+        tracing.count("page_cache_hits")
+        return "content", entry["content"], {"cache": "hit", "attempts": 0, "fetch_seconds": 0.0}
+    if cache is not None and config.PAGE_CACHE_OFFLINE:
+        return None, None, {"cache": "miss", "error": "offline cache miss"}
+
+    validators = {}
+    if entry is not None:
+        validators = {"etag": entry["etag"], "last_modified": entry["last_modified"]}
+    html, timing = fetch_html(url, deadline, **validators)
+
+    if entry is not None and timing.get("status") == 304:
+        cache.touch(url)
+        cache.count("revalidated")
+        tracing.count("page_cache_revalidated")
+        timing["cache"] = "revalidated"
+        return "content", entry["content"], timing
+
+    if entry is not None and html is None:
+        # The server is unreachable: a stale copy beats no reference at all
+        cache.count("stale")
+        tracing.count("page_cache_stale")
+        timing["cache"] = "stale"
+        return "content", entry["content"], timing
+
+    if cache is not None:
+        cache.count("misses")
+        tracing.count("page_cache_misses")
+    timing["cache"] = "miss" if cache is not None else "off"
+    return ("html" if html is not None else None), html, timing
+
+def store_page(url, content, timing):
+    """Remember freshly extracted page text and its validators in the cache."""
+    cache = get_cache()
+    if cache is not None:
+        cache.put_page(url, content, timing.get("etag"), timing.get("last_modified"))
+
+@tracing.traced(cat="web")
+def extract_text_from_url(url):
+    """Extract main content from a webpage with retries."""
+    kind, payload, timing = fetch_page(url)
+    if kind is None:
+        print(f"❌ Giving up on {url} after multiple failures")
+        return None
 
-    print(f"❌ Giving up on {url} after multiple failures")
+    if kind == "html":
+        content = parse_paragraphs(payload)
+        store_page(url, content, timing)
+    else:
+        content = payload
+    if len(content) > 100:
+        return content
+    print(f"⚠️ Skipped {url} (Insufficient content)")
     return None
 
-def fetch_and_store_web_results():
-    """Fetch key topics, search the web, extract content, and store results in `websave`."""
-    topics = fetch_key_topics()
+def fetch_pages(urls, max_workers=None, parse_workers=None, deadline_seconds=None, cancel=None):
+    """Download and extract many pages concurrently, yielding results as they finish.
+
+    Downloads run on a bounded thread pool (with per-host limits and pooled
+    connections); HTML parsing is handed to a separate pool so slow parses
+    never hold a download slot. Each yielded dict has `url`, `content` (None
+    when skipped or failed) and per-URL `timing`. Work still pending at the
+    overall deadline (or when the `cancel` event is set) is abandoned.
+    """
+    urls = list(dict.fromkeys(urls))
+    max_workers = max_workers or config.FETCH_WORKERS
+    parse_workers = config.FETCH_PARSE_WORKERS if parse_workers is None else parse_workers
+    deadline_seconds = deadline_seconds or config.FETCH_DEADLINE
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+
+    parse_pool = ProcessPoolExecutor(parse_workers) if parse_workers else ThreadPoolExecutor(1)
+    fetch_pool = ThreadPoolExecutor(max_workers)
+    try:
+        fetches = {fetch_pool.submit(fetch_page, url, deadline): url for url in urls}
+        parses = {}
+        pending = set(fetches)
+
+        while pending:
+            if cancel is not None and cancel.is_set():
+                break
+            timeout = 0.5 if deadline is None else max(0, min(0.5, deadline - time.monotonic()))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break  # Deadline reached
+                continue
+
+            for future in done:
+                if future in fetches:
+                    url = fetches[future]
+                    kind, payload, timing = future.result()
+                    if kind is None:
+                        yield {"url": url, "content": None, "timing": timing}
+                        continue
+                    if kind == "html":
+                        parse_future = parse_pool.submit(parse_paragraphs, payload)
+                        parses[parse_future] = (url, timing, time.perf_counter())
+                        pending.add(parse_future)
+                        continue
+                    content = payload
+                else:
+                    url, timing, parse_start = parses.pop(future)
+                    content = future.result()
+                    timing["parse_seconds"] = round(time.perf_counter() - parse_start, 3)
+                    store_page(url, content, timing)
+
+                if len(content) <= 100:
+                    print(f"⚠️ Skipped {url} (Insufficient content)")
+                    content = None
+                yield {"url": url, "content": content, "timing": timing}
+
+        for future in pending:
+            future.cancel()
+            url = fetches.get(future) or parses.get(future, (None,))[0]
+            yield {"url": url, "content": None, "timing": {"error": "canceled" if cancel is not None and cancel.is_set() else "deadline exceeded"}}
+    finally:
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+
+def in_search_order(results, urls):
+    """Re-yield fetch results in the order of `urls`, each as soon as every earlier URL has finished.
+
+    Cleaning judges a page against the pages kept before it, so releasing
+    them by search rank instead of download completion makes the stored
+    reference text the same on every run.
+    """
+    rank = {url: i for i, url in enumerate(urls)}
+    waiting = {}
+    unknown = []
+    next_rank = 0
+    for res in results:
+        if res["url"] not in rank:
+            unknown.append(res)
+            continue
+        waiting[rank[res["url"]]] = res
+        while next_rank in waiting:
+            yield waiting.pop(next_rank)
+            next_rank += 1
+    for i in sorted(waiting):
+        yield waiting[i]
+    yield from unknown
+
+def search_topics(topics, max_workers=None):
+    """Run the web searches for all topics concurrently; returns {topic: [urls]}."""
+    max_workers = max_workers or config.SEARCH_WORKERS
+    with ThreadPoolExecutor(max_workers) as pool:
+        return dict(zip(topics, pool.map(search_web, topics)))
+
+def summarize_timings(results):
+    """Short per-URL timing report for the console."""
+    lines = []
+    for res in sorted(results, key=lambda r: -r["timing"].get("fetch_seconds", 0)):
+        timing = res["timing"]
+        status = "ok" if res["content"] else (timing.get("error") or "skipped")
+        lines.append(
+            f"  {timing.get('fetch_seconds', 0):6.2f}s fetch  {timing.get('parse_seconds', 0):5.2f}s parse  "
+            f"{timing.get('attempts', 0)}x  {timing.get('cache', '-'):<11} {status}  {res['url']}"
+        )
+    return "\n".join(lines)
+
+def carry_forward_references(document_id, on_page=None):
+    """Copy the stored references of the previous version of a document to it; returns the copied rows.
+
+    A revision is then compared with the same reference text as the version
+    before it, so the previous results can be reused (see `incremental`)
+    instead of drifting with what a new search and cleaning run returns.
+    """
+    document = config.get_collection("documents").find_one({"_id": document_id}, {"previous_id": 1})
+    previous_id = document.get("previous_id") if document else None
+    if previous_id is None:
+        return []
+
+    # A repeated run for the same document finds the rows it carried over before
+    rows = list(websave_collection.find({"document_id": document_id, "carried_from": previous_id}, {"_id": 0}))
+    if not rows:
+        rows = list(websave_collection.find({"document_id": previous_id}, {"_id": 0}))
+        for row in rows:
+            row.update(document_id=document_id, carried_from=previous_id, created_at=datetime.utcnow())
+        if rows:
+            websave_collection.insert_many([dict(row) for row in rows])
+            print(f"♻️ Carried {len(rows)} references over from the previous version")
+    if on_page is not None:
+        for row in rows:
+            on_page({"url": row.get("url", ""), "content": unpack_text(row)})
+    return rows
+
+def fetch_and_store_web_results(document_id=None, on_page=None, cancel=None):
+    """Fetch key topics, search the web, extract content, and store results in `websave`.
+
+    URLs found under several topics (or differing only in form) are fetched
+    and stored once; duplicate and near-duplicate pages are dropped and
+    boilerplate paragraphs stripped (config.REFERENCE_DEDUP). Pages are
+    cleaned and stored in search order as soon as the pages ranked above
+    them have finished; `on_page` is called with each stored
+    `{"url", "content"}` record so a consumer can start working before the
+    fetch ends. Setting the `cancel` event stops the run early. With
+    `config.INCREMENTAL_RECHECK` the previous version's references are
+    carried over first and their URLs are not fetched again.
+    """
+    document_id = config.resolve_document_id(document_id)
+    carried = carry_forward_references(document_id, on_page) if config.INCREMENTAL_RECHECK else []
+    carried_urls = {row.get("url", "") for row in carried}
+    local_stored = 0
+    if config.REFERENCE_SOURCE in ("local", "both"):
+        import local_corpus
+
+        message, local_stored = local_corpus.store_local_references(document_id, on_page, cancel, skip_urls=carried_urls)
+        print(message)
+        if config.REFERENCE_SOURCE == "local":
+            return message if local_stored or not carried else "✅ References carried over from the previous version."
+
+    topics = fetch_key_topics(document_id)
     
     if not topics:
-        return "⚠️ No key topics found in the database."
+        return "✅ References carried over from the previous version." if carried else "⚠️ No key topics found in the database."
 
     print("🔍 Searching the web for:", topics)
-    web_data = []
-
-    for topic in topics:
-        urls = search_web(topic)
-        
-        for url in urls:
-            content = extract_text_from_url(url)
-            if content:
-                web_data.append({"topic": topic, "url": url, "content": content})
-
-    if web_data:
-        websave_collection.insert_many(web_data)  
+    start = time.perf_counter()
+    urls_by_topic = search_topics(topics)
+    search_seconds = time.perf_counter() - start
+
+    # A URL found under several topics is downloaded, stored and compared once
+    if config.REFERENCE_DEDUP:
+        topics_by_url = dedupe_urls(urls_by_topic)
+        deduper = ReferenceDeduper()
+        for row in carried:
+            deduper.keep(row.get("url", ""), unpack_text(row) or "")
+        carried_keys = {normalize_url(url) for url in carried_urls}
+        topics_by_url = {url: topics for url, topics in topics_by_url.items() if normalize_url(url) not in carried_keys}
+    else:
+        topics_by_url = {}
+        for topic, urls in urls_by_topic.items():
+            for url in urls:
+                if url not in carried_urls:
+                    topics_by_url.setdefault(url, []).append(topic)
+        deduper = None
+
+    results = []
+    stored = 0
+    # Page rows are buffered into unordered bulk writes; the stream consumer gets each page once
+    # all higher-ranked pages are done, so dedup does not depend on which download finishes first
+    with BulkWriter(websave_collection) as writer:
+        for res in in_search_order(fetch_pages(topics_by_url, cancel=cancel), list(topics_by_url)):
+            results.append(res)
+            if not res["content"]:
+                continue
+            text = deduper.clean(res["url"], res["content"]) if deduper is not None else res["content"]
+            if text is None:
+                continue
+            topics_of_url = topics_by_url[res["url"]]
+            writer.insert({
+                "topic": topics_of_url[0],
+                "topics": topics_of_url,
+                "url": res["url"],
+                **pack_text(text),
+                "document_id": document_id,
+                "created_at": datetime.utcnow(),
+            })
+            stored += 1
+            if on_page is not None:
+                on_page({"url": res["url"], "content": text})
+
+    cache = get_cache()
+    if cache is not None:
+        cache.evict()
+        print(f"🗃️ Page cache: {cache.stats}")
+    if deduper is not None:
+        print(deduper.report())
+    print(f"⏱️ Search {search_seconds:.2f}s, fetch {time.perf_counter() - start - search_seconds:.2f}s for {len(results)} URLs")
+    print(summarize_timings(results))
+
+    if cancel is not None and cancel.is_set():
+        return "❌ Web search canceled."
+    if stored or local_stored or carried:
         return "✅ Web search results stored in MongoDB (websave collection)."
     
     return "⚠️ No relevant content found."
\ No newline at end of file